@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Novita.settings')
 
 application = get_asgi_application()
+
+# Imported once the apps are loaded
+from support.asgi import live_events  # noqa: E402
+
+# Ticket event streams are answered before Django's handler, which would keep a thread per stream
+application = live_events(application)
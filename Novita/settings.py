@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,7 +44,8 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'user.middleware.CachedAuthenticationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,15 +73,208 @@ WSGI_APPLICATION = 'Novita.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Pick with NOVITA_DATABASE: 'sqlite' (db.sqlite3) or 'postgresql' (set up by
+# the NOVITA_DB_* variables). NOVITA_DATABASE_REPLICAS lists read replicas,
+# comma-separated: SQLite files, or PostgreSQL host[:port]s.
+DATABASE_ENGINE = os.environ.get('NOVITA_DATABASE', 'sqlite')
+
+# Seconds a connection is kept for the next request (0 closes it after each
+# one). Health checks replace kept connections that have gone away.
+DATABASE_CONN_MAX_AGE = int(os.environ.get('NOVITA_CONN_MAX_AGE', 60))
+
+if DATABASE_ENGINE == 'postgresql':
+    # NOVITA_DB_POOL=1 gives each process a pool of connections instead
+    # (needs psycopg[pool], and rules out CONN_MAX_AGE)
+    DATABASE_POOL = os.environ.get('NOVITA_DB_POOL') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('NOVITA_DB_NAME', 'novita'),
+            'USER': os.environ.get('NOVITA_DB_USER', 'novita'),
+            'PASSWORD': os.environ.get('NOVITA_DB_PASSWORD', ''),
+            'HOST': os.environ.get('NOVITA_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('NOVITA_DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DATABASE_POOL else DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {'min_size': 2, 'max_size': int(os.environ.get('NOVITA_DB_POOL_SIZE', 10))},
+            } if DATABASE_POOL else {},
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Writers take the write lock when their transaction starts and
+                # wait up to `timeout` seconds for it, instead of failing with
+                # "database is locked" when a read lock can't be upgraded later.
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    }
+
+for number, location in enumerate(filter(None, os.environ.get('NOVITA_DATABASE_REPLICAS', '').split(',')), 1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if DATABASE_ENGINE == 'postgresql':
+        host, _, port = location.strip().partition(':')
+        replica.update(HOST=host, PORT=port or replica['PORT'])
+    else:
+        replica['NAME'] = location.strip()
+    DATABASES[f'replica{number}'] = replica
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# Apps whose reads go to a replica for signed-in users too (anonymous
+# visitors read everything from replicas)
+REPLICA_READ_APPS = ('blog', 'core')
+
+# Seconds a visitor reads from the primary after a request of theirs writes;
+# keep it above the replicas' usual lag
+REPLICA_STICKY_SECONDS = 15
+
+# Seconds a replica that failed to connect is left out
+REPLICA_RETRY_SECONDS = 30
+
+# Set on every new SQLite connection (see core.sqlite). WAL lets readers carry
+# on while a write is in progress; synchronous=normal is still crash-safe
+# under WAL. cache_size is in KiB when negative, mmap_size in bytes.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'memory',
 }
 
 
+# Caches
+# Pick with NOVITA_CACHE_BACKEND: 'locmem' (per process), 'file' (shared by
+# workers on one host) or 'redis' (any Redis-compatible server).
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'novita',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('NOVITA_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('NOVITA_CACHE_BACKEND', 'locmem')],
+}
+
+# Wake-ups for live pages (see core.pubsub). Pick with NOVITA_PUBSUB_BACKEND:
+# 'local' reaches this process only; use 'redis' with more than one worker.
+PUBSUB_BACKEND = os.environ.get('NOVITA_PUBSUB_BACKEND', 'local')
+PUBSUB_REDIS_URL = os.environ.get('NOVITA_REDIS_URL', 'redis://127.0.0.1:6379/1')
+
+# Sessions
+# Pick with NOVITA_SESSION_ENGINE: 'cached_db' (read from the cache, written
+# through to the database) or 'signed_cookies' (kept in the visitor's cookie).
+# Schedule `manage.py clear_expired_sessions` to delete expired stored ones.
+SESSION_ENGINES = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('NOVITA_SESSION_ENGINE', 'cached_db')]
+
+# Messages go in their own cookie, so flashing one never writes the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Seconds a signed-in user's row is cached between requests (see user.sessions)
+AUTH_USER_CACHE_TIMEOUT = 300
+
+# Anonymous blog pages are cached for this many seconds (signals invalidate
+# them sooner when posts, comments or categories change)
+BLOG_CACHE_ALIAS = 'default'
+BLOG_PAGE_CACHE_TIMEOUT = 300
+
+
+# Blog view counting
+# Views are buffered and flushed as one UPDATE per post. Use 'cache' to share
+# the buffer between workers and run `manage.py flush_view_counts --loop`.
+BLOG_VIEW_COUNT_BUFFER = 'local'
+BLOG_VIEW_COUNT_FLUSH_INTERVAL = 10  # seconds, 0 writes every view through
+BLOG_VIEW_COUNT_MAX_PENDING = 500
+
+# Spread like count updates over this many shard rows per post (0 updates
+# BlogPost.likes_count directly). Shards are folded in by the counter flusher.
+BLOG_LIKE_COUNTER_SHARDS = 0
+
+# Seconds the counter write queue (core.writes) gathers counter changes before
+# writing them in one transaction; 0 writes each one in its request. Around
+# 0.05 keeps bursts of likes off the SQLite write lock in production.
+COUNTER_WRITE_DELAY = 0
+
+# Blog search returns at most this many ranked matches
+BLOG_SEARCH_MAX_RESULTS = 1000
+
+# Comment threads shown per page on a post, and how deep replies nest
+BLOG_COMMENT_THREADS_PER_PAGE = 20
+BLOG_COMMENT_MAX_DEPTH = 3
+
+# Featured image renditions: widths to generate, and worker threads that make
+# them after upload (0 makes them on the saving thread)
+BLOG_IMAGE_RENDITION_WIDTHS = (320, 640, 1200)
+BLOG_IMAGE_WORKERS = 2
+
+# Support attachment downloads are streamed by Django unless a front proxy
+# takes over after the permission check: 'x-sendfile' or 'x-accel-redirect'
+# (nginx, with an internal location at SUPPORT_ATTACHMENT_ACCEL_PREFIX that
+# aliases MEDIA_ROOT)
+SUPPORT_ATTACHMENT_SENDFILE = None
+SUPPORT_ATTACHMENT_ACCEL_PREFIX = '/protected/'
+
+# Chunked attachment uploads: partial files live outside MEDIA_ROOT until
+# complete, and unfinished or unattached uploads expire (see
+# `manage.py clear_stale_uploads`). New attachments are type-sniffed by
+# SUPPORT_SCAN_WORKERS threads (0 scans on the request thread), and by
+# SUPPORT_ATTACHMENT_SCANNER too if set: a dotted path to a callable that
+# takes the open file and returns False to reject it, e.g. a ClamAV client
+SUPPORT_UPLOAD_TEMP_DIR = BASE_DIR / 'tmp' / 'uploads'
+SUPPORT_UPLOAD_CHUNK_SIZE = 1024 * 1024
+SUPPORT_UPLOAD_EXPIRY_HOURS = 24
+SUPPORT_SCAN_WORKERS = 2
+SUPPORT_ATTACHMENT_SCANNER = None
+
+# Staff triage: hours until each priority's SLA deadline (emergency/crisis
+# tickets count as critical), and how many tickets the queue shows
+SUPPORT_SLA_HOURS = {'critical': 1, 'high': 4, 'medium': 24, 'low': 72}
+SUPPORT_TRIAGE_QUEUE_SIZE = 25
+
+# Ticket search returns at most this many ranked matches
+SUPPORT_SEARCH_MAX_RESULTS = 1000
+
+# Live ticket updates (see support.live): seconds before a stream ends and the
+# browser reconnects, and between keepalive comments on an idle one. Serve
+# them from an ASGI worker (Novita.asgi answers them without a thread per
+# stream); under WSGI each open stream holds a thread.
+SUPPORT_LIVE_STREAM_SECONDS = 300
+SUPPORT_LIVE_KEEPALIVE_SECONDS = 20
+
+# Check-ins read and written per chunk by recovery data exports
+RECOVERY_EXPORT_CHUNK_SIZE = 2000
+
+# Seconds a user's dashboard numbers are cached; their own writes clear them sooner
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# Seconds to reuse the "N posts" / "N tickets" totals shown beside paginated lists
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -145,8 +340,15 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded files (featured images, support attachments and CKEditor uploads)
+# are stored once per content under MEDIA_ROOT/blobs/ (see core.storage).
+# `manage.py collect_blobs` deletes the ones nothing has referenced for
+# BLOB_GC_GRACE_HOURS, which must outlast an editing session
+BLOB_GC_GRACE_HOURS = 24
+
 # CKEditor Configuration
-CKEDITOR_UPLOAD_PATH = 'uploads/'
+CKEDITOR_UPLOAD_PATH = 'blobs/'
+CKEDITOR_STORAGE_BACKEND = 'core.storage.EditorBlobStorage'
 CKEDITOR_IMAGE_BACKEND = "pillow"
 CKEDITOR_JQUERY_URL = 'https://ajax.googleapis.com/ajax/libs/jquery/2.2.4/jquery.min.js'
 
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import BlogPost, Category, Comment, PostLike
+from .counters import refresh_comments_count
+from .models import BlogPost, Category, Comment, PostLike, PostLikeShard
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -34,12 +35,12 @@ class BlogPostAdmin(admin.ModelAdmin):
             'classes': ['collapse']
         }),
         ('Statistics', {
-            'fields': ('views_count', 'likes_count'),
+            'fields': ('views_count', 'likes_count', 'comments_count', 'word_count', 'reading_time'),
             'classes': ['collapse'],
         }),
     )
     
-    readonly_fields = ['views_count', 'likes_count']
+    readonly_fields = ['views_count', 'likes_count', 'comments_count', 'word_count', 'reading_time']
     
     def save_model(self, request, obj, form, change):
         if not change:  # If creating new post
@@ -63,6 +64,23 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ['is_approved', 'created_at']
     search_fields = ['author__email', 'post__title', 'content']
     ordering = ['-created_at']
+    actions = ['approve_comments', 'unapprove_comments']
+    
+    def _set_approved(self, queryset, approved):
+        post_ids = set(queryset.values_list('post_id', flat=True))
+        updated = queryset.update(is_approved=approved)
+        refresh_comments_count(post_ids)
+        return updated
+    
+    @admin.action(description='Approve selected comments')
+    def approve_comments(self, request, queryset):
+        updated = self._set_approved(queryset, True)
+        self.message_user(request, f'{updated} comments approved.')
+    
+    @admin.action(description='Unapprove selected comments')
+    def unapprove_comments(self, request, queryset):
+        updated = self._set_approved(queryset, False)
+        self.message_user(request, f'{updated} comments unapproved.')
     
     def content_preview(self, obj):
         return obj.content[:50] + "..." if len(obj.content) > 50 else obj.content
@@ -74,3 +92,8 @@ class PostLikeAdmin(admin.ModelAdmin):
     list_filter = ['created_at']
     search_fields = ['user__email', 'post__title']
     ordering = ['-created_at']
+
+@admin.register(PostLikeShard)
+class PostLikeShardAdmin(admin.ModelAdmin):
+    list_display = ['post', 'shard', 'delta']
+    readonly_fields = ['post', 'shard', 'delta']
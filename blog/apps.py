@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        from core import blobs
+
+        from . import signals  # noqa: F401
+        from .models import BlogPost
+
+        blobs.track(BlogPost, files=['featured_image'], html=['content'])
@@ -0,0 +1,155 @@
+"""
+Page caching for the public blog pages.
+
+Anonymous GET requests for the decorated views are served from the cache.
+Cache keys embed version numbers for the data each page shows: ``posts`` for
+anything listing posts across the site and ``category:<slug>`` for a single
+category. The ``BlogPost``, ``Comment`` and ``Category`` signals in
+``blog.signals`` bump those versions, which retires every page built from the
+old data without having to find and delete the keys.
+
+Async views are wrapped too; their cache lookup runs in a worker thread.
+Hits and misses are counted in the cache; ``manage.py cache_stats`` shows
+them.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+VERSION_PREFIX = 'blog:version:'
+PAGE_PREFIX = 'blog:page:'
+METRICS_PREFIX = 'blog:metrics:'
+METRICS = ('hit', 'miss', 'bypass')
+
+
+def page_cache():
+    return caches[getattr(settings, 'BLOG_CACHE_ALIAS', 'default')]
+
+
+def page_timeout():
+    return getattr(settings, 'BLOG_PAGE_CACHE_TIMEOUT', 300)
+
+
+def _new_version():
+    # Time-based, so a version evicted from the cache never repeats an old one
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    cache = page_cache()
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*scopes):
+    """Invalidate every cached page that depends on any of ``scopes``"""
+    cache = page_cache()
+    for scope in scopes:
+        key = VERSION_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), timeout=None)
+
+
+def record(event):
+    cache = page_cache()
+    key = METRICS_PREFIX + event
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def get_stats():
+    cache = page_cache()
+    values = cache.get_many([METRICS_PREFIX + event for event in METRICS])
+    return {event: values.get(METRICS_PREFIX + event, 0) for event in METRICS}
+
+
+def reset_stats():
+    page_cache().delete_many([METRICS_PREFIX + event for event in METRICS])
+
+
+def is_cacheable(request):
+    """Only anonymous requests without a session or pending messages are shared"""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    return not (
+        settings.SESSION_COOKIE_NAME in request.COOKIES or
+        'messages' in request.COOKIES
+    )
+
+
+def page_key(request, scopes):
+    versions = '.'.join(str(version) for version in get_versions(scopes))
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'{PAGE_PREFIX}{versions}:{path}'
+
+
+def cache_public_page(*scopes):
+    """Serve anonymous requests for a view from the cache.
+
+    ``scopes`` name the data the page shows and may use the view's keyword
+    arguments, e.g. ``'category:{slug}'``.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                key, response = await sync_to_async(lookup, thread_sensitive=False)(request, scopes, kwargs)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    if key:
+                        await sync_to_async(store, thread_sensitive=False)(request, key, response)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key, response = lookup(request, scopes, kwargs)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if key:
+                    store(request, key, response)
+            return response
+        return wrapper
+    return decorator
+
+
+def lookup(request, scopes, kwargs):
+    """Return ``(key, cached response)``; the key is ``None`` for requests that bypass the cache"""
+    if not is_cacheable(request):
+        record('bypass')
+        return None, None
+
+    key = page_key(request, [scope.format(**kwargs) for scope in scopes])
+    cached = page_cache().get(key)
+    if cached is None:
+        record('miss')
+        return key, None
+    record('hit')
+    content, content_type = cached
+    return key, HttpResponse(content, content_type=content_type)
+
+
+def store(request, key, response):
+    # Pages that issued a CSRF token or set cookies are per-visitor
+    shareable = not (
+        response.cookies or
+        request.META.get('CSRF_COOKIE_NEEDS_UPDATE') or
+        response.streaming
+    )
+    if response.status_code == 200 and shareable:
+        page_cache().set(key, (response.content, response['Content-Type']), page_timeout())
@@ -0,0 +1,108 @@
+"""
+Threaded comment loading for the blog detail page.
+
+Top-level comments are paginated newest first with an opaque cursor. A page
+of threads, with every approved reply in them and their authors, is loaded in
+one query and assembled into a tree in a single pass. Replies nested deeper
+than ``BLOG_COMMENT_MAX_DEPTH`` are shown at the deepest level instead of
+being dropped.
+"""
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db.models import Q
+
+from core.aio import alist
+from core.pagination import decode_cursor, encode_cursor
+
+from .models import Comment
+
+
+def threads_per_page():
+    return getattr(settings, 'BLOG_COMMENT_THREADS_PER_PAGE', 20)
+
+
+def max_depth():
+    return getattr(settings, 'BLOG_COMMENT_MAX_DEPTH', 3)
+
+
+@dataclass
+class CommentPage:
+    threads: list = field(default_factory=list)
+    next_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def build_tree(comments, depth_limit):
+    """Attach approved comments to their parents in one pass.
+
+    ``comments`` must be ordered oldest first. Each comment gets ``children``
+    and ``depth`` attributes; the top-level comments are returned.
+    """
+    depth_limit = max(1, depth_limit)
+    by_id = {}
+    roots = []
+    for comment in comments:
+        comment.children = []
+        by_id[comment.pk] = comment
+        if comment.parent_id is None:
+            comment.depth = 0
+            roots.append(comment)
+            continue
+        parent = by_id.get(comment.parent_id)
+        if parent is None:
+            # The parent is unapproved, so the reply is hidden with it
+            continue
+        if parent.depth >= depth_limit:
+            parent = parent.parent_node
+        comment.depth = parent.depth + 1
+        comment.parent_node = parent
+        parent.children.append(comment)
+    return roots
+
+
+def comment_page_queryset(post, cursor=None, limit=None):
+    """The approved comments in one page of ``post``'s threads, oldest first.
+
+    The page holds one thread more than ``limit`` to tell whether there is a
+    next page.
+    """
+    limit = limit or threads_per_page()
+
+    threads = Comment.objects.filter(post=post, parent=None, is_approved=True)
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        _, created_at, pk = position
+        threads = threads.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    thread_ids = threads.order_by('-created_at', '-pk').values('pk')[:limit + 1]
+
+    return Comment.objects.filter(
+        Q(pk__in=thread_ids) | Q(thread__in=thread_ids),
+        post=post,
+        is_approved=True,
+    ).select_related('author').order_by('created_at', 'pk')
+
+
+def load_comment_page(post, cursor=None, limit=None):
+    """Load one page of approved comment threads for ``post``"""
+    limit = limit or threads_per_page()
+    return build_page(comment_page_queryset(post, cursor, limit), limit)
+
+
+async def aload_comment_page(post, cursor=None, limit=None):
+    limit = limit or threads_per_page()
+    return build_page(await alist(comment_page_queryset(post, cursor, limit)), limit)
+
+
+def build_page(comments, limit):
+    roots = build_tree(comments, max_depth())
+    roots.sort(key=lambda comment: (comment.created_at, comment.pk), reverse=True)
+
+    page = CommentPage(threads=roots[:limit])
+    if len(roots) > limit:
+        last = page.threads[-1]
+        page.next_cursor = encode_cursor(last.created_at, last.pk)
+    return page
@@ -0,0 +1,285 @@
+"""
+Buffered view counting for blog posts.
+
+Page views are recorded in a cheap buffer instead of writing to the
+``BlogPost`` row on every request. The buffer is flushed periodically as one
+``F()``-based UPDATE per post, so concurrent requests never lose increments
+and the detail page stays a read.
+
+Two buffers are available, selected with ``BLOG_VIEW_COUNT_BUFFER``:
+
+* ``'local'`` keeps pending hits in process memory. Each worker runs its own
+  background flusher thread, which also folds sharded like counters.
+* ``'cache'`` keeps pending hits in the Django cache so several workers share
+  one buffer. Run ``manage.py flush_view_counts --loop`` as the flusher.
+
+At most ``BLOG_VIEW_COUNT_FLUSH_INTERVAL`` seconds or
+``BLOG_VIEW_COUNT_MAX_PENDING`` hits are lost if a worker crashes. Setting the
+interval to ``0`` writes every hit through immediately.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+
+def _flush_interval():
+    return getattr(settings, 'BLOG_VIEW_COUNT_FLUSH_INTERVAL', 10)
+
+
+def _max_pending():
+    return getattr(settings, 'BLOG_VIEW_COUNT_MAX_PENDING', 500)
+
+
+def apply_view_counts(counts):
+    """Write pending view counts to the database, one UPDATE per post"""
+    from .models import BlogPost
+
+    with transaction.atomic():
+        for post_id, hits in sorted(counts.items()):
+            if hits:
+                BlogPost.objects.filter(pk=post_id).update(
+                    views_count=F('views_count') + hits
+                )
+
+
+def refresh_comments_count(post_ids, using='default'):
+    """Recount approved comments for the given posts in one UPDATE"""
+    from .models import BlogPost, Comment
+
+    approved = Comment.objects.filter(
+        post=OuterRef('pk'), is_approved=True
+    ).order_by().values('post').annotate(total=Count('pk')).values('total')
+    return BlogPost.objects.using(using).filter(pk__in=post_ids).update(
+        comments_count=Coalesce(Subquery(approved), Value(0))
+    )
+
+
+class LocalViewBuffer:
+    """In-process buffer of pending view counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._total = 0
+
+    def record(self, post_id):
+        """Record a hit and return how many hits the loaded row is missing"""
+        with self._lock:
+            self._pending[post_id] += 1
+            self._total += 1
+            pending = self._pending[post_id]
+            overflow = self._total >= _max_pending()
+        if overflow or not _flush_interval():
+            self.flush()
+            return 1
+        return pending
+
+    def pending(self, post_id):
+        with self._lock:
+            return self._pending.get(post_id, 0)
+
+    def drain(self):
+        with self._lock:
+            counts, self._pending, self._total = self._pending, Counter(), 0
+        return counts
+
+    def restore(self, counts):
+        with self._lock:
+            self._pending.update(counts)
+            self._total += sum(counts.values())
+
+    def flush(self):
+        """Flush pending hits and return the number of posts updated"""
+        counts = self.drain()
+        if not counts:
+            return 0
+        try:
+            apply_view_counts(counts)
+        except Exception:
+            # Keep the hits for the next flush rather than dropping them
+            self.restore(counts)
+            raise
+        return len(counts)
+
+
+class CacheViewBuffer:
+    """Buffer of pending view counts shared between workers through the cache.
+
+    Every post has a hit counter. The first hit after a flush also sets the
+    post's dirty marker with ``cache.add``, which only one worker can win,
+    and the winner appends the post to a log of numbered slots. A flush
+    takes the log's new slots, clears those posts' markers before reading
+    their counters, and subtracts what it wrote. Hits that arrive meanwhile
+    set the marker again and are written by the next flush. Only one flush
+    runs at a time.
+    """
+
+    key_prefix = 'blog:views:'
+    index_key = 'blog:views:index'
+    state_key = 'blog:views:flushed'
+    lock_key = 'blog:views:flushing'
+    # Seconds a flush may hold the lock, and waits for a numbered slot whose
+    # post id hasn't been written yet
+    lock_timeout = 60
+    slot_grace = 60
+
+    def _key(self, post_id):
+        return f'{self.key_prefix}{post_id}'
+
+    def _marker_key(self, post_id):
+        return f'{self.key_prefix}dirty:{post_id}'
+
+    def _slot_key(self, number):
+        return f'{self.key_prefix}slot:{number}'
+
+    def _incr(self, key):
+        if cache.add(key, 1, timeout=None):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Evicted in between
+            cache.add(key, 0, timeout=None)
+            return cache.incr(key)
+
+    def _mark(self, post_id):
+        if cache.add(self._marker_key(post_id), 1, timeout=None):
+            cache.set(self._slot_key(self._incr(self.index_key)), post_id, timeout=None)
+
+    def record(self, post_id):
+        pending = self._incr(self._key(post_id))
+        # After the counter, so a flush that clears the marker sees this hit
+        self._mark(post_id)
+        if not _flush_interval():
+            self.flush()
+            return 1
+        return pending
+
+    def pending(self, post_id):
+        return cache.get(self._key(post_id), 0)
+
+    def flush(self):
+        if not cache.add(self.lock_key, 1, timeout=self.lock_timeout):
+            # Another worker is flushing; what is left goes next time
+            return 0
+        try:
+            return self._flush()
+        finally:
+            cache.delete(self.lock_key)
+
+    def _flush(self):
+        now = time.time()
+        state = cache.get(self.state_key) or {'position': 0, 'waiting': {}}
+        end = cache.get(self.index_key, 0)
+        numbers = [*state['waiting'], *range(state['position'] + 1, end + 1)]
+        slots = cache.get_many([self._slot_key(number) for number in numbers])
+        # Numbered but not written yet: look again until the grace runs out
+        waiting = {
+            number: state['waiting'].get(number, now)
+            for number in numbers
+            if self._slot_key(number) not in slots and now - state['waiting'].get(number, now) < self.slot_grace
+        }
+        post_ids = set(slots.values())
+        cache.delete_many([*slots, *(self._marker_key(post_id) for post_id in post_ids)])
+        cache.set(self.state_key, {'position': max(end, state['position']), 'waiting': waiting}, timeout=None)
+        if not post_ids:
+            return 0
+
+        keys = {self._key(post_id): post_id for post_id in post_ids}
+        counts = {keys[key]: hits for key, hits in cache.get_many(keys).items() if hits}
+        try:
+            apply_view_counts(counts)
+        except Exception:
+            # The hits are still counted: mark the posts for the next flush
+            for post_id in counts:
+                self._mark(post_id)
+            raise
+
+        # Subtract what was written instead of deleting the keys, so hits
+        # recorded while the UPDATE ran are kept for the next flush.
+        for post_id, hits in counts.items():
+            try:
+                cache.decr(self._key(post_id), hits)
+            except ValueError:
+                pass
+        return len(counts)
+
+
+class CounterFlusher(threading.Thread):
+    """Daemon thread that runs the counter flush tasks every ``interval`` seconds"""
+
+    def __init__(self, tasks, interval):
+        super().__init__(name='blog-counter-flusher', daemon=True)
+        self.tasks = tasks
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        for task in self.tasks:
+            try:
+                task()
+            except Exception:
+                logger.exception('Blog counter flush task %r failed', task)
+        close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+
+
+BUFFERS = {
+    'local': LocalViewBuffer,
+    'cache': CacheViewBuffer,
+}
+
+_buffer = None
+_flusher = None
+_setup_lock = threading.Lock()
+
+
+def get_view_buffer():
+    """Return the configured view buffer, starting the flusher on first use"""
+    global _buffer, _flusher
+    if _buffer is not None:
+        return _buffer
+    with _setup_lock:
+        if _buffer is None:
+            backend = getattr(settings, 'BLOG_VIEW_COUNT_BUFFER', 'local')
+            buffer = BUFFERS[backend]()
+            interval = _flush_interval()
+            if backend == 'local' and interval:
+                tasks = [buffer.flush]
+                if getattr(settings, 'BLOG_LIKE_COUNTER_SHARDS', 0):
+                    from .likes import fold_like_shards
+                    tasks.append(fold_like_shards)
+                _flusher = CounterFlusher(tasks, interval)
+                _flusher.start()
+                atexit.register(_flusher.flush)
+            _buffer = buffer
+    return _buffer
+
+
+def record_view(post):
+    """Record a view of ``post`` and update its in-memory count for display"""
+    post.views_count += get_view_buffer().record(post.pk)
+    return post.views_count
+
+
+async def arecord_view(post):
+    # Flushing can write to the database
+    return await sync_to_async(record_view)(post)
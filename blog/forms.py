@@ -109,8 +109,20 @@ class BlogSearchForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-control'})
     )
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, categories=None, **kwargs):
         super().__init__(*args, **kwargs)
+        if categories is not None:
+            # Choices from categories the view already loaded, so neither
+            # validating nor rendering the form queries (for async views)
+            by_pk = {str(category.pk): category for category in categories}
+            field = self.fields['category']
+            self.fields['category'] = forms.TypedChoiceField(
+                choices=[('', field.empty_label), *((pk, category.name) for pk, category in by_pk.items())],
+                coerce=by_pk.__getitem__,
+                empty_value=None,
+                required=False,
+                widget=field.widget,
+            )
         self.helper = FormHelper()
         self.helper.form_method = 'GET'
         self.helper.layout = Layout(
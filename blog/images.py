@@ -0,0 +1,189 @@
+"""
+Featured image renditions.
+
+Saving a post with a new featured image queues it for processing instead of
+decoding it on the request thread; saves that leave the image alone do no
+image work at all. A small thread pool (``BLOG_IMAGE_WORKERS``) caps the
+original at 1200x600 as before and writes a WebP and a JPEG (PNG for
+transparent images) copy at each width in ``BLOG_IMAGE_RENDITION_WIDTHS``.
+
+Rendition names embed a hash of the source image, so a URL always serves the
+same bytes. They are recorded on ``BlogPost.image_renditions``; until then
+templates show the original. ``BLOG_IMAGE_WORKERS = 0`` processes images on
+the calling thread. ``manage.py generate_renditions`` backfills existing posts.
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core import blobs
+
+from .cache import bump_versions
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'blog/renditions'
+MAX_SIZE = (1200, 600)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', {'optimize': True}),
+}
+
+
+def rendition_widths():
+    return sorted(getattr(settings, 'BLOG_IMAGE_RENDITION_WIDTHS', (320, 640, 1200)))
+
+
+def worker_count():
+    return getattr(settings, 'BLOG_IMAGE_WORKERS', 2)
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def encode(image, fmt):
+    pil_format, options = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, pil_format, **options)
+    return output.getvalue()
+
+
+def cap_original(field, image):
+    """Shrink an oversized original, as uploads always have been.
+
+    Stored files are content-addressed, so the smaller copy is a new file:
+    returns the image and the name to store on the post.
+    """
+    if image.width <= MAX_SIZE[0] and image.height <= MAX_SIZE[1]:
+        return image, field.name
+    pil_format = image.format
+    image = image.copy()
+    image.thumbnail(MAX_SIZE)
+    output = BytesIO()
+    image.save(output, pil_format)
+    return image, field.storage.save(field.name, ContentFile(output.getvalue()))
+
+
+def render(field):
+    """Write every rendition of an image field.
+
+    Returns their descriptions and the name of the (possibly shrunk) original.
+    """
+    with field.storage.open(field.name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    # Renditions are derived files with their own clean-up, outside the blob store
+    storage = default_storage
+
+    image = Image.open(BytesIO(data))
+    image.load()
+    image, original = cap_original(field, image)
+    image = ImageOps.exif_transpose(image)
+    fallback = 'png' if has_alpha(image) else 'jpeg'
+
+    # Never upscale: widths past the source collapse into one at its own width
+    widths = sorted({min(width, image.width) for width in rendition_widths()})
+    renditions = []
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt in ('webp', fallback):
+            name = f'{RENDITION_DIR}/{digest}-{width}.{fmt}'
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(encode(resized, fmt)))
+            renditions.append({'width': width, 'format': fmt, 'name': name})
+    return renditions, original
+
+
+def rendition_digest(name):
+    return os.path.basename(name).split('-')[0]
+
+
+def discard_renditions(renditions, exclude_pk=None):
+    """Delete rendition files no other post still uses"""
+    from .models import BlogPost
+
+    if not renditions:
+        return
+    storage = default_storage
+    others = BlogPost.objects.exclude(pk=exclude_pk)
+    for digest in {rendition_digest(rendition['name']) for rendition in renditions}:
+        # The same picture uploaded to two posts shares its renditions
+        if others.filter(image_renditions__icontains=digest).exists():
+            continue
+        for rendition in renditions:
+            if rendition_digest(rendition['name']) == digest:
+                storage.delete(rendition['name'])
+
+
+def process_image(post_id, name):
+    """Render ``name`` for the post and record the result, unless it was replaced"""
+    from .models import BlogPost
+
+    try:
+        post = BlogPost.objects.select_related('category').only(
+            'featured_image', 'category__slug'
+        ).get(pk=post_id)
+        if post.featured_image.name != name:
+            return
+        renditions, original = render(post.featured_image)
+        updated = BlogPost.objects.filter(pk=post_id, featured_image=name).update(
+            featured_image=original,
+            image_renditions=renditions,
+            # Moves the card fragment cache keys on to markup with renditions
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            discard_renditions(renditions, exclude_pk=post_id)
+            return
+        if original != name:
+            post.featured_image.name = original
+            blobs.sync_references([post], ['featured_image'])
+        bump_versions('posts', f'category:{post.category.slug}')
+    except BlogPost.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception('Could not create renditions of %s for post %s', name, post_id)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=worker_count(), thread_name_prefix='blog-images')
+    return _executor
+
+
+def _process_in_worker(post_id, name):
+    try:
+        process_image(post_id, name)
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(post):
+    """Queue the post's featured image for processing once the save commits"""
+    name = post.featured_image.name
+    if not worker_count():
+        process_image(post.pk, name)
+        return
+    transaction.on_commit(lambda: get_executor().submit(_process_in_worker, post.pk, name))
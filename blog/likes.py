@@ -0,0 +1,116 @@
+"""
+Like toggling for blog posts.
+
+``PostLike`` rows are the source of truth. ``BlogPost.likes_count`` is kept in
+step with SQL-side ``F()`` updates so concurrent likes never overwrite each
+other; those updates go through the counter write queue (``core.writes``).
+With ``BLOG_LIKE_COUNTER_SHARDS`` set above zero, changes go to one of
+that many ``PostLikeShard`` rows instead, so a burst of likes on one post
+does not queue on a single row. The shards are folded into ``likes_count`` by
+the counter flusher and by ``manage.py reconcile_like_counts --shards``.
+"""
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from core import writes
+
+from .models import BlogPost, PostLike, PostLikeShard
+
+
+def _shard_count():
+    return getattr(settings, 'BLOG_LIKE_COUNTER_SHARDS', 0)
+
+
+def _add_to_shard(post_id, delta):
+    shard = random.randrange(_shard_count())
+    shards = PostLikeShard.objects.filter(post_id=post_id, shard=shard)
+    if shards.update(delta=F('delta') + delta):
+        return
+    try:
+        with transaction.atomic():
+            PostLikeShard.objects.create(post_id=post_id, shard=shard, delta=delta)
+    except IntegrityError:
+        # Another request created the shard first
+        shards.update(delta=F('delta') + delta)
+
+
+def adjust_like_count(post_id, delta):
+    """Add ``delta`` to a post's like count without reading it first"""
+    if _shard_count():
+        _add_to_shard(post_id, delta)
+    else:
+        # Written by the counter write queue (inline when COUNTER_WRITE_DELAY is 0)
+        writes.increment(BlogPost, post_id, likes_count=delta)
+
+
+def current_like_count(post_id):
+    """Return a post's like count including changes not yet folded in"""
+    likes_count = BlogPost.objects.filter(pk=post_id).values_list('likes_count', flat=True).first() or 0
+    likes_count += writes.pending(BlogPost, post_id, 'likes_count')
+    if _shard_count():
+        pending = PostLikeShard.objects.filter(post_id=post_id).aggregate(total=Sum('delta'))['total']
+        likes_count += pending or 0
+    return likes_count
+
+
+def toggle_like(post, user):
+    """Like or unlike ``post`` for ``user`` and return ``(liked, likes_count)``"""
+    with transaction.atomic():
+        deleted, _ = PostLike.objects.filter(post=post, user=user).delete()
+        if deleted:
+            liked = False
+            adjust_like_count(post.pk, -1)
+        else:
+            try:
+                with transaction.atomic():
+                    PostLike.objects.create(post=post, user=user)
+            except IntegrityError:
+                # A concurrent request from the same user already liked it
+                liked = True
+            else:
+                liked = True
+                adjust_like_count(post.pk, 1)
+    return liked, current_like_count(post.pk)
+
+
+def fold_like_shards():
+    """Move pending shard deltas into ``BlogPost.likes_count``.
+
+    Each shard is decremented by the amount that was read rather than reset,
+    so likes recorded while folding are kept for the next run. Returns the
+    number of posts updated.
+    """
+    with transaction.atomic():
+        shards = list(
+            PostLikeShard.objects.exclude(delta=0).values_list('id', 'post_id', 'delta')
+        )
+        totals = {}
+        for shard_id, post_id, delta in shards:
+            PostLikeShard.objects.filter(pk=shard_id).update(delta=F('delta') - delta)
+            totals[post_id] = totals.get(post_id, 0) + delta
+        for post_id, delta in totals.items():
+            if delta:
+                BlogPost.objects.filter(pk=post_id).update(likes_count=F('likes_count') + delta)
+    return len(totals)
+
+
+def rebuild_like_counts():
+    """Recount ``likes_count`` for every post from ``PostLike`` in one UPDATE
+
+    Increments this process still has queued are written first; the recount
+    already includes them, and written after it they would count twice.
+    """
+    writes.queue.flush()
+    like_totals = PostLike.objects.filter(
+        post=OuterRef('pk')
+    ).order_by().values('post').annotate(total=Count('pk')).values('total')
+
+    with transaction.atomic():
+        PostLikeShard.objects.all().delete()
+        return BlogPost.objects.update(
+            likes_count=Coalesce(Subquery(like_totals), Value(0))
+        )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+
+from blog.models import BlogPost
+from core.benchmark import benchmark_database, create_posts, measure
+from core.pagination import CursorPaginator, encode_cursor
+
+
+class Command(BaseCommand):
+    help = 'Compare offset and keyset pagination of the blog list on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20000, help='Number of posts to create')
+        parser.add_argument('--per-page', type=int, default=6, help='Posts per page')
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 100, 500, 2000],
+                            help='Page numbers to measure')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+
+    def handle(self, *args, **options):
+        per_page = options['per_page']
+        with benchmark_database():
+            self.stdout.write(f'Creating {options["posts"]} posts...')
+            create_posts(options['posts'])
+            posts = BlogPost.objects.filter(status='published').select_related(
+                'author', 'category'
+            ).defer('content')
+
+            self.stdout.write(f'{"page":>6}{"offset":>12}{"keyset":>12}')
+            for number in options['pages']:
+                if (number - 1) * per_page >= options['posts']:
+                    continue
+
+                def offset_page():
+                    # What Paginator costs per request: COUNT(*), OFFSET page, and the total count
+                    page = Paginator(posts, per_page).get_page(number)
+                    return list(page), posts.count()
+
+                cursor = None
+                if number > 1:
+                    previous = posts.order_by('-created_at', '-pk')[(number - 1) * per_page - 1]
+                    cursor = encode_cursor(previous.created_at, previous.pk)
+
+                def keyset_page():
+                    return list(CursorPaginator(posts, per_page).page(cursor))
+
+                offset = measure(offset_page, options['repeat'])
+                keyset = measure(keyset_page, options['repeat'])
+                self.stdout.write(f'{number:>6}{offset * 1000:>10.2f}ms{keyset * 1000:>10.2f}ms')
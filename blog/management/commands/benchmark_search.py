@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from blog.models import BlogPost
+from blog.search import rebuild_index, search_posts
+from core.benchmark import benchmark_database, create_posts, measure
+
+QUERIES = ('recovery', 'gratitude journey', 'mindful breathe calm', 'naloxone')
+
+
+class Command(BaseCommand):
+    help = 'Compare full-text search against the icontains scan on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                            help='Numbers of posts to benchmark with')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            created = 0
+            for size in sorted(options['sizes']):
+                self.stdout.write(f'Creating {size - created} more posts...')
+                create_posts(size - created, seed=created)
+                created = size
+                rebuild_index()
+                self.run_size(size, options['repeat'])
+
+    def run_size(self, size, repeat):
+        posts = BlogPost.objects.filter(status='published').select_related('author', 'category')
+
+        def list_page(results):
+            # What blog_list does: count for the paginator, then load page one
+            return results.count(), list(results[:6])
+
+        def icontains(query):
+            return posts.filter(
+                Q(title__icontains=query) |
+                Q(excerpt__icontains=query) |
+                Q(content__icontains=query)
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{size} posts'))
+        self.stdout.write(f'{"query":<24}{"icontains":>12}{"index":>12}{"speedup":>10}')
+        for query in QUERIES:
+            scan = measure(lambda: list_page(icontains(query)), repeat)
+            indexed = measure(lambda: list_page(search_posts(posts, query)), repeat)
+            self.stdout.write(
+                f'{query:<24}{scan * 1000:>10.1f}ms{indexed * 1000:>10.1f}ms{scan / indexed:>9.1f}x'
+            )
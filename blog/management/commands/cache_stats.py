@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from blog.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counts for the public blog page cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after showing them')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        lookups = stats['hit'] + stats['miss']
+        ratio = stats['hit'] / lookups * 100 if lookups else 0
+
+        self.stdout.write(f'Hits:     {stats["hit"]}')
+        self.stdout.write(f'Misses:   {stats["miss"]}')
+        self.stdout.write(f'Bypassed: {stats["bypass"]} (signed-in or with pending messages)')
+        self.stdout.write(self.style.SUCCESS(f'Hit ratio: {ratio:.1f}%'))
+
+        if options['reset']:
+            reset_stats()
+            self.stdout.write('Counters reset')
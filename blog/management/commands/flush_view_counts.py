@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from blog.counters import get_view_buffer
+from blog.likes import fold_like_shards
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered blog post view counts to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep flushing until interrupted (use as the flusher for the cache buffer, also folds like shards)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds between flushes when running with --loop',
+        )
+
+    def handle(self, *args, **options):
+        buffer = get_view_buffer()
+
+        if not options['loop']:
+            updated = buffer.flush()
+            self.stdout.write(self.style.SUCCESS(f'Flushed view counts for {updated} posts'))
+            return
+
+        self.stdout.write(f'Flushing view counts every {options["interval"]}s, press Ctrl+C to stop')
+        try:
+            while True:
+                updated = buffer.flush()
+                if updated:
+                    self.stdout.write(f'Flushed view counts for {updated} posts')
+                fold_like_shards()
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            buffer.flush()
+            self.stdout.write(self.style.SUCCESS('Stopped view count flusher'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from blog.images import process_image
+from blog.models import BlogPost
+
+
+class Command(BaseCommand):
+    help = 'Create resized featured image renditions for blog posts that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate renditions for every post with an image')
+
+    def handle(self, *args, **options):
+        posts = BlogPost.objects.exclude(featured_image='').exclude(featured_image=None)
+        if not options['all']:
+            posts = posts.filter(image_renditions=[])
+        done = 0
+        for pk, name in posts.values_list('pk', 'featured_image').iterator():
+            process_image(pk, name)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed images for {done} posts'))
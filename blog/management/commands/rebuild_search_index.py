@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from blog.search import FallbackSearchBackend, get_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the blog post full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+        parser.add_argument('--batch-size', type=int, default=500, help='Posts indexed per batch')
+
+    def handle(self, *args, **options):
+        if isinstance(get_backend(options['database']), FallbackSearchBackend):
+            self.stdout.write(self.style.WARNING(
+                'No search index table for this database, searches use icontains'
+            ))
+            return
+
+        total = rebuild_index(using=options['database'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} posts'))
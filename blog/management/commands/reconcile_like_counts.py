@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from blog.likes import fold_like_shards, rebuild_like_counts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild blog post like counts from PostLike rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shards',
+            action='store_true',
+            help='Only fold pending sharded counters into likes_count instead of recounting',
+        )
+
+    def handle(self, *args, **options):
+        if options['shards']:
+            updated = fold_like_shards()
+            self.stdout.write(self.style.SUCCESS(f'Folded like shards into {updated} posts'))
+            return
+
+        updated = rebuild_like_counts()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt like counts for {updated} posts'))
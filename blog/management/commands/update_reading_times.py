@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import BlogPost
+from blog.utils import update_reading_times
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored word counts and reading times for blog posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Posts updated per batch')
+
+    def handle(self, *args, **options):
+        updated = update_reading_times(BlogPost.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated reading times for {updated} posts'))
@@ -0,0 +1,66 @@
+import html
+
+from django.db import DatabaseError, migrations
+from django.utils.html import strip_tags
+
+
+def _rows(apps, using):
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    posts = BlogPost.objects.using(using).values_list('id', 'title', 'excerpt', 'content')
+    for pk, title, excerpt, content in posts.iterator(chunk_size=500):
+        body = ' '.join(html.unescape(strip_tags(content or '')).split())
+        yield pk, title, excerpt, body
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    using = connection.alias
+
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE blog_post_search USING fts5("
+                "title, excerpt, body, tokenize='porter unicode61 remove_diacritics 2')"
+            )
+        except DatabaseError:
+            # SQLite was built without FTS5; search falls back to icontains
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO blog_post_search (rowid, title, excerpt, body) VALUES (%s, %s, %s, %s)',
+                list(_rows(apps, using)),
+            )
+
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE blog_post_search ('
+            'post_id bigint PRIMARY KEY REFERENCES blog_blogpost (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX blog_post_search_document_gin ON blog_post_search USING GIN (document)'
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO blog_post_search (post_id, document) VALUES (%s, "
+                "setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'C'))",
+                list(_rows(apps, using)),
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS blog_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_postlikeshard'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
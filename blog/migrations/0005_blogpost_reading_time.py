@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:05
+
+from django.db import migrations, models
+
+from blog.utils import update_reading_times
+
+
+def backfill_reading_times(apps, schema_editor):
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    update_reading_times(BlogPost.objects.using(schema_editor.connection.alias))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='reading_time',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, help_text='Estimated minutes to read'),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_reading_times, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_comments_count(apps, schema_editor):
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    Comment = apps.get_model('blog', 'Comment')
+    approved = Comment.objects.filter(
+        post=OuterRef('pk'), is_approved=True
+    ).order_by().values('post').annotate(total=Count('pk')).values('total')
+    BlogPost.objects.using(schema_editor.connection.alias).update(
+        comments_count=Coalesce(Subquery(approved), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_blogpost_reading_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, help_text='Approved comments, including replies'),
+        ),
+        migrations.RunPython(backfill_comments_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_threads(apps, schema_editor):
+    Comment = apps.get_model('blog', 'Comment')
+    comments = Comment.objects.using(schema_editor.connection.alias)
+    parents = dict(comments.filter(parent__isnull=False).values_list('id', 'parent_id'))
+
+    def root(comment_id):
+        while comment_id in parents:
+            comment_id = parents[comment_id]
+        return comment_id
+
+    replies = [Comment(id=reply_id, thread_id=root(reply_id)) for reply_id in parents]
+    comments.bulk_update(replies, ['thread'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_blogpost_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='thread',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_replies', to='blog.comment'),
+        ),
+        migrations.RunPython(backfill_threads, migrations.RunPython.noop),
+    ]
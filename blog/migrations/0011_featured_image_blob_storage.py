@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:39
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_blogpost_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogpost',
+            name='featured_image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.BlobStorage(source='featured_image'), upload_to='blog/featured/'),
+        ),
+    ]
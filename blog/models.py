@@ -1,9 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.urls import reverse
 from django.utils.text import slugify
 from ckeditor_uploader.fields import RichTextUploadingField
-from PIL import Image
+from core.storage import BlobStorage
+from . import images
+from .utils import count_words, reading_time
 
 User = get_user_model()
 
@@ -42,7 +45,9 @@ class BlogPost(models.Model):
     
     excerpt = models.TextField(max_length=300, help_text="Brief description of the post")
     content = RichTextUploadingField(config_name='blog_post')
-    featured_image = models.ImageField(upload_to='blog/featured/', blank=True, null=True)
+    featured_image = models.ImageField(upload_to='blog/featured/', storage=BlobStorage(source='featured_image'), blank=True, null=True)
+    # Resized copies of featured_image, filled in by blog.images after upload
+    image_renditions = models.JSONField(default=list, blank=True, editable=False)
     
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
     is_featured = models.BooleanField(default=False, help_text="Feature this post on homepage")
@@ -53,11 +58,36 @@ class BlogPost(models.Model):
     
     views_count = models.PositiveIntegerField(default=0)
     likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0, help_text="Approved comments, including replies")
+    
+    # Derived from content on save so list pages never load the body
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=1, editable=False, help_text="Estimated minutes to read")
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Blog Post"
         verbose_name_plural = "Blog Posts"
+        indexes = [
+            # Listings only ever show published posts, so most indexes skip drafts
+            models.Index(
+                fields=['-created_at', '-id'], name='post_published_created_idx',
+                condition=models.Q(status='published'),
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'], name='post_category_created_idx',
+                condition=models.Q(status='published'),
+            ),
+            models.Index(
+                fields=['-likes_count', '-views_count'], name='post_published_popular_idx',
+                condition=models.Q(status='published'),
+            ),
+            models.Index(
+                fields=['-created_at'], name='post_featured_created_idx',
+                condition=models.Q(status='published', is_featured=True),
+            ),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -66,31 +96,96 @@ class BlogPost(models.Model):
         if not self.slug:
             self.slug = slugify(self.title)
         
-        # Resize featured image if uploaded
+        update_fields = kwargs.get('update_fields')
+        content_saved = 'content' in update_fields if update_fields is not None else 'content' not in self.get_deferred_fields()
+        if content_saved:
+            self.update_reading_time()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'word_count', 'reading_time'}
+        
+        # New images are resized off the request thread; unchanged ones are left alone
+        image_changed = self.featured_image_changed(kwargs.get('update_fields'))
+        old_renditions = self.image_renditions
+        if image_changed:
+            self.image_renditions = []
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'image_renditions'}
+        
+        # The pages of the category the post leaves are stale too
+        self._previous_category_id = getattr(self, '_saved_category_id', None)
         super().save(*args, **kwargs)
+        self._saved_image_name = self.featured_image.name or ''
+        self._saved_category_id = self.category_id
         
-        if self.featured_image:
-            img = Image.open(self.featured_image.path)
-            if img.height > 600 or img.width > 1200:
-                output_size = (1200, 600)
-                img.thumbnail(output_size)
-                img.save(self.featured_image.path)
+        if image_changed:
+            transaction.on_commit(lambda: images.discard_renditions(old_renditions, exclude_pk=self.pk))
+            if self.featured_image:
+                images.schedule_renditions(self)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'featured_image' in field_names:
+            instance._saved_image_name = values[field_names.index('featured_image')] or ''
+        if 'category_id' in field_names:
+            instance._saved_category_id = values[field_names.index('category_id')]
+        return instance
+
+    def featured_image_changed(self, update_fields=None):
+        """Whether saving now would store a different featured image"""
+        if update_fields is not None and 'featured_image' not in update_fields:
+            return False
+        if 'featured_image' in self.get_deferred_fields():
+            return False
+        if not hasattr(self, '_saved_image_name'):
+            if self._state.adding:
+                self._saved_image_name = ''
+            else:
+                # Loaded without the image field, so ask the database
+                stored = type(self)._base_manager.filter(pk=self.pk).values_list('featured_image', flat=True).first()
+                self._saved_image_name = stored or ''
+        return (self.featured_image.name or '') != self._saved_image_name
+
+    def rendition_srcset(self, fmt):
+        return ', '.join(
+            f"{default_storage.url(rendition['name'])} {rendition['width']}w"
+            for rendition in self.image_renditions if rendition['format'] == fmt
+        )
+
+    @property
+    def image_webp_srcset(self):
+        return self.rendition_srcset('webp')
+
+    @property
+    def image_srcset(self):
+        return self.rendition_srcset(self.image_renditions[-1]['format']) if self.image_renditions else ''
+
+    @property
+    def image_src(self):
+        """The smallest rendition at least 640px wide, else the original"""
+        fallback = [rendition for rendition in self.image_renditions if rendition['format'] != 'webp']
+        for rendition in fallback:
+            if rendition['width'] >= 640:
+                return default_storage.url(rendition['name'])
+        if fallback:
+            return default_storage.url(fallback[-1]['name'])
+        return self.featured_image.url
 
     def get_absolute_url(self):
         return reverse('blog:detail', kwargs={'slug': self.slug})
 
-    @property
-    def reading_time(self):
-        """Calculate estimated reading time based on word count"""
-        words_per_minute = 200
-        word_count = len(self.content.split())
-        return max(1, round(word_count / words_per_minute))
+    def update_reading_time(self):
+        """Recompute word count and reading time from the HTML-stripped content"""
+        self.word_count = count_words(self.content)
+        self.reading_time = reading_time(self.word_count)
 
 class Comment(models.Model):
     post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     parent = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, related_name='replies')
+    # Top-level comment of the thread this reply belongs to (empty for top-level comments)
+    thread = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, editable=False, related_name='thread_replies')
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -98,10 +193,22 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Cursor pages of a post's visible top-level comments
+            models.Index(
+                fields=['post', '-created_at', '-id'], name='comment_thread_created_idx',
+                condition=models.Q(parent=None, is_approved=True),
+            ),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author.get_full_name()} on {self.post.title}'
 
+    def save(self, *args, **kwargs):
+        if self.parent_id and not self.thread_id:
+            self.thread_id = self.parent.thread_id or self.parent_id
+        super().save(*args, **kwargs)
+
 class PostLike(models.Model):
     post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='likes')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -111,4 +218,20 @@ class PostLike(models.Model):
         unique_together = ('post', 'user')
 
     def __str__(self):
-        return f'{self.user.get_full_name()} likes {self.post.title}'
\ No newline at end of file
+        return f'{self.user.get_full_name()} likes {self.post.title}'
+
+class PostLikeShard(models.Model):
+    """Pending like count changes, spread over several rows per post.
+
+    Likes add to a random shard instead of locking the ``BlogPost`` row; the
+    shards are folded into ``BlogPost.likes_count`` in the background.
+    """
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='like_shards')
+    shard = models.PositiveSmallIntegerField()
+    delta = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('post', 'shard')
+
+    def __str__(self):
+        return f'{self.post.title} shard {self.shard}: {self.delta:+d}'
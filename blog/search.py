@@ -0,0 +1,203 @@
+"""
+Full-text search for blog posts.
+
+Posts are indexed as plain text (CKEditor HTML stripped) in a side table
+that the ``0004_post_search_index`` migration creates:
+
+* SQLite: an FTS5 virtual table ranked with ``bm25``.
+* PostgreSQL: a ``tsvector`` table with a GIN index ranked with ``ts_rank``.
+
+The index is kept in sync by the ``BlogPost`` signals in ``blog.signals`` and
+can be rebuilt with ``manage.py rebuild_search_index``. Searches return the
+best ``BLOG_SEARCH_MAX_RESULTS`` matches. Other databases, or a SQLite build
+without FTS5, fall back to ``icontains`` matching.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+
+from core.search import SearchResults, search_terms
+
+from .models import BlogPost
+from .utils import strip_html
+
+SEARCH_TABLE = 'blog_post_search'
+INDEXED_FIELDS = ('title', 'excerpt', 'content')
+
+
+def max_results():
+    return getattr(settings, 'BLOG_SEARCH_MAX_RESULTS', 1000)
+
+
+class IndexedSearchBackend:
+    """Base for backends that look up ranked post ids in the search table"""
+
+    def __init__(self, connection):
+        self.using = connection.alias
+
+    @property
+    def connection(self):
+        # Backends are shared between threads, connections are per thread
+        return connections[self.using]
+
+    def ranked_ids(self, terms, limit):
+        raise NotImplementedError
+
+    def search(self, queryset, terms):
+        return SearchResults(queryset, self.ranked_ids(terms, max_results()))
+
+
+class SQLiteSearchBackend(IndexedSearchBackend):
+    """FTS5 index with bm25 ranking (title and excerpt weigh more than the body)"""
+
+    def index(self, posts):
+        rows = [(post.pk, post.title, post.excerpt, strip_html(post.content)) for post in posts]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, excerpt, body) VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, post_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(pk,) for pk in post_ids])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def ranked_ids(self, terms, limit):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY bm25({SEARCH_TABLE}, 10.0, 5.0, 1.0), rowid DESC LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(IndexedSearchBackend):
+    """tsvector index with a GIN index and ts_rank ordering"""
+
+    config = 'english'
+
+    def index(self, posts):
+        rows = [(post.pk, post.title, post.excerpt, strip_html(post.content)) for post in posts]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (post_id, document) VALUES (%s, '
+                f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'B') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'C')) "
+                'ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document',
+                rows,
+            )
+
+    def remove(self, post_ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE post_id = ANY(%s)', [list(post_ids)])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+
+    def ranked_ids(self, terms, limit):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT post_id FROM {SEARCH_TABLE}, to_tsquery('{self.config}', %s) query "
+                'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, post_id DESC LIMIT %s',
+                [tsquery, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class FallbackSearchBackend:
+    """Unindexed ``icontains`` matching, used when no search table exists"""
+
+    def __init__(self, connection):
+        self.using = connection.alias
+
+    @property
+    def connection(self):
+        # Backends are shared between threads, connections are per thread
+        return connections[self.using]
+
+    def index(self, posts):
+        pass
+
+    def remove(self, post_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) |
+                Q(excerpt__icontains=term) |
+                Q(content__icontains=term)
+            )
+        return queryset
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backends = {}
+
+
+def get_backend(using='default'):
+    """Return the search backend for a database alias"""
+    connection = connections[using]
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _backends:
+        backend_class = BACKENDS.get(connection.vendor, FallbackSearchBackend)
+        if SEARCH_TABLE not in connection.introspection.table_names(include_views=True):
+            backend_class = FallbackSearchBackend
+        _backends[key] = backend_class(connection)
+    return _backends[key]
+
+
+def index_posts(posts, using='default'):
+    get_backend(using).index(posts)
+
+
+def remove_posts(post_ids, using='default'):
+    get_backend(using).remove(post_ids)
+
+
+def rebuild_index(using='default', batch_size=500):
+    """Re-index every post in batches and return the number indexed"""
+    backend = get_backend(using)
+    backend.clear()
+    posts = BlogPost.objects.using(using).only('pk', *INDEXED_FIELDS).order_by('pk')
+    batch = []
+    total = 0
+    for post in posts.iterator(chunk_size=batch_size):
+        batch.append(post)
+        if len(batch) >= batch_size:
+            backend.index(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        backend.index(batch)
+        total += len(batch)
+    return total
+
+
+def search_posts(queryset, query):
+    """Return the posts in ``queryset`` matching ``query``, best matches first.
+
+    Apply any other filters before searching: indexed backends return a
+    ``SearchResults`` sequence rather than a queryset.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    return get_backend(queryset.db).search(queryset, terms)
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import images, search
+from .cache import bump_versions
+from .counters import refresh_comments_count
+from .models import BlogPost, Category, Comment
+
+
+@receiver(post_save, sender=BlogPost)
+def index_blog_post(sender, instance, update_fields=None, using='default', **kwargs):
+    """Keep the search index in step with the post's text"""
+    if update_fields is not None and not set(update_fields) & set(search.INDEXED_FIELDS):
+        return
+    search.index_posts([instance], using=using)
+
+
+@receiver(post_delete, sender=BlogPost)
+def unindex_blog_post(sender, instance, using='default', **kwargs):
+    search.remove_posts([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=BlogPost)
+def delete_image_renditions(sender, instance, **kwargs):
+    # The original is a blob, collected once nothing refers to it; the
+    # renditions are ours to remove
+    renditions, pk = instance.image_renditions, instance.pk
+    transaction.on_commit(lambda: images.discard_renditions(renditions, exclude_pk=pk))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def update_comments_count(sender, instance, using='default', **kwargs):
+    """Covers new comments, deletions and approval changes"""
+    refresh_comments_count([instance.post_id], using=using)
+
+
+@receiver(post_save, sender=BlogPost)
+@receiver(post_delete, sender=BlogPost)
+def invalidate_post_pages(sender, instance, **kwargs):
+    try:
+        category_slug = instance.category.slug
+    except ObjectDoesNotExist:
+        # Deleted along with its category, which invalidates the pages itself
+        return
+    scopes = ['posts', f'category:{category_slug}']
+    previous = getattr(instance, '_previous_category_id', None)
+    if previous is not None and previous != instance.category_id:
+        previous_slug = Category.objects.filter(pk=previous).values_list('slug', flat=True).first()
+        if previous_slug is not None:
+            scopes.append(f'category:{previous_slug}')
+    bump_versions(*scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    # Cards show comment counts
+    try:
+        category_slug = instance.post.category.slug
+    except ObjectDoesNotExist:
+        # Deleted along with its post, which invalidates the pages itself
+        return
+    bump_versions('posts', f'category:{category_slug}')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    bump_versions('posts', f'category:{instance.slug}')
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_author_pages(sender, instance, created=False, update_fields=None, **kwargs):
+    # Cards and post pages show the author's name
+    if created or (update_fields is not None and 'full_name' not in update_fields):
+        return
+    slugs = Category.objects.filter(posts__author=instance).values_list('slug', flat=True).distinct()
+    bump_versions('posts', *(f'category:{slug}' for slug in slugs))
@@ -1,3 +1,575 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, close_old_connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from core import writes
+from core.models import Blob
+from core.pagination import paginate
+
+from .comments import load_comment_page
+from .counters import CacheViewBuffer, LocalViewBuffer, get_view_buffer
+from .likes import current_like_count, fold_like_shards, rebuild_like_counts, toggle_like
+from .models import BlogPost, Category, Comment, PostLike
+from .search import search_posts
+
+User = get_user_model()
+
+
+def create_post(author, category, **kwargs):
+    kwargs.setdefault('title', 'Finding my way back')
+    kwargs.setdefault('excerpt', 'A short story')
+    kwargs.setdefault('content', '<p>One day at a time.</p>')
+    kwargs.setdefault('status', 'published')
+    return BlogPost.objects.create(author=author, category=category, **kwargs)
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=3600)
+class ViewBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user('author@example.com')
+        category = Category.objects.create(name='Recovery')
+        self.post = create_post(author, category)
+        self.other = create_post(author, category, title='Another day')
+
+    def views_after_flush(self, buffer):
+        buffer.flush()
+        return dict(BlogPost.objects.values_list('pk', 'views_count'))
+
+    def check_buffer(self, buffer):
+        for _ in range(3):
+            buffer.record(self.post.pk)
+        buffer.record(self.other.pk)
+        self.assertEqual(buffer.pending(self.post.pk), 3)
+        self.assertEqual(self.views_after_flush(buffer), {self.post.pk: 3, self.other.pk: 1})
+
+        # Posts flushed before are counted again
+        buffer.record(self.post.pk)
+        buffer.record(self.post.pk)
+        self.assertEqual(self.views_after_flush(buffer), {self.post.pk: 5, self.other.pk: 1})
+        self.assertEqual(buffer.pending(self.post.pk), 0)
+        self.assertEqual(self.views_after_flush(buffer), {self.post.pk: 5, self.other.pk: 1})
+
+    def test_local_buffer(self):
+        self.check_buffer(LocalViewBuffer())
+
+    def test_cache_buffer(self):
+        self.check_buffer(CacheViewBuffer())
+
+    def test_cache_buffer_keeps_hits_when_the_write_fails(self):
+        buffer = CacheViewBuffer()
+        buffer.record(self.post.pk)
+        with mock.patch('blog.counters.apply_view_counts', side_effect=OperationalError('locked')):
+            with self.assertRaises(OperationalError):
+                buffer.flush()
+        buffer.record(self.post.pk)
+        self.assertEqual(self.views_after_flush(buffer)[self.post.pk], 2)
+
+    def test_cache_buffer_waits_for_unwritten_slots(self):
+        buffer = CacheViewBuffer()
+        buffer.record(self.post.pk)
+        # Another worker has numbered a slot but not filled it in yet
+        number = cache.incr(buffer.index_key)
+        buffer.flush()
+        cache.add(buffer._key(self.other.pk), 2)
+        cache.add(buffer._marker_key(self.other.pk), 1)
+        cache.set(buffer._slot_key(number), self.other.pk)
+        self.assertEqual(self.views_after_flush(buffer), {self.post.pk: 1, self.other.pk: 2})
+
+
+class LikeEngineTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author@example.com')
+        self.category = Category.objects.create(name='Recovery')
+        self.post = create_post(self.author, self.category)
+
+    def test_toggle_like_and_unlike(self):
+        self.assertEqual(toggle_like(self.post, self.author), (True, 1))
+        self.assertEqual(toggle_like(self.post, self.author), (False, 0))
+        self.assertFalse(PostLike.objects.exists())
+
+    @override_settings(BLOG_LIKE_COUNTER_SHARDS=4)
+    def test_sharded_likes_are_folded_into_likes_count(self):
+        users = [User.objects.create_user(f'user{i}@example.com') for i in range(10)]
+        for user in users:
+            toggle_like(self.post, user)
+        toggle_like(self.post, users[0])
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertEqual(current_like_count(self.post.pk), 9)
+
+        fold_like_shards()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 9)
+        self.assertEqual(current_like_count(self.post.pk), 9)
+
+    @override_settings(COUNTER_WRITE_DELAY=60)
+    def test_queued_likes_are_written_in_one_batch(self):
+        self.addCleanup(writes.queue.stop)
+        users = [User.objects.create_user(f'user{i}@example.com') for i in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in users:
+                toggle_like(self.post, user)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertEqual(current_like_count(self.post.pk), 5)
+
+        self.assertEqual(writes.queue.stop(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 5)
+        self.assertEqual(current_like_count(self.post.pk), 5)
+
+    def test_rebuild_like_counts(self):
+        PostLike.objects.create(post=self.post, user=self.author)
+        BlogPost.objects.filter(pk=self.post.pk).update(likes_count=42)
+
+        rebuild_like_counts()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+    @override_settings(COUNTER_WRITE_DELAY=60)
+    def test_rebuild_like_counts_with_queued_increments(self):
+        self.addCleanup(writes.queue.stop)
+        users = [User.objects.create_user(f'user{i}@example.com') for i in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in users:
+                toggle_like(self.post, user)
+        self.assertEqual(writes.pending(BlogPost, self.post.pk, 'likes_count'), 3)
+
+        rebuild_like_counts()
+        self.assertEqual(writes.pending(BlogPost, self.post.pk, 'likes_count'), 0)
+        writes.queue.stop()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 3)
+
+
+class ReadingTimeTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author@example.com')
+        self.category = Category.objects.create(name='Recovery')
+
+    def test_reading_time_is_stored_from_visible_text(self):
+        words = ' '.join(['word'] * 450)
+        post = create_post(self.author, self.category, content=f'<p style="color: red">{words}</p><br/>')
+        self.assertEqual((post.word_count, post.reading_time), (450, 2))
+
+        post.content = '<p>short</p>'
+        post.save(update_fields=['content'])
+        post.refresh_from_db()
+        self.assertEqual((post.word_count, post.reading_time), (1, 1))
+
+    def test_list_pages_do_not_load_content(self):
+        create_post(self.author, self.category)
+        response = self.client.get(reverse('blog:list'))
+        for post in response.context['page_obj']:
+            self.assertIn('content', post.get_deferred_fields())
+
+
+def upload_image(name='photo.jpg', size=(1600, 900), color='teal'):
+    output = BytesIO()
+    Image.new('RGB', size, color).save(output, 'JPEG')
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(BLOG_IMAGE_WORKERS=0, BLOG_IMAGE_RENDITION_WIDTHS=(320, 640, 1200))
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.author = User.objects.create_user('author@example.com')
+        self.category = Category.objects.create(name='Recovery')
+
+    def test_new_image_gets_renditions(self):
+        post = create_post(self.author, self.category, featured_image=upload_image())
+        post.refresh_from_db()
+
+        # The 1600x900 upload is capped to 1067x600, so nothing is upscaled past that
+        self.assertEqual(
+            [(rendition['width'], rendition['format']) for rendition in post.image_renditions],
+            [(320, 'webp'), (320, 'jpeg'), (640, 'webp'), (640, 'jpeg'), (1067, 'webp'), (1067, 'jpeg')],
+        )
+        for rendition in post.image_renditions:
+            self.assertTrue(default_storage.exists(rendition['name']))
+        with Image.open(default_storage.path(post.featured_image.name)) as original:
+            self.assertEqual(original.size, (1067, 600))
+        self.assertIn('320w', post.image_webp_srcset)
+        self.assertTrue(post.image_src.endswith('-640.jpeg'))
+
+    def test_capped_original_takes_over_the_reference(self):
+        post = create_post(self.author, self.category, featured_image=upload_image())
+        post.refresh_from_db()
+        counts = dict(Blob.objects.values_list('name', 'ref_count'))
+        self.assertEqual(len(counts), 2)
+        self.assertEqual(counts.pop(post.featured_image.name), 1)
+        # The full-size upload is left for garbage collection
+        self.assertEqual(list(counts.values()), [0])
+
+    def test_unchanged_image_is_not_processed_again(self):
+        post = create_post(self.author, self.category, featured_image=upload_image())
+        post = BlogPost.objects.get(pk=post.pk)
+        with mock.patch('blog.images.render') as render:
+            post.title = 'A new title'
+            post.save()
+        render.assert_not_called()
+        self.assertTrue(post.image_renditions)
+
+    def test_replaced_image_discards_old_renditions(self):
+        post = create_post(self.author, self.category, featured_image=upload_image())
+        post.refresh_from_db()
+        old_names = [rendition['name'] for rendition in post.image_renditions]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.featured_image = upload_image('other.jpg', color='orange')
+            post.save()
+        post.refresh_from_db()
+        self.assertTrue(post.image_renditions)
+        self.assertFalse(any(default_storage.exists(name) for name in old_names))
+
+    def test_cards_use_renditions(self):
+        create_post(self.author, self.category, featured_image=upload_image())
+        response = self.client.get(reverse('blog:list'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '-320.jpeg 320w')
+
+
+class CommentCountTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author@example.com')
+        self.post = create_post(self.author, Category.objects.create(name='Recovery'))
+
+    def test_comments_count_follows_create_approve_and_delete(self):
+        comment = Comment.objects.create(post=self.post, author=self.author, content='Thank you')
+        Comment.objects.create(post=self.post, author=self.author, content='Agreed', parent=comment)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+
+        comment.is_approved = False
+        comment.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+
+@override_settings(BLOG_COMMENT_MAX_DEPTH=2)
+class CommentTreeTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author@example.com')
+        self.post = create_post(self.author, Category.objects.create(name='Recovery'))
+
+    def comment(self, parent=None, **kwargs):
+        return Comment.objects.create(post=self.post, author=self.author, content='Hi', parent=parent, **kwargs)
+
+    def test_replies_are_nested_and_capped_at_max_depth(self):
+        root = self.comment()
+        child = self.comment(root)
+        grandchild = self.comment(child)
+        deep = self.comment(grandchild)
+        self.comment(child, is_approved=False)
+
+        [loaded_root] = load_comment_page(self.post).threads
+        self.assertEqual(loaded_root, root)
+        [loaded_child] = loaded_root.children
+        self.assertEqual(loaded_child.children, [grandchild, deep])
+        self.assertEqual(loaded_child.children[0].children, [])
+        self.assertEqual(deep.thread_id, root.pk)
+
+    def test_threads_are_paginated_with_a_cursor(self):
+        threads = [self.comment() for _ in range(5)]
+        for thread in threads:
+            self.comment(thread)
+
+        first = load_comment_page(self.post, limit=3)
+        self.assertEqual(first.threads, threads[:1:-1])
+        second = load_comment_page(self.post, cursor=first.next_cursor, limit=3)
+        self.assertEqual(second.threads, threads[1::-1])
+        self.assertFalse(second.has_next)
+        self.assertTrue(all(len(thread.children) == 1 for thread in first.threads + second.threads))
+
+
+class QueryCountTests(TestCase):
+    """Public pages run a fixed number of queries however many posts they show"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author@example.com')
+        self.category = Category.objects.create(name='Recovery')
+        for i in range(12):
+            post = create_post(self.author, self.category, title=f'Post {i}', slug=f'post-{i}')
+            Comment.objects.create(post=post, author=self.author, content='Stay strong')
+
+    def assertPageQueries(self, num, url):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_blog_home(self):
+        # recent posts, popular posts, categories
+        self.assertPageQueries(3, reverse('blog:home'))
+
+    def test_blog_list(self):
+        # page, cached total count, search form categories
+        self.assertPageQueries(3, reverse('blog:list'))
+
+    def test_category_posts(self):
+        # category, page, cached total count
+        self.assertPageQueries(3, reverse('blog:category', kwargs={'slug': self.category.slug}))
+
+    def test_home(self):
+        self.assertPageQueries(1, reverse('home'))
+
+    def test_blog_detail_with_nested_replies(self):
+        post = BlogPost.objects.get(slug='post-0')
+        parent = post.comments.get()
+        for i in range(5):
+            parent = Comment.objects.create(post=post, author=self.author, content='Reply', parent=parent)
+        # post, comment threads with replies and authors, related posts
+        self.assertPageQueries(3, post.get_absolute_url())
+        get_view_buffer().drain()
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user('author@example.com')
+        category = Category.objects.create(name='Recovery')
+        self.posts = [create_post(author, category, title=f'Post {i}', slug=f'post-{i}') for i in range(5)]
+        self.queryset = BlogPost.objects.filter(status='published')
+
+    def test_pages_forward_and_back(self):
+        newest_first = self.posts[::-1]
+        first = paginate(self.queryset, 2)
+        self.assertEqual(list(first), newest_first[:2])
+        self.assertEqual((first.has_previous(), first.total), (False, 5))
+
+        second = paginate(self.queryset, 2, first.next_cursor)
+        third = paginate(self.queryset, 2, second.next_cursor)
+        self.assertEqual(list(second), newest_first[2:4])
+        self.assertEqual(list(third), newest_first[4:])
+        self.assertFalse(third.has_next())
+
+        self.assertEqual(list(paginate(self.queryset, 2, third.previous_cursor)), newest_first[2:4])
+        self.assertEqual(list(paginate(self.queryset, 2, second.previous_cursor)), newest_first[:2])
+
+    def test_bad_cursor_shows_the_first_page(self):
+        response = self.client.get(reverse('blog:list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['page_obj']), self.posts[::-1])
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author@example.com')
+        self.category = Category.objects.create(name='Recovery')
+        self.post = create_post(self.author, self.category, slug='finding-my-way')
+        self.draft = create_post(self.author, self.category, slug='draft', status='draft')
+        Comment.objects.create(post=self.post, author=self.author, content='Thank you')
+
+    async def get(self, url, **params):
+        response = await self.async_client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    async def test_public_pages_render_under_asgi(self):
+        response = await self.get(reverse('blog:home'))
+        self.assertEqual([post.pk for post in response.context['recent_posts']], [self.post.pk])
+        response = await self.get(reverse('blog:list'), query='way', category=self.category.pk)
+        self.assertEqual(response.context['total_posts'], 1)
+        response = await self.get(reverse('blog:category', kwargs={'slug': self.category.slug}))
+        self.assertEqual(response.context['category'], self.category)
+        response = await self.get(reverse('blog:detail', kwargs={'slug': self.post.slug}))
+        self.assertEqual(len(response.context['comment_page'].threads), 1)
+        self.assertFalse(response.context['user_liked'])
+        await self.post.arefresh_from_db()
+        self.assertEqual(self.post.views_count, 1)
+
+        response = await self.async_client.get(reverse('blog:category', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('blog:detail', kwargs={'slug': self.draft.slug}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_signed_in_author_sees_their_draft(self):
+        await PostLike.objects.acreate(post=self.post, user=self.author)
+        await self.async_client.aforce_login(self.author)
+        response = await self.get(reverse('blog:detail', kwargs={'slug': self.draft.slug}))
+        self.assertContains(response, self.draft.title)
+        response = await self.get(reverse('blog:detail', kwargs={'slug': self.post.slug}))
+        self.assertTrue(response.context['user_liked'])
+        await self.get(reverse('blog:list'))
+
+
+class PublicPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author@example.com')
+        self.category = Category.objects.create(name='Recovery')
+        self.post = create_post(self.author, self.category)
+        self.url = reverse('blog:category', kwargs={'slug': self.category.slug})
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+
+    def test_saving_a_post_invalidates_its_pages(self):
+        self.client.get(self.url)
+        self.post.title = 'A brand new title'
+        self.post.save()
+        self.assertContains(self.client.get(self.url), 'A brand new title')
+
+    def test_moving_a_post_invalidates_both_categories(self):
+        other = Category.objects.create(name='Community')
+        other_url = reverse('blog:category', kwargs={'slug': other.slug})
+        self.client.get(self.url)
+        self.client.get(other_url)
+        post = BlogPost.objects.get(pk=self.post.pk)
+        post.category = other
+        post.save()
+        self.assertNotContains(self.client.get(self.url), post.title)
+        self.assertContains(self.client.get(other_url), post.title)
+
+    def test_renaming_the_author_refreshes_cards(self):
+        self.assertContains(self.client.get(self.url), 'author@example.com')
+        self.author.full_name = 'Ada Lovelace'
+        self.author.save()
+        self.assertContains(self.client.get(self.url), 'Ada Lovelace')
+        self.assertContains(self.client.get(reverse('blog:list')), 'Ada Lovelace')
+
+    def test_renaming_the_category_refreshes_cards(self):
+        self.client.get(reverse('blog:list'))
+        self.category.name = 'Healing'
+        self.category.save()
+        self.assertContains(self.client.get(reverse('blog:list')), 'Healing')
+
+    def test_other_categories_stay_cached(self):
+        self.client.get(self.url)
+        create_post(self.author, Category.objects.create(name='Community'), slug='other')
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_signed_in_users_bypass_the_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(self.author)
+        with self.assertNumQueries(3):
+            # user, category, page; the session and total count are cached
+            self.client.get(self.url)
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author@example.com')
+        self.category = Category.objects.create(name='Recovery')
+
+    def search(self, query):
+        return list(search_posts(BlogPost.objects.filter(status='published'), query))
+
+    def test_index_follows_saves_and_deletes(self):
+        post = create_post(self.author, self.category, content='<p>Morning <strong>meditation</strong> helps</p>')
+        self.assertEqual(self.search('meditation'), [post])
+        self.assertEqual(self.search('strong'), [])
+
+        post.content = '<p>Evening walks help</p>'
+        post.save()
+        self.assertEqual(self.search('meditation'), [])
+        self.assertEqual(self.search('walks'), [post])
+
+        post.delete()
+        self.assertEqual(self.search('walks'), [])
+
+    def test_title_matches_rank_first_and_drafts_are_hidden(self):
+        body_match = create_post(self.author, self.category, title='A long week', content='<p>gratitude</p>', slug='a')
+        title_match = create_post(self.author, self.category, title='Gratitude lists', slug='b')
+        create_post(self.author, self.category, title='Gratitude draft', status='draft', slug='c')
+        self.assertEqual(self.search('gratitude'), [title_match, body_match])
+
+
+class SearchThreadTests(TransactionTestCase):
+    def test_saves_and_searches_from_another_thread(self):
+        author = User.objects.create_user('author@example.com')
+        category = Category.objects.create(name='Recovery')
+        # Builds the shared backend on this thread
+        create_post(author, category, title='Morning walks', slug='walks')
+        results, errors = [], []
+
+        def work():
+            try:
+                create_post(author, category, title='Evening walks', slug='evening')
+                results.extend(search_posts(BlogPost.objects.filter(status='published'), 'walks'))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                close_old_connections()
+
+        worker = threading.Thread(target=work)
+        worker.start()
+        worker.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(post.slug for post in results), ['evening', 'walks'])
+
+
+class LikeConcurrencyTests(TransactionTestCase):
+    threads = 8
+    toggles_per_user = 25
+
+    def setUp(self):
+        author = User.objects.create_user('author@example.com')
+        self.post = create_post(author, Category.objects.create(name='Recovery'))
+        self.users = [
+            User.objects.create_user(f'user{i}@example.com') for i in range(self.threads)
+        ]
+
+    def hammer(self, user, errors):
+        try:
+            for _ in range(self.toggles_per_user):
+                while True:
+                    try:
+                        toggle_like(self.post, user)
+                        break
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting; the
+                        # toggle ran in one transaction, so retrying is safe
+                        time.sleep(0.001)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            close_old_connections()
+
+    def run_stress(self):
+        errors = []
+        workers = [threading.Thread(target=self.hammer, args=(user, errors)) for user in self.users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+
+        fold_like_shards()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, PostLike.objects.filter(post=self.post).count())
+
+    def test_concurrent_toggles_keep_count_exact(self):
+        self.run_stress()
+
+    @override_settings(BLOG_LIKE_COUNTER_SHARDS=4)
+    def test_concurrent_sharded_toggles_keep_count_exact(self):
+        self.run_stress()
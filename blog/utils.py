@@ -0,0 +1,46 @@
+import html
+
+from django.utils.html import strip_tags
+
+WORDS_PER_MINUTE = 200
+
+
+def strip_html(value):
+    """Return the visible text of a rich-text HTML fragment"""
+    text = html.unescape(strip_tags(value or ''))
+    return ' '.join(text.split())
+
+
+def count_words(value):
+    """Count the words a reader sees in a rich-text HTML fragment"""
+    return len(strip_html(value).split())
+
+
+def reading_time(word_count):
+    """Estimated reading time in whole minutes, at least one"""
+    return max(1, round(word_count / WORDS_PER_MINUTE))
+
+
+def update_reading_times(queryset, batch_size=500):
+    """Recompute stored word counts and reading times in bulk.
+
+    Works on historical models too, so migrations can use it. Returns the
+    number of posts whose values changed.
+    """
+    changed = []
+    updated = 0
+    posts = queryset.only('pk', 'content', 'word_count', 'reading_time').order_by('pk')
+    for post in posts.iterator(chunk_size=batch_size):
+        words = count_words(post.content)
+        minutes = reading_time(words)
+        if (post.word_count, post.reading_time) != (words, minutes):
+            post.word_count, post.reading_time = words, minutes
+            changed.append(post)
+        if len(changed) >= batch_size:
+            queryset.model.objects.using(queryset.db).bulk_update(changed, ['word_count', 'reading_time'])
+            updated += len(changed)
+            changed = []
+    if changed:
+        queryset.model.objects.using(queryset.db).bulk_update(changed, ['word_count', 'reading_time'])
+        updated += len(changed)
+    return updated
@@ -1,29 +1,41 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
 from django.db.models import Q, Count
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from .models import BlogPost, Category, Comment, PostLike
+from core.aio import alist
+from core.pagination import apaginate, paginate
+from .cache import cache_public_page
+from .comments import aload_comment_page
+from .counters import arecord_view
+from . import likes
+from .search import search_posts
 from .forms import BlogPostForm, CommentForm, BlogSearchForm
 
-def blog_home(request):
+@cache_public_page('posts')
+async def blog_home(request):
     """Community forum homepage with recent posts and popular content"""
-    # Show recent community posts
-    recent_posts = BlogPost.objects.filter(
-        status='published'
-    ).select_related('author', 'category')[:9]
-    
-    # Show popular posts (most liked)
-    popular_posts = BlogPost.objects.filter(
+    posts = BlogPost.objects.filter(
         status='published'
-    ).select_related('author', 'category').order_by('-likes_count', '-views_count')[:3]
-    
+    ).select_related('author', 'category').defer('content')
+
     categories = Category.objects.annotate(
         post_count=Count('posts', filter=Q(posts__status='published'))
     ).filter(post_count__gt=0)
-    
+
+    # Recent community posts, popular posts (most liked) and the categories
+    recent_posts, popular_posts, categories, _ = await asyncio.gather(
+        alist(posts[:9]),
+        alist(posts.order_by('-likes_count', '-views_count')[:3]),
+        alist(categories),
+        request.auser(),
+    )
+
     context = {
         'recent_posts': recent_posts,
         'popular_posts': popular_posts,
@@ -31,45 +43,45 @@ def blog_home(request):
     }
     return render(request, 'blog/home.html', context)
 
-def blog_list(request):
+@cache_public_page('posts')
+async def blog_list(request):
     """Blog post list with pagination and filtering"""
     posts = BlogPost.objects.filter(status='published').select_related(
         'author', 'category'
-    )
-    
+    ).defer('content')
+    categories, _ = await asyncio.gather(alist(Category.objects.all()), request.auser())
+
     # Search functionality
-    search_form = BlogSearchForm(request.GET)
+    search_form = BlogSearchForm(request.GET, categories=categories)
     if search_form.is_valid():
         query = search_form.cleaned_data.get('query')
         category = search_form.cleaned_data.get('category')
         
-        if query:
-            posts = posts.filter(
-                Q(title__icontains=query) |
-                Q(excerpt__icontains=query) |
-                Q(content__icontains=query)
-            )
-        
         if category:
             posts = posts.filter(category=category)
+        
+        if query:
+            posts = await sync_to_async(search_posts)(posts, query)
     
-    # Pagination
-    paginator = Paginator(posts, 6)  # 6 posts per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination, 6 posts per page
+    page_obj = await apaginate(posts, 6, cursor=request.GET.get('cursor'))
     
     context = {
         'page_obj': page_obj,
         'search_form': search_form,
-        'total_posts': posts.count(),
+        'total_posts': page_obj.total,
     }
     return render(request, 'blog/list.html', context)
 
-def blog_detail(request, slug):
+async def user_liked(post, user):
+    return user.is_authenticated and await PostLike.objects.filter(post=post, user=user).aexists()
+
+async def blog_detail(request, slug):
     """Individual blog post detail view"""
+    user = await request.auser()
     # Get post - handle different status levels
     try:
-        post = BlogPost.objects.select_related('author', 'category').get(slug=slug)
+        post = await BlogPost.objects.select_related('author', 'category').aget(slug=slug)
         
         # Archived posts are not visible to anyone (including author)
         if post.status == 'archived':
@@ -77,46 +89,41 @@ def blog_detail(request, slug):
             
         # Draft posts are only visible to the author
         if post.status == 'draft':
-            if not request.user.is_authenticated or request.user != post.author:
+            if not user.is_authenticated or user != post.author:
                 raise BlogPost.DoesNotExist
                 
     except BlogPost.DoesNotExist:
         # Try to find published post or show 404
-        post = get_object_or_404(
+        post = await aget_object_or_404(
             BlogPost.objects.select_related('author', 'category'),
             slug=slug,
             status='published'
         )
     
-    # Increment view count
-    post.views_count += 1
-    post.save(update_fields=['views_count'])
-    
-    # Get comments
-    comments = post.comments.filter(
-        is_approved=True, 
-        parent=None
-    ).select_related('author').prefetch_related('replies')
-    
-    # Check if user liked the post
-    user_liked = False
-    if request.user.is_authenticated:
-        user_liked = PostLike.objects.filter(post=post, user=request.user).exists()
-    
     # Related posts
     related_posts = BlogPost.objects.filter(
         category=post.category,
         status='published'
-    ).exclude(id=post.id)[:3]
+    ).exclude(id=post.id).defer('content')[:3]
+
+    # Increment view count (buffered, flushed in the background), then get
+    # a page of comment threads with their replies, whether the user liked
+    # the post and the related posts
+    _, comment_page, liked, related_posts = await asyncio.gather(
+        arecord_view(post),
+        aload_comment_page(post, cursor=request.GET.get('comments')),
+        user_liked(post, user),
+        alist(related_posts),
+    )
     
     # Comment form
     comment_form = CommentForm()
     
     context = {
         'post': post,
-        'comments': comments,
+        'comment_page': comment_page,
         'comment_form': comment_form,
-        'user_liked': user_liked,
+        'user_liked': liked,
         'related_posts': related_posts,
     }
     return render(request, 'blog/detail.html', context)
@@ -215,7 +222,7 @@ def add_comment(request, slug):
         # Handle parent comment for replies
         parent_id = request.POST.get('parent_id')
         if parent_id:
-            parent_comment = get_object_or_404(Comment, id=parent_id)
+            parent_comment = get_object_or_404(Comment, id=parent_id, post=post)
             comment.parent = parent_comment
         
         comment.save()
@@ -231,45 +238,32 @@ def toggle_like(request, slug):
     """Toggle like/unlike for a blog post"""
     post = get_object_or_404(BlogPost, slug=slug, status='published')
     
-    like, created = PostLike.objects.get_or_create(
-        post=post,
-        user=request.user
-    )
-    
-    if not created:
-        # Unlike the post
-        like.delete()
-        liked = False
-        post.likes_count -= 1
-    else:
-        # Like the post
-        liked = True
-        post.likes_count += 1
-    
-    post.save(update_fields=['likes_count'])
+    liked, likes_count = likes.toggle_like(post, request.user)
     
     return JsonResponse({
         'liked': liked,
-        'likes_count': post.likes_count
+        'likes_count': likes_count
     })
 
-def category_posts(request, slug):
+@cache_public_page('category:{slug}')
+async def category_posts(request, slug):
     """Posts filtered by category"""
-    category = get_object_or_404(Category, slug=slug)
     posts = BlogPost.objects.filter(
-        category=category,
+        category__slug=slug,
         status='published'
-    ).select_related('author', 'category')
+    ).select_related('author', 'category').defer('content')
     
-    # Pagination
-    paginator = Paginator(posts, 6)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # The category and its first page (keyset pagination) together
+    category, page_obj, _ = await asyncio.gather(
+        aget_object_or_404(Category, slug=slug),
+        apaginate(posts, 6, cursor=request.GET.get('cursor')),
+        request.auser(),
+    )
     
     context = {
         'category': category,
         'page_obj': page_obj,
-        'total_posts': posts.count(),
+        'total_posts': page_obj.total,
     }
     return render(request, 'blog/category.html', context)
 
@@ -278,15 +272,12 @@ def my_posts(request):
     """User's own blog posts (including archived)"""
     posts = BlogPost.objects.filter(
         author=request.user
-    ).select_related('category')
+    ).select_related('category').defer('content')
     
-    # Pagination
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination
+    page_obj = paginate(posts, 10, cursor=request.GET.get('cursor'), count=False)
     
     context = {
         'page_obj': page_obj,
-        'total_posts': posts.count(),
     }
     return render(request, 'blog/my_posts.html', context)
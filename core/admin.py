@@ -1,3 +1,48 @@
 from django.contrib import admin
+from django.template.defaultfilters import filesizeformat
 
-# Register your models here.
+from .models import Blob, DailyEntry, RecoveryProgress
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'source', 'size_display', 'ref_count', 'created_at', 'unreferenced_since')
+    list_filter = ('source',)
+    search_fields = ('name', 'sha256')
+    readonly_fields = ('name', 'sha256', 'size', 'source', 'ref_count', 'created_at', 'unreferenced_since')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def size_display(self, obj):
+        return filesizeformat(obj.size)
+    size_display.short_description = 'Size'
+
+
+
+@admin.register(DailyEntry)
+class DailyEntryAdmin(admin.ModelAdmin):
+    """Read-only: entries are saved through core.tracking, which keeps the rollups"""
+    list_display = ('user', 'date', 'mood', 'cravings', 'sober', 'trigger_avoided', 'support_used')
+    list_filter = ('mood', 'sober')
+    search_fields = ('user__email',)
+    date_hierarchy = 'date'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RecoveryProgress)
+class RecoveryProgressAdmin(admin.ModelAdmin):
+    list_display = ('user', 'checkins', 'first_entry_date', 'last_relapse_date', 'longest_streak', 'goal_days')
+    search_fields = ('user__email',)
+    readonly_fields = ('user', 'checkins', 'first_entry_date', 'last_relapse_date', 'longest_streak')
+    
+    def has_add_permission(self, request):
+        return False
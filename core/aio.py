@@ -0,0 +1,15 @@
+"""
+Helpers for the async views.
+
+Django's async ORM runs each query through ``sync_to_async`` on the
+request's own thread, so the queries a view starts together with
+``asyncio.gather`` still run one after another on its connection. What the
+view saves is the thread hop for the rest of its work (routing, cache
+lookups, rendering), and the worker keeps serving other requests while it
+waits.
+"""
+
+
+async def alist(queryset):
+    """Evaluate a queryset, or a slice of one, from async code"""
+    return [obj async for obj in queryset]
@@ -0,0 +1,81 @@
+"""
+Helpers shared by the ``benchmark_*`` management commands.
+
+Benchmarks run against a throwaway test database so they never touch real
+data, and time each operation with the median of several runs.
+"""
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+WORDS = (
+    'recovery support journey hope healing strength community progress sober '
+    'mindful habit craving relapse milestone gratitude family friend therapy '
+    'counselor meeting group morning evening routine exercise sleep anxiety '
+    'stress calm breathe trust honest courage patience growth learn share '
+    'story struggle victory daily step forward balance peace focus energy '
+    'health mental online safety privacy school college work change choice '
+    'moment future past present reflection kindness respect listen talk help'
+).split()
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """Run the block against a freshly migrated throwaway database"""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def measure(func, repeat=5):
+    """Return the median wall-clock seconds of ``repeat`` calls to ``func``"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def create_posts(count, batch_size=1000, seed=0, paragraphs=4):
+    """Bulk-create ``count`` published posts with CKEditor-style HTML bodies"""
+    from blog.models import BlogPost, Category
+
+    rng = random.Random(seed)
+    author = get_user_model().objects.create_user(f'bench{seed}@example.com')
+    categories = [
+        Category.objects.get_or_create(name=name)[0]
+        for name in ('Recovery', 'Mental Health', 'Cyber Safety', 'Community')
+    ]
+
+    created = 0
+    while created < count:
+        batch = []
+        for i in range(created, min(created + batch_size, count)):
+            body = ''.join(
+                f'<p>{sentence(rng, 30)} <strong>{rng.choice(WORDS)}</strong> {sentence(rng, 20)}</p>'
+                for _ in range(paragraphs)
+            )
+            batch.append(BlogPost(
+                title=sentence(rng, 6),
+                slug=f'bench-{seed}-{i}',
+                author=author,
+                category=categories[i % len(categories)],
+                excerpt=sentence(rng, 25),
+                content=body,
+                status='published',
+            ))
+        BlogPost.objects.bulk_create(batch)
+        created += len(batch)
+    return author
@@ -0,0 +1,329 @@
+"""
+Blob reference counting and garbage collection.
+
+Apps declare which fields point at blobs with ``track(model, files=...,
+html=...)`` in their ``AppConfig.ready()``: file fields (or plain name
+fields) hold one blob name, rich-text fields hold ``<img>``/``<a>`` URLs of
+editor uploads. Saving a tracked row syncs its ``BlobReference`` rows and
+moves ``Blob.ref_count`` with one UPDATE per delta; deleting the row releases
+them. Writes that bypass signals (``bulk_create``, ``QuerySet.update``) call
+``sync_references`` themselves.
+
+``collect_garbage`` deletes blobs in batches once their count has been zero
+for the grace period, which covers editor uploads not yet saved into a post.
+``recount_references`` rebuilds every reference from the tracked fields and
+``adopt_legacy_files`` moves files saved before blobs existed into the store.
+"""
+import os
+import re
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .storage import BLOB_DIR, BlobStorage, blob_name, parse_blob_name
+
+HTML_BLOB_RE = re.compile(r'blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:_thumb)?(\.[a-z0-9]+)?')
+
+# model -> {'files': (...), 'html': (...)}
+_tracked = {}
+
+
+def grace_period():
+    return timedelta(hours=getattr(settings, 'BLOB_GC_GRACE_HOURS', 24))
+
+
+def register(name, digest, size, source=''):
+    """Record a stored blob, restarting the grace period of an unreferenced one"""
+    from .models import Blob
+
+    blob, created = Blob.objects.get_or_create(
+        name=name,
+        defaults={'sha256': digest, 'size': size, 'source': source},
+    )
+    if not created and blob.ref_count == 0:
+        Blob.objects.filter(pk=blob.pk, ref_count=0).update(unreferenced_since=timezone.now())
+    return blob
+
+
+def blob_names_in_html(html):
+    return {blob_name(digest, digest + ext) for digest, ext in HTML_BLOB_RE.findall(html or '')}
+
+
+def referenced_names(instance, field):
+    spec = _tracked[type(instance)]
+    value = getattr(instance, field)
+    if field in spec['html']:
+        return blob_names_in_html(value)
+    name = getattr(value, 'name', value)
+    return {name} if parse_blob_name(name) else set()
+
+
+def _adjust_counts(deltas, using):
+    """Apply ``{blob_pk: delta}``, one UPDATE per distinct delta"""
+    from .models import Blob
+
+    by_delta = {}
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(pk)
+    now = timezone.now()
+    for delta, pks in by_delta.items():
+        blobs = Blob.objects.using(using).filter(pk__in=pks)
+        if delta > 0:
+            blobs.update(ref_count=F('ref_count') + delta, unreferenced_since=None)
+        else:
+            blobs.update(
+                ref_count=Case(When(ref_count__lte=-delta, then=Value(0)), default=F('ref_count') + delta),
+                unreferenced_since=Case(When(ref_count__lte=-delta, then=Value(now)), default=F('unreferenced_since')),
+            )
+
+
+def sync_references(instances, fields=None, using='default'):
+    """Point the references held by ``fields`` of ``instances`` at the blobs they name now"""
+    from .models import Blob, BlobReference
+
+    instances = [instance for instance in instances if instance.pk is not None]
+    if not instances:
+        return
+    model = type(instances[0])
+    spec = _tracked[model]
+    fields = list(fields or [*spec['files'], *spec['html']])
+    if not fields:
+        return
+    owner_type = ContentType.objects.db_manager(using).get_for_model(model)
+    owners = {str(instance.pk): instance for instance in instances}
+
+    wanted = {
+        (owner_id, field, name)
+        for owner_id, instance in owners.items()
+        for field in fields
+        for name in referenced_names(instance, field)
+    }
+    existing = {
+        (owner_id, field, name): pk
+        for pk, owner_id, field, name in BlobReference.objects.using(using).filter(
+            owner_type=owner_type, owner_id__in=owners, field__in=fields
+        ).values_list('pk', 'owner_id', 'field', 'blob__name')
+    }
+    added = wanted - existing.keys()
+    removed = existing.keys() - wanted
+    if not added and not removed:
+        return
+
+    with transaction.atomic(using=using):
+        deltas = Counter()
+        if removed:
+            references = BlobReference.objects.using(using).filter(pk__in=[existing[key] for key in removed])
+            for blob_id in references.values_list('blob_id', flat=True):
+                deltas[blob_id] -= 1
+            references.delete()
+        if added:
+            # Names that aren't registered blobs (files from before blobs, or
+            # links to a deleted one) hold nothing
+            blob_ids = dict(Blob.objects.using(using).filter(name__in={name for _, _, name in added}).values_list('name', 'pk'))
+            new = [
+                BlobReference(blob_id=blob_ids[name], owner_type=owner_type, owner_id=owner_id, field=field)
+                for owner_id, field, name in added if name in blob_ids
+            ]
+            BlobReference.objects.using(using).bulk_create(new)
+            for reference in new:
+                deltas[reference.blob_id] += 1
+        _adjust_counts(deltas, using)
+
+
+def release_references(model, pks, using='default'):
+    """Drop every reference held by the given rows"""
+    from .models import BlobReference
+
+    owner_type = ContentType.objects.db_manager(using).get_for_model(model)
+    references = BlobReference.objects.using(using).filter(owner_type=owner_type, owner_id__in=[str(pk) for pk in pks])
+    with transaction.atomic(using=using):
+        deltas = Counter(references.values_list('blob_id', flat=True))
+        if deltas:
+            references.delete()
+            _adjust_counts({pk: -count for pk, count in deltas.items()}, using)
+
+
+def _sync_on_save(sender, instance, update_fields=None, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    spec = _tracked[sender]
+    fields = [*spec['files'], *spec['html']]
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+    if fields:
+        sync_references([instance], fields, using=using)
+
+
+def _release_on_delete(sender, instance, using='default', **kwargs):
+    release_references(sender, [instance.pk], using=using)
+
+
+def track(model, files=(), html=()):
+    """Count the blobs named by ``files`` and linked from ``html`` fields of ``model``"""
+    _tracked[model] = {'files': tuple(files), 'html': tuple(html)}
+    uid = f'blobs:{model._meta.label}'
+    post_save.connect(_sync_on_save, sender=model, dispatch_uid=uid)
+    post_delete.connect(_release_on_delete, sender=model, dispatch_uid=uid)
+
+
+def recount_references(batch_size=500):
+    """Rebuild every reference from the tracked fields, then every count"""
+    from .models import Blob, BlobReference
+
+    for model in _tracked:
+        # References whose row went without a delete signal
+        owner_type = ContentType.objects.get_for_model(model)
+        live = {str(pk) for pk in model._base_manager.values_list('pk', flat=True)}
+        stale = [
+            pk for pk, owner_id in BlobReference.objects.filter(owner_type=owner_type).values_list('pk', 'owner_id')
+            if owner_id not in live
+        ]
+        for start in range(0, len(stale), batch_size):
+            BlobReference.objects.filter(pk__in=stale[start:start + batch_size]).delete()
+
+        queryset = model._base_manager.order_by('pk')
+        batch = []
+        for instance in queryset.iterator(chunk_size=batch_size):
+            batch.append(instance)
+            if len(batch) == batch_size:
+                sync_references(batch)
+                batch = []
+        sync_references(batch)
+
+    counts = BlobReference.objects.filter(blob=OuterRef('pk')).order_by().values('blob').annotate(total=Count('pk')).values('total')
+    Blob.objects.update(ref_count=Coalesce(Subquery(counts), Value(0)))
+    Blob.objects.filter(ref_count__gt=0).exclude(unreferenced_since=None).update(unreferenced_since=None)
+    Blob.objects.filter(ref_count=0, unreferenced_since=None).update(unreferenced_since=timezone.now())
+
+
+def collect_garbage(grace=None, batch_size=500, dry_run=False):
+    """Delete blobs nothing has referenced for ``grace``; returns ``(count, bytes)``"""
+    from .models import Blob
+
+    cutoff = timezone.now() - (grace if grace is not None else grace_period())
+    storage = BlobStorage()
+    collected, freed = 0, 0
+    last_pk = 0
+    while True:
+        batch = list(
+            Blob.objects.filter(ref_count=0, unreferenced_since__lt=cutoff, pk__gt=last_pk)
+            .order_by('pk').values_list('pk', 'name', 'size')[:batch_size]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        if dry_run:
+            collected += len(batch)
+            freed += sum(size for _, _, size in batch)
+            continue
+        pks = [pk for pk, _, _ in batch]
+        # Only rows still unreferenced go, even if a reference arrived meanwhile
+        Blob.objects.filter(pk__in=pks, ref_count=0, unreferenced_since__lt=cutoff).delete()
+        survivors = set(Blob.objects.filter(name__in=[name for _, name, _ in batch]).values_list('name', flat=True))
+        for _, name, size in batch:
+            if name not in survivors:
+                storage.delete_blob(name)
+                collected += 1
+                freed += size
+    return collected, freed
+
+
+def untracked_files(grace=None):
+    """Blob files on disk with no ``Blob`` row, e.g. from a rolled-back save"""
+    from .models import Blob
+
+    storage = BlobStorage()
+    root = storage.path(BLOB_DIR)
+    cutoff = (timezone.now() - (grace if grace is not None else grace_period())).timestamp()
+    candidates = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            match = parse_blob_name(name)
+            if match and not match['thumb'] and os.path.getmtime(path) < cutoff:
+                candidates.append(name)
+    known = set()
+    for start in range(0, len(candidates), 500):
+        known.update(Blob.objects.filter(name__in=candidates[start:start + 500]).values_list('name', flat=True))
+    return [name for name in candidates if name not in known]
+
+
+def _adopt(storage, name, adopted):
+    """Store a legacy file as a blob (once) and return the blob's name"""
+    if name not in adopted:
+        with storage.open(name, 'rb') as file:
+            adopted[name] = storage.save(name, File(file, name=name))
+    return adopted[name]
+
+
+def adopt_legacy_files(editor_path='uploads/', batch_size=200):
+    """Move files saved before blobs existed into the blob store.
+
+    Rows naming a legacy file are pointed at its blob and the file is
+    deleted; editor uploads linked from rich text under ``editor_path`` are
+    adopted the same way and the links rewritten. Returns how many files
+    were moved.
+    """
+    from django.db.models import FileField
+
+    from .storage import EditorBlobStorage
+
+    moved = 0
+    for model, spec in _tracked.items():
+        for field in spec['files']:
+            model_field = model._meta.get_field(field)
+            if not isinstance(model_field, FileField) or not isinstance(model_field.storage, BlobStorage):
+                continue
+            storage = model_field.storage
+            legacy = (
+                model._base_manager.exclude(**{f'{field}__startswith': f'{BLOB_DIR}/'})
+                .exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list(field, flat=True).distinct()
+            )
+            for name in list(legacy):
+                if not storage.exists(name):
+                    continue
+                new_name = _adopt(storage, name, {})
+                model._base_manager.filter(**{field: name}).update(**{field: new_name})
+                rows = model._base_manager.filter(**{field: new_name}).order_by('pk')
+                for start in range(0, rows.count(), batch_size):
+                    sync_references(list(rows[start:start + batch_size]), [field])
+                storage.delete(name)
+                moved += 1
+
+        if not spec['html']:
+            continue
+        editor_storage = EditorBlobStorage()
+        link_re = re.compile(re.escape(settings.MEDIA_URL) + '(' + re.escape(editor_path) + r'[^"\'\s<>?#)]+)')
+        adopted = {}
+        for field in spec['html']:
+            rows = model._base_manager.filter(**{f'{field}__contains': settings.MEDIA_URL + editor_path}).order_by('pk')
+            for instance in rows.iterator(chunk_size=batch_size):
+                html = getattr(instance, field)
+
+                def relink(match):
+                    name = match.group(1)
+                    if not editor_storage.exists(name):
+                        return match.group(0)
+                    return editor_storage.url(_adopt(editor_storage, name, adopted))
+
+                new_html = link_re.sub(relink, html)
+                if new_html != html:
+                    setattr(instance, field, new_html)
+                    model._base_manager.filter(pk=instance.pk).update(**{field: new_html})
+                    sync_references([instance], [field])
+        # Only now is every link to them rewritten
+        for name in adopted:
+            editor_storage.delete(name)
+        moved += len(adopted)
+    return moved
@@ -0,0 +1,117 @@
+"""
+Streaming exports of recovery check-ins.
+
+A user's entries are read oldest first with
+``iterator(chunk_size=RECOVERY_EXPORT_CHUNK_SIZE)`` and written out one chunk
+at a time, so memory stays the same for a month of check-ins or ten years.
+The same generators feed the ``export_data`` view (through
+``StreamingHttpResponse``) and ``manage.py export_recovery_data``.
+
+Formats:
+
+* ``csv``: a header row, then one row per entry.
+* ``jsonl``: one JSON object per entry.
+* ``columnar``: one JSON line per chunk of entries, holding the chunk's rows
+  column by column (``{"rows": n, "columns": {"date": [...], ...}}``). Like
+  a Parquet row group, each line loads straight into a data frame.
+
+The command's batch mode writes one file per user from a pool of worker
+processes (see ``export_to_file``).
+"""
+import csv
+import json
+import os
+import tempfile
+from datetime import date, datetime
+from itertools import islice
+
+from django.conf import settings
+
+from .models import DailyEntry
+
+FIELDS = ('date', 'mood', 'cravings', 'sober', 'trigger_avoided', 'support_used', 'notes', 'created_at', 'updated_at')
+
+
+def chunk_size():
+    return getattr(settings, 'RECOVERY_EXPORT_CHUNK_SIZE', 2000)
+
+
+def encode(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class Echo:
+    """A file-like object that hands back what ``csv.writer`` writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def write_csv(rows, size):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS)
+    for batch in batches(rows, size):
+        yield ''.join(writer.writerow([encode(value) for value in row]) for row in batch)
+
+
+def write_jsonl(rows, size):
+    for batch in batches(rows, size):
+        yield ''.join(json.dumps(dict(zip(FIELDS, map(encode, row)))) + '\n' for row in batch)
+
+
+def write_columnar(rows, size):
+    for batch in batches(rows, size):
+        columns = {field: [encode(row[i]) for row in batch] for i, field in enumerate(FIELDS)}
+        yield json.dumps({'rows': len(batch), 'columns': columns}) + '\n'
+
+
+# format: (writer, content type, file extension)
+FORMATS = {
+    'csv': (write_csv, 'text/csv', 'csv'),
+    'jsonl': (write_jsonl, 'application/x-ndjson', 'jsonl'),
+    'columnar': (write_columnar, 'application/x-ndjson', 'columns.jsonl'),
+}
+
+
+def export_entries(user_id, fmt, size=None):
+    """Yield a user's entries in ``fmt`` as text chunks"""
+    size = size or chunk_size()
+    rows = (
+        DailyEntry.objects.filter(user_id=user_id)
+        .order_by('date')
+        .values_list(*FIELDS)
+        .iterator(chunk_size=size)
+    )
+    return FORMATS[fmt][0](rows, size)
+
+
+def filename(label, fmt):
+    return f'recovery-{label}.{FORMATS[fmt][2]}'
+
+
+def export_to_file(user_id, fmt, directory, size=None):
+    """Write a user's export into ``directory`` and return ``(user_id, bytes written)``.
+
+    The file is written beside its final name and moved into place, so a
+    reader never sees half an export. Runs in batch-mode worker processes.
+    """
+    path = os.path.join(directory, filename(user_id, fmt))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.incoming-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as output:
+            for chunk in export_entries(user_id, fmt, size):
+                output.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return user_id, os.path.getsize(path)
@@ -0,0 +1,26 @@
+from django import forms
+from django.utils import timezone
+
+from .models import DailyEntry, RecoveryProgress
+
+
+class DailyEntryForm(forms.ModelForm):
+    """Today's check-in, or a missed day filled in later"""
+    date = forms.DateField(required=False)
+    
+    class Meta:
+        model = DailyEntry
+        fields = ['date', 'mood', 'cravings', 'sober', 'trigger_avoided', 'support_used', 'notes']
+    
+    def clean_date(self):
+        date = self.cleaned_data.get('date') or timezone.localdate()
+        if date > timezone.localdate():
+            raise forms.ValidationError("You can't check in for a day that hasn't happened yet.")
+        return date
+
+
+class RecoveryGoalForm(forms.ModelForm):
+    class Meta:
+        model = RecoveryProgress
+        fields = ['goal_days']
+        labels = {'goal_days': 'Goal (days sober)'}
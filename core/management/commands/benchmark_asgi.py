@@ -0,0 +1,174 @@
+import asyncio
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import cycle, islice
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from blog.counters import get_view_buffer
+from blog.models import BlogPost, Category
+from core.benchmark import benchmark_database, create_posts
+from support.models import SupportTicket
+
+HOST = 'localhost'
+
+
+def wsgi_get(app, path, cookie):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': HOST,
+        'HTTP_COOKIE': cookie, 'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        'wsgi.run_once': False, 'wsgi.version': (1, 0),
+    }
+    status = []
+    result = app(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        b''.join(result)
+    finally:
+        result.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_get(app, path, cookie):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', HOST.encode()), (b'cookie', cookie.encode())],
+        'server': (HOST, 80), 'client': ('127.0.0.1', 50000),
+    }
+    received = False
+    status = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client never disconnects mid-request
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+def network_delay(seconds):
+    """An execute wrapper that waits like a round trip to a database server"""
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def summary(latencies, elapsed):
+    ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        'rps': len(ms) / elapsed,
+        'p50': statistics.median(ms),
+        'p99': ms[min(len(ms) - 1, int(len(ms) * 0.99))],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare WSGI and ASGI throughput of the read-heavy views at high concurrency on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000, help='Number of posts to create')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64],
+                            help='Requests in flight at once (WSGI threads / ASGI tasks)')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per measurement')
+        parser.add_argument('--query-latency', type=float, default=1.0,
+                            help='Milliseconds added to every query, as a network round trip to the database')
+
+    def handle(self, *args, **options):
+        settings = override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=[HOST],
+            # Measure the views, not the page cache or view-count writes
+            BLOG_PAGE_CACHE_TIMEOUT=0,
+            BLOG_VIEW_COUNT_FLUSH_INTERVAL=3600,
+            BLOG_VIEW_COUNT_MAX_PENDING=10 ** 9,
+        )
+        with benchmark_database(), settings:
+            self.stdout.write(f'Creating {options["posts"]} posts...')
+            author = create_posts(options['posts'])
+            for i in range(50):
+                SupportTicket.objects.create(user=author, subject=f'Ticket {i}', description='Benchmark ticket')
+            client = Client()
+            client.force_login(author)
+            signed_in = f'sessionid={client.cookies["sessionid"].value}'
+
+            category = Category.objects.first()
+            post = BlogPost.objects.filter(status='published').first()
+            paths = [
+                (reverse('blog:home'), ''),
+                (reverse('blog:list'), ''),
+                (reverse('blog:category', kwargs={'slug': category.slug}), ''),
+                (reverse('blog:detail', kwargs={'slug': post.slug}), ''),
+                (reverse('support:ticket_list'), signed_in),
+            ]
+            wsgi, asgi = get_wsgi_application(), get_asgi_application()
+
+            # Worker threads open their own connections
+            delay = network_delay(options['query_latency'] / 1000)
+            add_delay = lambda sender, connection, **kwargs: connection.execute_wrappers.append(delay)  # noqa: E731
+            connection_created.connect(add_delay, weak=False)
+            connection.execute_wrappers.append(delay)
+
+            self.stdout.write(f'{"concurrency":>12}{"":>6}{"req/s":>10}{"p50":>10}{"p99":>10}')
+            for concurrency in options['concurrency']:
+                requests = list(islice(cycle(paths), options['requests']))
+                for name, result in (
+                    ('wsgi', self.run_wsgi(wsgi, requests, concurrency)),
+                    ('asgi', asyncio.run(self.run_asgi(asgi, requests, concurrency))),
+                ):
+                    self.stdout.write(
+                        f'{concurrency:>12}{name:>6}{result["rps"]:>10.0f}'
+                        f'{result["p50"]:>8.2f}ms{result["p99"]:>8.2f}ms'
+                    )
+            connection_created.disconnect(add_delay)
+            connection.execute_wrappers.remove(delay)
+            # Write the buffered views while the throwaway database still exists
+            get_view_buffer().flush()
+
+    def run_wsgi(self, app, requests, concurrency):
+        def timed(request):
+            start = time.perf_counter()
+            status = wsgi_get(app, *request)
+            assert status == 200, (request, status)
+            return time.perf_counter() - start
+
+        # A threaded WSGI server: one request per worker thread at a time
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, requests[:len(requests) // 10]))
+            start = time.perf_counter()
+            latencies = list(pool.map(timed, requests))
+            return summary(latencies, time.perf_counter() - start)
+
+    async def run_asgi(self, app, requests, concurrency):
+        limit = asyncio.Semaphore(concurrency)
+
+        async def timed(request):
+            async with limit:
+                start = time.perf_counter()
+                status = await asgi_get(app, *request)
+                assert status == 200, (request, status)
+                return time.perf_counter() - start
+
+        await asyncio.gather(*(timed(request) for request in requests[:len(requests) // 10]))
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(timed(request) for request in requests))
+        return summary(latencies, time.perf_counter() - start)
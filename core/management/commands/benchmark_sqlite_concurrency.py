@@ -0,0 +1,144 @@
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from django.test import override_settings
+
+from core.sqlite import open_database
+
+# profile: (pragmas, connection options)
+PROFILES = {
+    # What Django and SQLite do out of the box
+    'default': ({'journal_mode': 'delete', 'synchronous': 'full'}, {'transaction_mode': None, 'timeout': 5}),
+    'production': (settings.SQLITE_PRAGMAS, settings.DATABASES['default'].get('OPTIONS', {})),
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Load-test concurrent readers and writers on a throwaway SQLite file, with and without the production profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Reader threads')
+        parser.add_argument('--writers', type=int, default=4, help='Writer threads')
+        parser.add_argument('--rows', type=int, default=10000, help='Rows in the test table')
+        parser.add_argument('--batch', type=int, default=20, help='Rows read and updated per write transaction')
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run')
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append', dest='profiles',
+                            help='Profile to run (repeatable; default all)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{options["readers"]} readers, {options["writers"]} writers, {options["seconds"]:g}s per profile'
+        )
+        self.stdout.write(
+            f'{"profile":<12}{"reads/s":>10}{"p50":>10}{"p99":>10}{"max":>10}{"writes/s":>10}{"locked":>8}'
+        )
+        for name in options['profiles'] or PROFILES:
+            pragmas, connection_options = PROFILES[name]
+            with tempfile.TemporaryDirectory() as directory, override_settings(SQLITE_PRAGMAS=pragmas):
+                path = os.path.join(directory, 'bench.sqlite3')
+                result = self.run_profile(path, connection_options, options)
+            self.stdout.write(
+                f'{name:<12}{result["reads"]:>10.0f}'
+                f'{result["p50"]:>8.2f}ms{result["p99"]:>8.2f}ms{result["max"]:>8.2f}ms'
+                f'{result["writes"]:>10.0f}{result["locked"]:>8}'
+            )
+
+    def setup(self, path, connection_options, rows):
+        db = open_database(path, **connection_options)
+        with db.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL, note TEXT NOT NULL)')
+            cursor.executemany(
+                'INSERT INTO counter (id, value, note) VALUES (%s, 0, %s)',
+                [(pk, 'x' * 200) for pk in range(1, rows + 1)],
+            )
+        db.close()
+
+    def run_profile(self, path, connection_options, options):
+        self.setup(path, connection_options, options['rows'])
+        stop = threading.Event()
+        latencies, writes, locked = [], [0], [0]
+        lock = threading.Lock()
+
+        def reader(seed):
+            rng = random.Random(seed)
+            db = open_database(path, **connection_options)
+            timings = []
+            try:
+                while not stop.is_set():
+                    low = rng.randint(1, options['rows'])
+                    start = time.perf_counter()
+                    try:
+                        with db.cursor() as cursor:
+                            cursor.execute(
+                                'SELECT COUNT(*), SUM(value) FROM counter WHERE id BETWEEN %s AND %s',
+                                [low, low + 500],
+                            )
+                            cursor.fetchone()
+                    except OperationalError:
+                        with lock:
+                            locked[0] += 1
+                    timings.append(time.perf_counter() - start)
+            finally:
+                db.close()
+                with lock:
+                    latencies.extend(timings)
+
+        def writer(seed):
+            rng = random.Random(seed)
+            db = open_database(path, **connection_options)
+            try:
+                while not stop.is_set():
+                    ids = rng.sample(range(1, options['rows'] + 1), options['batch'])
+                    try:
+                        db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                        with db.cursor() as cursor:
+                            # Read, then write: a deferred transaction has to
+                            # upgrade its read lock here
+                            for pk in ids:
+                                cursor.execute('SELECT value FROM counter WHERE id = %s', [pk])
+                                value = cursor.fetchone()[0]
+                                cursor.execute('UPDATE counter SET value = %s WHERE id = %s', [value + 1, pk])
+                        db.commit()
+                        with lock:
+                            writes[0] += 1
+                    except OperationalError:
+                        db.rollback()
+                        with lock:
+                            locked[0] += 1
+                    finally:
+                        db.set_autocommit(True)
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=reader, args=(n,)) for n in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(1000 + n,)) for n in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        ms = [latency * 1000 for latency in latencies]
+        return {
+            'reads': len(ms) / options['seconds'],
+            'p50': statistics.median(ms) if ms else 0,
+            'p99': percentile(ms, 99),
+            'max': max(ms, default=0),
+            'writes': writes[0] / options['seconds'],
+            'locked': locked[0],
+        }
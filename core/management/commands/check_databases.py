@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+
+
+class Command(BaseCommand):
+    help = 'Connect to the primary and every replica and report how long a round trip takes'
+
+    def handle(self, *args, **options):
+        failed = []
+        for alias in connections:
+            connection = connections[alias]
+            start = time.perf_counter()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+            except DatabaseError as error:
+                failed.append(alias)
+                self.stdout.write(self.style.ERROR(f'{alias:<12} FAILED  {error}'))
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stdout.write(f'{alias:<12} ok  {connection.vendor} {elapsed:.1f}ms')
+        if failed:
+            raise CommandError(f'Unavailable: {", ".join(failed)}')
@@ -0,0 +1,121 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from blog.comments import comment_page_queryset
+from blog.models import BlogPost, Category
+from core.models import DailyEntry, EntryRollup, RecoveryProgress
+from core.pagination import CursorPaginator, encode_cursor
+from support import triage
+from support.ids import new_ticket_id
+from support.models import SupportTicket
+
+# A table read row by row: SQLite's "SCAN <table>" without an index, or a
+# PostgreSQL sequential scan
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (\w+)$'),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)'),
+}
+SORT_PATTERNS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (?:ORDER|GROUP) BY'),
+    'postgresql': re.compile(r'\bSort\b'),
+}
+
+
+def view_querysets():
+    """The main queries each view runs, as ``(view, description, queryset)``.
+
+    Ids and cursors are placeholders: only the shape of the query matters.
+    """
+    cursor = encode_cursor(timezone.now(), 1)
+    ticket_id = new_ticket_id()
+    published = BlogPost.objects.filter(status='published').select_related('author', 'category').defer('content')
+    in_category = published.filter(category=1)
+    category_page = published.filter(category__slug='recovery')
+    mine = BlogPost.objects.filter(author=1).select_related('category').defer('content')
+    tickets = SupportTicket.objects.filter(user=1).select_related('assigned_to')
+
+    def page(queryset, per_page, cursor=None):
+        return CursorPaginator(queryset, per_page).window(cursor)[1]
+
+    yield 'home', 'featured posts', published.filter(is_featured=True).order_by('-created_at')[:3]
+    yield 'blog:home', 'recent posts', published[:9]
+    yield 'blog:home', 'popular posts', published.order_by('-likes_count', '-views_count')[:3]
+    yield 'blog:home', 'categories', Category.objects.annotate(
+        post_count=Count('posts', filter=Q(posts__status='published'))
+    ).filter(post_count__gt=0)
+    yield 'blog:list', 'first page', page(published, 6)
+    yield 'blog:list', 'later page', page(published, 6, cursor)
+    yield 'blog:list', 'total', published.order_by().values('pk')
+    yield 'blog:list', 'category filter', page(in_category, 6, cursor)
+    yield 'blog:category', 'later page', page(category_page, 6, cursor)
+    yield 'blog:category', 'total', category_page.order_by().values('pk')
+    yield 'blog:detail', 'post', BlogPost.objects.select_related('author', 'category').filter(slug='post')
+    yield 'blog:detail', 'comment threads', comment_page_queryset(1, cursor)
+    yield 'blog:detail', 'related posts', in_category.exclude(id=1)[:3]
+    yield 'blog:my_posts', 'later page', page(mine, 10, cursor)
+    yield 'support:ticket_list', 'later page', page(tickets, 10, cursor)
+    for field in ('status', 'category', 'priority'):
+        yield 'support:ticket_list', f'{field} filter', page(tickets.filter(**{field: 'open'}), 10, cursor)
+    yield 'support:ticket_list', 'total', tickets.order_by().values('pk')
+    yield 'support:ticket_list', 'ticket id search', tickets.filter(ticket_id=ticket_id)
+    yield 'admin:support_supportticket_changelist', 'email search', SupportTicket.objects.filter(user__email='a@example.com')
+    yield 'support:ticket_detail', 'ticket', SupportTicket.objects.filter(ticket_id=ticket_id)
+    yield 'support:triage', 'unclaimed queue', triage.unclaimed_queue().select_related('user')[:25]
+    yield 'support:triage', "agent's queue", triage.agent_queue(1).select_related('user')[:25]
+    today = timezone.localdate()
+    yield 'recovery_tracking', 'progress', RecoveryProgress.objects.filter(user=1)
+    yield 'recovery_tracking', 'rollups', EntryRollup.objects.filter(user=1).filter(
+        Q(period='week', start__gte=today) | Q(period='month', start__gte=today)
+    )
+    yield 'recovery_tracking', 'recent entries', DailyEntry.objects.filter(user=1).order_by('-date')[:5]
+    yield 'recovery_history', 'later page', DailyEntry.objects.filter(user=1, date__lt=today).order_by('-date')[:31]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the main query of each view and fail if any of them scans a whole table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to check')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        connection = connections[using]
+        if connection.vendor not in FULL_SCAN_PATTERNS:
+            raise CommandError(f'Query plans can only be checked on SQLite or PostgreSQL, not {connection.vendor}')
+        full_scan = FULL_SCAN_PATTERNS[connection.vendor]
+        sort = SORT_PATTERNS[connection.vendor]
+
+        failures = []
+        for view, description, queryset in view_querysets():
+            plan = self.explain(queryset.using(using), connection)
+            scanned = [match.group(1) for match in map(full_scan.search, plan.splitlines()) if match]
+            label = f'{view} ({description})'
+
+            if scanned:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {label}: {", ".join(scanned)}'))
+            elif sort.search(plan):
+                self.stdout.write(self.style.WARNING(f'SORTED     {label}'))
+            else:
+                self.stdout.write(f'ok         {label}')
+            if options['verbose_plans'] or scanned:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+
+        if failures:
+            raise CommandError(f'{len(failures)} queries scan a whole table: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Every view query uses an index'))
+
+    def explain(self, queryset, connection):
+        if connection.vendor == 'postgresql':
+            # Small tables make PostgreSQL prefer sequential scans even when an
+            # index fits, so only report scans no index can replace
+            with transaction.atomic(using=queryset.db):
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
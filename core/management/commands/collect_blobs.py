@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from core import blobs
+from core.storage import BlobStorage
+
+
+class Command(BaseCommand):
+    help = 'Delete stored blobs nothing has referenced for the grace period, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=None,
+            help='Keep unreferenced blobs this long (default BLOB_GC_GRACE_HOURS)',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Blobs deleted per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+        parser.add_argument('--recount', action='store_true', help='Rebuild every reference count from the database first')
+        parser.add_argument('--untracked', action='store_true', help='Also delete blob files on disk that have no Blob row')
+        parser.add_argument(
+            '--adopt',
+            action='store_true',
+            help='First move files saved before blobs existed into the blob store',
+        )
+        parser.add_argument(
+            '--editor-path',
+            default='uploads/',
+            help='Where CKEditor uploads used to be stored, for --adopt',
+        )
+
+    def handle(self, *args, **options):
+        grace = timedelta(hours=options['grace_hours']) if options['grace_hours'] is not None else None
+        batch_size = options['batch_size']
+
+        if options['adopt'] and not options['dry_run']:
+            moved = blobs.adopt_legacy_files(options['editor_path'], batch_size=batch_size)
+            self.stdout.write(f'Moved {moved} legacy files into the blob store')
+        if options['recount'] and not options['dry_run']:
+            blobs.recount_references(batch_size=batch_size)
+            self.stdout.write('Recounted blob references')
+
+        collected, freed = blobs.collect_garbage(grace, batch_size=batch_size, dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {collected} unreferenced blobs ({filesizeformat(freed)})'))
+
+        if options['untracked']:
+            names = blobs.untracked_files(grace)
+            if not options['dry_run']:
+                storage = BlobStorage()
+                for name in names:
+                    storage.delete_blob(name)
+            self.stdout.write(self.style.SUCCESS(f'{verb} {len(names)} untracked blob files'))
@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import exports
+from core.models import DailyEntry
+
+
+def _init_worker():
+    import django
+
+    # Already set up in forked workers; spawned ones start from scratch
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = "Export users' recovery check-ins as CSV, JSONL or columnar JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='User id to export (repeatable)')
+        parser.add_argument('--all', action='store_true', help='Export every user with check-ins')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument(
+            '--output', default='-',
+            help='Directory for one file per user, or "-" to write a single user to stdout',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes for directory exports; 0 exports in this process',
+        )
+        parser.add_argument('--chunk-size', type=int, default=None, help='Entries read and written per chunk')
+
+    def handle(self, *args, **options):
+        fmt, output, size = options['format'], options['output'], options['chunk_size']
+        if options['all']:
+            user_ids = DailyEntry.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        elif options['users']:
+            user_ids = options['users']
+        else:
+            raise CommandError('Pass --user or --all')
+
+        if output == '-':
+            if options['all'] or len(user_ids) != 1:
+                raise CommandError('Only a single --user can be written to stdout; pass --output DIR')
+            for chunk in exports.export_entries(user_ids[0], fmt, size):
+                self.stdout.write(chunk, ending='')
+            return
+
+        os.makedirs(output, exist_ok=True)
+        user_ids = list(user_ids)
+        total = 0
+        if options['workers'] <= 0:
+            for user_id in user_ids:
+                total += exports.export_to_file(user_id, fmt, output, size)[1]
+        else:
+            # Workers open their own connections; don't hand them ours
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+                futures = [pool.submit(exports.export_to_file, user_id, fmt, output, size) for user_id in user_ids]
+                for future in as_completed(futures):
+                    total += future.result()[1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {len(user_ids)} users ({total} bytes) to {output}'
+        ))
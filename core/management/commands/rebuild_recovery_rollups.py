@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core import tracking
+from core.models import DailyEntry
+
+
+class Command(BaseCommand):
+    help = 'Recompute weekly and monthly recovery rollups and streaks from daily entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        user_ids = options['users'] or (
+            DailyEntry.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        )
+        total = 0
+        for user_id in user_ids:
+            tracking.rebuild(user_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt recovery rollups for {total} users'))
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the SQLite primary into the SQLite replica files, for trying '
+        'replica routing locally (e.g. NOVITA_DATABASE_REPLICAS=replica.sqlite3)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help='Keep copying every this many seconds, like a lagging replica')
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        replicas = [connections[alias] for alias in settings.DATABASE_REPLICAS]
+        if primary.vendor != 'sqlite' or any(replica.vendor != 'sqlite' for replica in replicas):
+            raise CommandError('Only SQLite primaries and replicas can be copied')
+        if not replicas:
+            raise CommandError('No replicas configured; set NOVITA_DATABASE_REPLICAS')
+
+        while True:
+            primary.ensure_connection()
+            for replica in replicas:
+                replica.ensure_connection()
+                # The backup API copies a consistent snapshot page by page
+                primary.connection.backup(replica.connection)
+                self.stdout.write(f'Copied {primary.settings_dict["NAME"]} to {replica.settings_dict["NAME"]}')
+            if not options['every']:
+                return
+            time.sleep(options['every'])
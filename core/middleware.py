@@ -0,0 +1,51 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .routers import PIN_COOKIE, request_routing
+
+
+class ReplicaRoutingMiddleware:
+    """Route each request's reads between the primary and the read replicas.
+
+    Visitors without a session cookie count as anonymous and read
+    everything from replicas. A response to a request that wrote sets a
+    cookie that keeps the visitor's reads on the primary for
+    ``REPLICA_STICKY_SECONDS``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        with request_routing(*self.routing(request)) as state:
+            response = self.get_response(request)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        # The ORM's worker threads run in a copy of this context, so they see the state
+        with request_routing(*self.routing(request)) as state:
+            response = await self.get_response(request)
+        return self.pin(state, response)
+
+    def routing(self, request):
+        # Judged by the cookie so the session and user are only loaded if the view needs them
+        anonymous = settings.SESSION_COOKIE_NAME not in request.COOKIES
+        return anonymous, PIN_COOKIE in request.COOKIES
+
+    def pin(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:48
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_blobs'),
+        ('user', '0002_remove_customuser_first_name_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecoveryProgress',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recovery_progress', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('checkins', models.PositiveIntegerField(default=0)),
+                ('first_entry_date', models.DateField(blank=True, null=True)),
+                ('last_relapse_date', models.DateField(blank=True, null=True)),
+                ('longest_streak', models.PositiveIntegerField(default=0)),
+                ('goal_days', models.PositiveIntegerField(default=90, validators=[django.core.validators.MinValueValidator(1)])),
+            ],
+            options={
+                'verbose_name_plural': 'Recovery progress',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('mood', models.PositiveSmallIntegerField(choices=[(3, 'Great'), (2, 'Okay'), (1, 'Struggling')])),
+                ('cravings', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(10)])),
+                ('sober', models.BooleanField(default=True)),
+                ('trigger_avoided', models.BooleanField(default=False)),
+                ('support_used', models.BooleanField(default=False)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily entries',
+                'ordering': ['-date'],
+                'indexes': [models.Index(condition=models.Q(('sober', False)), fields=['user', 'date'], name='daily_entry_relapse_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_entry')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EntryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('start', models.DateField()),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('sober_days', models.PositiveIntegerField(default=0)),
+                ('good_days', models.PositiveIntegerField(default=0)),
+                ('challenging_days', models.PositiveIntegerField(default=0)),
+                ('triggers_avoided', models.PositiveIntegerField(default=0)),
+                ('support_used', models.PositiveIntegerField(default=0)),
+                ('mood_total', models.PositiveIntegerField(default=0)),
+                ('cravings_total', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='entry_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'start'), name='unique_entry_rollup')],
+            },
+        ),
+    ]
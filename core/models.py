@@ -1,2 +1,152 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Blob(models.Model):
+    """A stored file, named by the SHA-256 of its contents (see core.storage)"""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField()
+    source = models.CharField(max_length=30, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    # Kept up to date by core.blobs; collect_blobs deletes blobs whose count
+    # has been zero for longer than BLOB_GC_GRACE_HOURS
+    ref_count = models.PositiveIntegerField(default=0)
+    unreferenced_since = models.DateTimeField(null=True, blank=True, default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['unreferenced_since'], condition=Q(ref_count=0), name='blob_unreferenced_idx'),
+            models.Index(fields=['source', '-created_at'], name='blob_source_created_idx'),
+        ]
+    
+    def __str__(self):
+        return self.name
+
+
+class BlobReference(models.Model):
+    """One field of one row pointing at a blob"""
+    blob = models.ForeignKey(Blob, on_delete=models.CASCADE, related_name='references')
+    owner_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    owner_id = models.CharField(max_length=40)
+    field = models.CharField(max_length=50)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner_type', 'owner_id', 'field', 'blob'], name='unique_blob_reference'),
+        ]
+    
+    def __str__(self):
+        return f"{self.owner_type.model} {self.owner_id}.{self.field} -> {self.blob.name}"
+
+
+class DailyEntry(models.Model):
+    """A user's recovery check-in for one day"""
+    MOOD_CHOICES = [
+        (3, 'Great'),
+        (2, 'Okay'),
+        (1, 'Struggling'),
+    ]
+    
+    # The (user, date) unique index serves every per-user lookup
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_entries', db_index=False)
+    date = models.DateField()
+    mood = models.PositiveSmallIntegerField(choices=MOOD_CHOICES)
+    cravings = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(10)])
+    sober = models.BooleanField(default=True)
+    trigger_avoided = models.BooleanField(default=False)
+    support_used = models.BooleanField(default=False)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'Daily entries'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_entry'),
+        ]
+        indexes = [
+            # Relapse days, read when a back-dated entry changes the streaks
+            models.Index(fields=['user', 'date'], condition=Q(sober=False), name='daily_entry_relapse_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} on {self.date}"
+
+
+class EntryRollup(models.Model):
+    """Running totals of a user's entries for one week or month (see core.tracking)"""
+    PERIOD_CHOICES = [
+        ('week', 'Week'),
+        ('month', 'Month'),
+    ]
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='entry_rollups', db_index=False)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    # Monday of the week, or the first of the month
+    start = models.DateField()
+    entries = models.PositiveIntegerField(default=0)
+    sober_days = models.PositiveIntegerField(default=0)
+    good_days = models.PositiveIntegerField(default=0)
+    challenging_days = models.PositiveIntegerField(default=0)
+    triggers_avoided = models.PositiveIntegerField(default=0)
+    support_used = models.PositiveIntegerField(default=0)
+    mood_total = models.PositiveIntegerField(default=0)
+    cravings_total = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'start'], name='unique_entry_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} {self.period} of {self.start}"
+    
+    @property
+    def average_mood(self):
+        return round(self.mood_total / self.entries, 1) if self.entries else None
+    
+    @property
+    def average_cravings(self):
+        return round(self.cravings_total / self.entries, 1) if self.entries else None
+
 
+class RecoveryProgress(models.Model):
+    """A user's streak state, kept up to date with their entries (see core.tracking)"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='recovery_progress')
+    checkins = models.PositiveIntegerField(default=0)
+    first_entry_date = models.DateField(null=True, blank=True)
+    last_relapse_date = models.DateField(null=True, blank=True)
+    # Longest sober run that ended with a relapse; the current run is worked
+    # out from the dates
+    longest_streak = models.PositiveIntegerField(default=0)
+    goal_days = models.PositiveIntegerField(default=90, validators=[MinValueValidator(1)])
+    
+    class Meta:
+        verbose_name_plural = 'Recovery progress'
+    
+    def __str__(self):
+        return f"Recovery progress of {self.user}"
+    
+    @property
+    def sober_since(self):
+        if self.last_relapse_date:
+            return self.last_relapse_date + timedelta(days=1)
+        return self.first_entry_date
+    
+    def days_sober(self, today):
+        since = self.sober_since
+        if since is None or since > today:
+            return 0
+        return (today - since).days + 1
+    
+    def best_streak(self, today):
+        return max(self.longest_streak, self.days_sober(today))
@@ -0,0 +1,202 @@
+"""
+Keyset (cursor) pagination.
+
+``CursorPaginator`` pages a queryset newest first on ``(created_at, id)``.
+Each page is one indexed range query, ``WHERE (created_at, id) < cursor ORDER
+BY created_at DESC, id DESC LIMIT n + 1``, so page 500 costs the same as page 1
+and no ``COUNT(*)`` or ``OFFSET`` is needed. Cursors are opaque strings that
+are safe to put in a URL, and the same pages can back a JSON API.
+
+Totals for "N posts" labels come from ``cached_count``, which recounts at
+most once per ``PAGINATION_COUNT_CACHE_TIMEOUT`` seconds.
+"""
+import asyncio
+import base64
+import hashlib
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.query import QuerySet
+
+from .aio import alist
+
+
+def encode_cursor(created_at, pk, direction='n'):
+    value = f'{direction}|{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, created_at, pk)``, or ``None`` for a bad cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        if direction not in ('n', 'p'):
+            return None
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def count_timeout(timeout=None):
+    if timeout is None:
+        return getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 60)
+    return timeout
+
+
+def count_key(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    return 'pagination:count:' + hashlib.md5(f'{queryset.db}:{sql}:{params}'.encode()).hexdigest()
+
+
+def cached_count(queryset, timeout=None):
+    """Count a queryset, reusing the result for a short while"""
+    if not isinstance(queryset, QuerySet):
+        return len(queryset)
+    key = count_key(queryset)
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, count_timeout(timeout))
+    return total
+
+
+async def acached_count(queryset, timeout=None):
+    key = count_key(queryset)
+    total = await cache.aget(key)
+    if total is None:
+        total = await queryset.acount()
+        await cache.aset(key, total, count_timeout(timeout))
+    return total
+
+
+class CursorPage:
+    """One page of results with cursors to its neighbours"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Page a queryset newest first by ``(created_at, pk)``"""
+
+    def __init__(self, queryset, per_page, count=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count = count
+
+    def window(self, cursor=None):
+        """Return ``(position, queryset)``: the cursor and the query for its page"""
+        position = decode_cursor(cursor) if cursor else None
+        queryset = self.queryset
+        direction = position[0] if position else 'n'
+
+        if position:
+            _, created_at, pk = position
+            if direction == 'n':
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+                )
+
+        if direction == 'n':
+            queryset = queryset.order_by('-created_at', '-pk')
+        else:
+            queryset = queryset.order_by('created_at', 'pk')
+        return position, queryset[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        position, queryset = self.window(cursor)
+        total = cached_count(self.queryset) if self.count else None
+        return self.build_page(position, list(queryset), total)
+
+    async def apage(self, cursor=None):
+        position, queryset = self.window(cursor)
+        if self.count:
+            rows, total = await asyncio.gather(alist(queryset), acached_count(self.queryset))
+        else:
+            rows, total = await alist(queryset), None
+        return self.build_page(position, rows, total)
+
+    def build_page(self, position, rows, total):
+        direction = position[0] if position else 'n'
+
+        # The window holds one extra row to tell whether there is another page
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'p':
+            rows.reverse()
+
+        if direction == 'n':
+            has_next, has_previous = has_more, position is not None
+        else:
+            has_next, has_previous = True, has_more
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk, 'n')
+        if rows and has_previous:
+            previous_cursor = encode_cursor(rows[0].created_at, rows[0].pk, 'p')
+        return CursorPage(rows, next_cursor, previous_cursor, total)
+
+
+class SequencePaginator:
+    """Cursor-style paging over an in-memory ranked sequence, such as search hits.
+
+    The cursor is a position in the sequence; slicing only loads that page.
+    """
+
+    def __init__(self, sequence, per_page, count=False):
+        self.sequence = sequence
+        self.per_page = per_page
+        self.count = count
+
+    def page(self, cursor=None):
+        try:
+            start = max(0, int(cursor)) if cursor else 0
+        except ValueError:
+            start = 0
+        total = len(self.sequence)
+        rows = list(self.sequence[start:start + self.per_page])
+        next_cursor = str(start + self.per_page) if start + self.per_page < total else None
+        previous_cursor = str(max(0, start - self.per_page)) if start > 0 else None
+        return CursorPage(rows, next_cursor, previous_cursor, total if self.count else None)
+
+
+def paginate(object_list, per_page, cursor=None, count=True):
+    """Return a ``CursorPage`` for a queryset or a ranked sequence"""
+    if isinstance(object_list, QuerySet):
+        return CursorPaginator(object_list, per_page, count=count).page(cursor)
+    return SequencePaginator(object_list, per_page, count=count).page(cursor)
+
+
+async def apaginate(object_list, per_page, cursor=None, count=True):
+    """``paginate`` for async views"""
+    if isinstance(object_list, QuerySet):
+        return await CursorPaginator(object_list, per_page, count=count).apage(cursor)
+    # Ranked sequences (search hits) load their rows with the sync ORM
+    return await sync_to_async(paginate)(object_list, per_page, cursor, count)
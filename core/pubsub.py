@@ -0,0 +1,165 @@
+"""
+Wake-up notifications for long-lived async requests.
+
+``subscribe(channel)`` gives an async view something to wait on without
+holding a thread or polling the database, and ``publish(channel)`` wakes
+every subscriber of the channel. Notifications carry no data: a woken
+subscriber reads what changed from the database, so several notifications
+arriving together cost one read and nothing published between two reads is
+lost.
+
+``PUBSUB_BACKEND`` picks how far a notification reaches:
+
+* ``'local'`` wakes subscribers in this process only, which fits a single
+  ASGI worker.
+* ``'redis'`` publishes through Redis at ``PUBSUB_REDIS_URL``. One listener
+  thread per process hands the notifications to its local subscribers.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, loop):
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def notify(self):
+        # Publishers run on request threads, not on the subscriber's loop
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # The loop has closed; the subscription is going away
+            pass
+
+    async def wait(self, timeout=None):
+        """Wait for a notification; ``False`` if ``timeout`` seconds pass first"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except TimeoutError:
+            return False
+        self._event.clear()
+        return True
+
+
+class LocalBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+
+    def publish(self, channel):
+        self.deliver(channel)
+
+    def deliver(self, channel):
+        """Wake this process's subscribers of ``channel`` and return how many there were"""
+        with self._lock:
+            subscriptions = list(self._channels.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.notify()
+        return len(subscriptions)
+
+    def deliver_all(self):
+        with self._lock:
+            channels = list(self._channels)
+        for channel in channels:
+            self.deliver(channel)
+
+    def subscribers(self, channel):
+        with self._lock:
+            return len(self._channels.get(channel, ()))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._channels[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscriptions = self._channels[channel]
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._channels[channel]
+
+
+class RedisBroker(LocalBroker):
+    prefix = 'novita:'
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self._client = None
+        self._listener = None
+
+    def client(self):
+        if self._client is None:
+            import redis
+
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    def publish(self, channel):
+        try:
+            self.client().publish(self.prefix + channel, b'')
+        except Exception:
+            logger.exception('Could not publish to %s through Redis', channel)
+            # Reach this process's subscribers at least
+            self.deliver(channel)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='pubsub-listener', daemon=True)
+                self._listener.start()
+        async with super().subscribe(channel) as subscription:
+            yield subscription
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client().pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + '*')
+                # Anything published while disconnected was missed: everyone re-reads
+                self.deliver_all()
+                for message in pubsub.listen():
+                    self.deliver(message['channel'].decode()[len(self.prefix):])
+            except Exception:
+                logger.warning('Lost the Redis pub/sub connection, reconnecting', exc_info=True)
+                time.sleep(1)
+
+
+_broker = None
+_setup_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _setup_lock:
+            if _broker is None:
+                backend = getattr(settings, 'PUBSUB_BACKEND', 'local')
+                if backend == 'redis':
+                    _broker = RedisBroker(settings.PUBSUB_REDIS_URL)
+                else:
+                    _broker = LocalBroker()
+    return _broker
+
+
+def publish(channel):
+    """Wake the subscribers of ``channel``"""
+    get_broker().publish(channel)
+
+
+def subscribe(channel):
+    """``async with subscribe(channel) as subscription: await subscription.wait(timeout)``"""
+    return get_broker().subscribe(channel)
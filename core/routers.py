@@ -0,0 +1,99 @@
+"""
+Read replica routing.
+
+``DATABASE_REPLICAS`` (built in the settings from NOVITA_DATABASE_REPLICAS)
+names read-only copies of ``default``. While a request is being handled,
+reads of ``REPLICA_READ_APPS`` models, and every read made for a visitor
+without a session, go to a random replica; other reads and all writes use
+``default``.
+
+Replicas lag behind, so a request that writes reads from ``default`` from
+then on, and ``ReplicaRoutingMiddleware`` gives the visitor a cookie that
+keeps them on ``default`` for ``REPLICA_STICKY_SECONDS``: they see their own
+changes on the next pages too. Reads inside a transaction and reads outside
+requests (commands, background threads) always use ``default``.
+
+A replica that can't be connected to is left out for
+``REPLICA_RETRY_SECONDS``.
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'db_primary'
+# Writes that say nothing about what the visitor reads next
+UNTRACKED_APPS = {'sessions'}
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+_down_until = {}
+
+
+class RequestRouting:
+    def __init__(self, anonymous=False, pinned=False):
+        self.anonymous = anonymous
+        self.pinned = pinned
+        self.wrote = False
+
+
+@contextmanager
+def request_routing(anonymous=False, pinned=False):
+    """Route the reads made inside the block as for one request"""
+    state = RequestRouting(anonymous, pinned)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def pick_replica():
+    """A random replica that accepts connections, or ``None``"""
+    now = time.monotonic()
+    candidates = [alias for alias in settings.DATABASE_REPLICAS if _down_until.get(alias, 0) <= now]
+    random.shuffle(candidates)
+    for alias in candidates:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Replica %s is unavailable, reading from default', alias, exc_info=True)
+            _down_until[alias] = now + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+            continue
+        return alias
+    return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not settings.DATABASE_REPLICAS:
+            return None
+        if state.pinned or state.wrote or connections['default'].in_atomic_block:
+            return 'default'
+        if state.anonymous or model._meta.app_label in settings.REPLICA_READ_APPS:
+            return pick_replica() or 'default'
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None and model._meta.app_label not in UNTRACKED_APPS:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
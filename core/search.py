@@ -0,0 +1,50 @@
+"""
+Pieces shared by the full-text search modules (``blog.search``,
+``support.search``).
+"""
+import re
+
+from django.utils.functional import cached_property
+
+MAX_TERMS = 10
+
+
+def search_terms(query):
+    """Split a user query into plain word tokens"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+class SearchResults:
+    """Ranked search hits that load their rows one page at a time.
+
+    Behaves like the sliced queryset ``Paginator`` expects: ``count()`` is the
+    number of hits and slicing loads just those rows, in rank order.
+    """
+
+    def __init__(self, queryset, ranked_ids):
+        self.queryset = queryset
+        self.ranked_ids = ranked_ids
+
+    @cached_property
+    def ids(self):
+        # Drop hits the queryset filters out (drafts, other users' tickets, ...)
+        if not self.ranked_ids:
+            return []
+        visible = set(self.queryset.filter(pk__in=self.ranked_ids).values_list('pk', flat=True))
+        return [pk for pk in self.ranked_ids if pk in visible]
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            ids = self.ids[key]
+            rows = self.queryset.in_bulk(ids)
+            return [rows[pk] for pk in ids if pk in rows]
+        return self[key:key + 1 if key != -1 else None][0]
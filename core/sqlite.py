@@ -0,0 +1,56 @@
+"""
+SQLite connection tuning.
+
+``apply_pragmas`` runs on every new SQLite connection (it is connected to
+``connection_created`` in ``CoreConfig.ready``) and sets the
+``SQLITE_PRAGMAS`` from the settings. The production profile there puts the
+database in WAL mode, so readers keep reading the last committed state while
+a writer works instead of waiting for its lock, and relaxes fsyncs to
+``synchronous=NORMAL``, which is still crash-safe in WAL mode.
+
+Writers start their transactions ``IMMEDIATE`` (the ``transaction_mode``
+database option): they queue for the write lock up front, for up to
+``busy_timeout`` milliseconds, rather than failing with "database is locked"
+when a read lock can't be upgraded halfway through.
+"""
+from django.conf import settings
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+
+
+def current_pragmas(connection, names):
+    """Read pragmas back, e.g. to check a connection's settings"""
+    values = {}
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+    return values
+
+
+def open_database(name, **options):
+    """A new, unshared Django connection to the SQLite file ``name``.
+
+    Used by the concurrency benchmark and tests, which need several
+    connections to one file database at once.
+    """
+    from django.db import connections
+    from django.db.backends.sqlite3.base import DatabaseWrapper
+
+    settings_dict = {**connections['default'].settings_dict, 'NAME': str(name)}
+    settings_dict['OPTIONS'] = {**settings_dict.get('OPTIONS', {}), **options}
+    return DatabaseWrapper(settings_dict, alias=f'sqlite:{name}')
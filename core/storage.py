@@ -0,0 +1,169 @@
+"""
+Content-addressed file storage.
+
+``BlobStorage`` files every upload under the SHA-256 of its bytes
+(``blobs/ab/cd/<sha256>.<ext>``), whatever name it was saved under, so the
+same screenshot pasted ten times or attached to three tickets is stored once.
+Each stored file is recorded as a ``core.Blob`` whose ``ref_count`` tracks
+the rows pointing at it (see ``core.blobs``).
+
+Deleting a blob name through the storage does nothing: several rows may
+share it, so ``manage.py collect_blobs`` removes blobs in batches once
+nothing has referenced them for ``BLOB_GC_GRACE_HOURS``. Files stored under
+other names before blobs existed are deleted as usual.
+
+``EditorBlobStorage`` is the CKEditor flavour: it keeps CKEditor's
+``*_thumb`` thumbnails next to their blob and lists editor uploads for the
+image browser.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+BLOB_NAME_RE = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?P<thumb>_thumb)?(?P<ext>\.[a-z0-9]+)?$')
+READ_SIZE = 64 * 1024
+
+
+class DigestMismatch(ValueError):
+    """Content passed with a ``sha256`` that isn't the digest of its bytes"""
+
+
+def blob_name(digest, filename=''):
+    ext = os.path.splitext(filename)[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,10}', ext):
+        ext = ''
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+def parse_blob_name(name):
+    """The match for a blob (or blob thumbnail) name, or ``None``"""
+    return BLOB_NAME_RE.match(name or '')
+
+
+def digest_of(name):
+    match = parse_blob_name(name)
+    return match['digest'] if match else ''
+
+
+def hash_content(content):
+    hasher = hashlib.sha256()
+    size = 0
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(READ_SIZE):
+        hasher.update(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    def __init__(self, source='', **kwargs):
+        # Which kind of upload first stored a blob; the editor's browser lists its own
+        self.source = source
+        super().__init__(**kwargs)
+
+    def get_available_name(self, name, max_length=None):
+        # The real name is only known once the content is hashed, and equal
+        # names mean equal bytes
+        return name
+
+    def _save(self, name, content):
+        from .blobs import register
+
+        # Callers that hashed while receiving the file pass it along. It names
+        # the blob, so it is checked against the bytes before it is trusted
+        expected = getattr(content, 'sha256', None)
+        if expected:
+            digest, size = expected, content.size
+        else:
+            digest, size = hash_content(content)
+        name = blob_name(digest, name)
+        # Registering first resets the grace period, so a collection running
+        # now won't delete the file we're about to reuse
+        register(name, digest, size, source=self.source)
+        if not self.exists(name):
+            self._write(name, content, digest=expected)
+        elif expected and hash_content(content)[0] != expected:
+            raise DigestMismatch(f'The content saved as {name} has a different digest')
+        return name
+
+    def _write(self, name, content, digest=None):
+        """Write ``content`` to ``name`` atomically, replacing any partial copy.
+
+        With ``digest``, the written bytes must hash to it or nothing is stored.
+        """
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.incoming-')
+        hasher = hashlib.sha256()
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                os.close(fd)
+                file_move_safe(content.temporary_file_path(), temp_path, allow_overwrite=True)
+                if digest:
+                    with open(temp_path, 'rb') as moved:
+                        for chunk in iter(lambda: moved.read(READ_SIZE), b''):
+                            hasher.update(chunk)
+            else:
+                with os.fdopen(fd, 'wb') as output:
+                    if hasattr(content, 'seek'):
+                        content.seek(0)
+                    for chunk in content.chunks(READ_SIZE):
+                        output.write(chunk)
+                        hasher.update(chunk)
+            if digest and hasher.hexdigest() != digest:
+                raise DigestMismatch(f'The content saved as {name} has a different digest')
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.chmod(full_path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+
+    def delete(self, name):
+        if parse_blob_name(name):
+            # Shared: collect_blobs deletes it once nothing refers to it
+            return
+        super().delete(name)
+
+    def delete_blob(self, name):
+        """Remove a blob and its thumbnail from disk; only for garbage collection"""
+        stem, ext = os.path.splitext(name)
+        for path in (name, f'{stem}_thumb{ext}'):
+            super().delete(path)
+
+
+@deconstructible
+class EditorBlobStorage(BlobStorage):
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'editor')
+        super().__init__(**kwargs)
+
+    def _save(self, name, content):
+        match = parse_blob_name(name)
+        if match and match['thumb']:
+            # CKEditor's thumbnail of a blob it just stored: derived from the
+            # blob, so it lives beside it and goes with it
+            self._write(name, content)
+            return name
+        return super()._save(name, content)
+
+    def listdir(self, path):
+        """The image browser walks the upload path: show editor uploads as one flat folder"""
+        from .models import Blob
+
+        if path.strip('/') != BLOB_DIR:
+            return [], []
+        names = Blob.objects.filter(source=self.source).order_by('-created_at').values_list('name', flat=True)
+        return [], [name[len(BLOB_DIR) + 1:] for name in names]
@@ -1,3 +1,437 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import OperationalError, connection
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import BlogPost, Category
+from support.models import SupportTicket
+
+from . import blobs, exports, routers, tracking
+from .middleware import ReplicaRoutingMiddleware
+from .sqlite import current_pragmas, open_database
+from .models import Blob, DailyEntry, EntryRollup, RecoveryProgress
+from .storage import BlobStorage, DigestMismatch, EditorBlobStorage, blob_name
+
+User = get_user_model()
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 8
+
+
+class QueryPlanTests(TestCase):
+    def test_view_queries_use_indexes(self):
+        # Raises CommandError if any view query scans a whole table
+        call_command('check_query_plans', stdout=StringIO())
+
+
+class SQLiteProfileTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'profile.sqlite3')
+
+    def connect(self, **options):
+        db = open_database(self.path, **options)
+        self.addCleanup(db.close)
+        return db
+
+    def hold_write_lock(self):
+        """Open a writer that has changed a row and hasn't committed"""
+        setup = self.connect()
+        with setup.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER)')
+            cursor.execute('INSERT INTO counter VALUES (1, 0)')
+        writer = self.connect()
+        with writer.cursor() as cursor:
+            # EXCLUSIVE is what a rollback-journal writer holds while it commits
+            cursor.execute('BEGIN EXCLUSIVE')
+            cursor.execute('UPDATE counter SET value = 1')
+        self.addCleanup(lambda: writer.cursor().execute('ROLLBACK'))
+
+    def read_value(self):
+        reader = self.connect(timeout=0)
+        with reader.cursor() as cursor:
+            cursor.execute('SELECT value FROM counter')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_to_new_connections(self):
+        db = self.connect()
+        self.assertEqual(
+            current_pragmas(db, ['journal_mode', 'synchronous', 'busy_timeout', 'cache_size']),
+            {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000, 'cache_size': -20000},
+        )
+        self.assertEqual(db.transaction_mode, 'IMMEDIATE')
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 0})
+    def test_readers_are_not_blocked_by_a_writer_in_wal_mode(self):
+        with override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal'}):
+            self.hold_write_lock()
+        # The reader sees the last committed value straight away
+        self.assertEqual(self.read_value(), 0)
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 0})
+    def test_readers_are_blocked_by_a_writer_without_wal(self):
+        with override_settings(SQLITE_PRAGMAS={'journal_mode': 'delete'}):
+            self.hold_write_lock()
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            self.read_value()
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.replica = mock.Mock()
+        patcher = mock.patch.object(routers, 'connections', {
+            'default': mock.Mock(in_atomic_block=False),
+            'replica1': self.replica,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(routers._down_until.clear)
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_are_routed_during_requests(self):
+        self.assertIsNone(self.router.db_for_read(BlogPost))
+        with routers.request_routing():
+            self.assertEqual(self.router.db_for_read(BlogPost), 'replica1')
+            self.assertEqual(self.router.db_for_read(SupportTicket), 'default')
+        with routers.request_routing(anonymous=True):
+            self.assertEqual(self.router.db_for_read(SupportTicket), 'replica1')
+        with routers.request_routing(pinned=True):
+            self.assertEqual(self.router.db_for_read(BlogPost), 'default')
+
+    def test_writes_keep_the_rest_of_the_request_on_the_primary(self):
+        with routers.request_routing(anonymous=True) as state:
+            self.assertEqual(self.router.db_for_write(Session), 'default')
+            self.assertEqual(self.router.db_for_read(BlogPost), 'replica1')
+            self.assertEqual(self.router.db_for_write(BlogPost), 'default')
+            self.assertEqual(self.router.db_for_read(BlogPost), 'default')
+        self.assertTrue(state.wrote)
+
+    def test_unavailable_replica_is_skipped(self):
+        self.replica.ensure_connection.side_effect = OperationalError('connection refused')
+        with routers.request_routing(), self.assertLogs('core.routers', 'WARNING'):
+            self.assertEqual(self.router.db_for_read(BlogPost), 'default')
+        with routers.request_routing():
+            self.assertEqual(self.router.db_for_read(BlogPost), 'default')
+        self.assertEqual(self.replica.ensure_connection.call_count, 1)
+
+    @override_settings(REPLICA_STICKY_SECONDS=15)
+    def test_middleware_pins_visitors_who_wrote(self):
+        def view(request):
+            states.append(routers._routing.get())
+            if request.method == 'POST':
+                self.router.db_for_write(BlogPost)
+            return HttpResponse()
+
+        states = []
+        middleware = ReplicaRoutingMiddleware(view)
+        request = RequestFactory().post('/')
+        response = middleware(request)
+        self.assertTrue(states[0].anonymous)
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], 15)
+
+        request = RequestFactory().get('/', HTTP_COOKIE=f'{routers.PIN_COOKIE}=1')
+        response = middleware(request)
+        self.assertTrue(states[1].pinned)
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+
+@override_settings(BLOG_IMAGE_WORKERS=0)
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.storage = EditorBlobStorage()
+        self.author = User.objects.create_user('author@example.com')
+        self.category = Category.objects.create(name='Recovery')
+
+    def create_post(self, content='<p>Hello</p>', **kwargs):
+        return BlogPost.objects.create(
+            author=self.author, category=self.category, title=f'Post {BlogPost.objects.count()}',
+            excerpt='Short', content=content, status='published', **kwargs
+        )
+
+    def collect(self, grace_hours=0):
+        call_command('collect_blobs', grace_hours=grace_hours, stdout=StringIO())
+
+    def test_identical_content_is_stored_once(self):
+        first = self.storage.save('uploads/2026/10/screenshot.png', ContentFile(PNG))
+        second = self.storage.save('uploads/2026/10/screenshot-1.PNG', ContentFile(PNG))
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith('blobs/') and first.endswith('.png'))
+        blob = Blob.objects.get()
+        self.assertEqual((blob.name, blob.size, blob.source, blob.ref_count), (first, len(PNG), 'editor', 0))
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.storage.path(first)))), [os.path.basename(first)])
+
+    def test_precomputed_digests_are_checked(self):
+        name = self.storage.save('uploads/screenshot.png', ContentFile(PNG))
+        # Claims to be the stored screenshot
+        forged = ContentFile(b'something else')
+        forged.sha256 = hashlib.sha256(PNG).hexdigest()
+        with self.assertRaises(DigestMismatch):
+            self.storage.save('uploads/forged.png', forged)
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), PNG)
+
+        # Claims a digest nothing is stored under yet
+        wrong = ContentFile(b'something else')
+        wrong.sha256 = hashlib.sha256(b'another file').hexdigest()
+        with self.assertRaises(DigestMismatch):
+            self.storage.save('uploads/wrong.png', wrong)
+        self.assertFalse(self.storage.exists(blob_name(wrong.sha256, 'wrong.png')))
+
+        right = ContentFile(b'something else')
+        right.sha256 = hashlib.sha256(b'something else').hexdigest()
+        self.assertEqual(self.storage.save('uploads/right.png', right), blob_name(right.sha256, 'right.png'))
+
+    def test_references_follow_fields_and_rich_text(self):
+        name = self.storage.save('uploads/screenshot.png', ContentFile(PNG))
+        html = f'<p><img src="{self.storage.url(name)}"></p>'
+        post = self.create_post(content=html)
+        other = self.create_post(content=html + html)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+        post.content = '<p>Removed it</p>'
+        post.save()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        other.delete()
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 0)
+        self.assertIsNotNone(blob.unreferenced_since)
+
+    def test_collection_waits_out_the_grace_period(self):
+        referenced = self.storage.save('uploads/kept.png', ContentFile(PNG))
+        self.create_post(content=f'<img src="/media/{referenced}">')
+        orphan = self.storage.save('uploads/orphan.png', ContentFile(PNG + b'!'))
+
+        self.collect(grace_hours=1)
+        self.assertTrue(self.storage.exists(orphan))
+        self.collect()
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(referenced))
+        self.assertEqual(list(Blob.objects.values_list('name', flat=True)), [referenced])
+
+    def test_editor_thumbnails_live_and_die_with_their_blob(self):
+        name = self.storage.save('uploads/photo.png', ContentFile(PNG))
+        thumb = name.replace('.png', '_thumb.png')
+        self.assertEqual(self.storage.save(thumb, ContentFile(b'thumb')), thumb)
+        self.assertEqual(self.storage.listdir('blobs/'), ([], [name[len('blobs/'):]]))
+
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.collect()
+        self.assertFalse(self.storage.exists(name) or self.storage.exists(thumb))
+
+    def test_recount_repairs_counts(self):
+        name = self.storage.save('uploads/photo.png', ContentFile(PNG))
+        self.create_post(content=f'<img src="/media/{name}">')
+        Blob.objects.update(ref_count=0)
+        call_command('collect_blobs', grace_hours=0, recount=True, stdout=StringIO())
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(self.storage.exists(name))
+
+    def test_legacy_files_are_adopted(self):
+        legacy = BlobStorage()
+        os.makedirs(os.path.join(self.media_root, 'uploads'))
+        os.makedirs(os.path.join(self.media_root, 'blog', 'featured'))
+        for path in ('uploads/old.png', 'blog/featured/old.png'):
+            with open(os.path.join(self.media_root, path), 'wb') as file:
+                file.write(PNG)
+        post = self.create_post(content='<img src="/media/uploads/old.png">')
+        BlogPost.objects.filter(pk=post.pk).update(featured_image='blog/featured/old.png')
+
+        call_command('collect_blobs', adopt=True, stdout=StringIO())
+        post.refresh_from_db()
+        name = blob_name(Blob.objects.get().sha256, 'old.png')
+        self.assertEqual(post.featured_image.name, name)
+        self.assertEqual(post.content, f'<img src="/media/{name}">')
+        # One file for both copies, referenced twice
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertFalse(legacy.exists('uploads/old.png') or legacy.exists('blog/featured/old.png'))
+        self.assertTrue(legacy.exists(name))
+
+
+class RecoveryTrackingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('member@example.com')
+
+    def check_in(self, day, **values):
+        values = {'mood': 3, 'cravings': 2, 'sober': True, **values}
+        return tracking.save_entry(self.user, day, **values)
+
+    def snapshot(self):
+        rollups = sorted(
+            EntryRollup.objects.filter(user=self.user, entries__gt=0).values_list(
+                'period', 'start', 'entries', 'sober_days', 'good_days', 'challenging_days',
+                'triggers_avoided', 'support_used', 'mood_total', 'cravings_total',
+            )
+        )
+        progress = RecoveryProgress.objects.values_list(
+            'checkins', 'first_entry_date', 'last_relapse_date', 'longest_streak',
+        ).get(user=self.user)
+        return rollups, progress
+
+    def test_rollups_count_each_day_once(self):
+        monday = date(2024, 5, 6)
+        self.check_in(monday, mood=1, cravings=8)
+        self.check_in(monday, mood=3, cravings=4, trigger_avoided=True)
+        self.check_in(monday + timedelta(days=1), mood=2, cravings=6)
+
+        week = EntryRollup.objects.get(user=self.user, period='week', start=monday)
+        self.assertEqual((week.entries, week.good_days, week.challenging_days, week.triggers_avoided), (2, 1, 0, 1))
+        self.assertEqual((week.average_mood, week.average_cravings), (2.5, 5.0))
+        month = EntryRollup.objects.get(user=self.user, period='month', start=date(2024, 5, 1))
+        self.assertEqual(month.entries, 2)
+        self.assertEqual(DailyEntry.objects.filter(user=self.user).count(), 2)
+
+    def test_streaks_and_milestones(self):
+        start = date(2024, 1, 1)
+        for offset in range(10):
+            self.check_in(start + timedelta(days=offset))
+        _, progress = self.check_in(start + timedelta(days=10), sober=False)
+        self.assertEqual(progress.longest_streak, 10)
+        today = start + timedelta(days=15)
+        self.assertEqual(progress.days_sober(today), 5)
+
+        # A relapse filled in later splits the earlier run
+        _, progress = self.check_in(start + timedelta(days=3), sober=False)
+        self.assertEqual((progress.longest_streak, progress.last_relapse_date), (6, start + timedelta(days=10)))
+        self.assertEqual(len(tracking.reached_milestones(progress.best_streak(today))), 1)
+        self.assertEqual(tracking.next_milestone(5)['days_remaining'], 2)
+
+    def test_incremental_totals_match_a_rebuild(self):
+        rng = random.Random(7)
+        start = date(2023, 11, 20)
+        for _ in range(150):
+            self.check_in(
+                start + timedelta(days=rng.randrange(120)),
+                mood=rng.choice((1, 2, 3)),
+                cravings=rng.randint(1, 10),
+                sober=rng.random() > 0.15,
+                trigger_avoided=rng.random() > 0.5,
+                support_used=rng.random() > 0.5,
+            )
+        incremental = self.snapshot()
+        tracking.rebuild(self.user.pk)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_tracking_page_queries_do_not_grow_with_history(self):
+        self.client.force_login(self.user)
+        url = reverse('recovery_tracking')
+        today = timezone.localdate()
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return len(queries)
+
+        for offset in range(7):
+            self.check_in(today - timedelta(days=offset))
+        count_queries()  # caches the signed-in user
+        few = count_queries()
+        for offset in range(7, 3 * 365):
+            self.check_in(today - timedelta(days=offset), sober=offset % 200 != 0)
+        self.assertEqual(count_queries(), few)
+        response = self.client.get(url)
+        self.assertEqual(response.context['days_sober'], 200)
+        self.assertEqual(response.context['checkins'], 3 * 365)
+
+    def test_check_in_form_and_history(self):
+        self.client.force_login(self.user)
+        today = timezone.localdate()
+        response = self.client.post(reverse('save_daily_entry'), {
+            'mood': '2', 'cravings': '4', 'sober': 'on', 'notes': 'Went to a meeting',
+        })
+        self.assertRedirects(response, reverse('recovery_tracking'))
+        entry = DailyEntry.objects.get(user=self.user)
+        self.assertEqual((entry.date, entry.mood, entry.sober), (today, 2, True))
+
+        self.client.post(reverse('save_daily_entry'), {
+            'date': (today + timedelta(days=1)).isoformat(), 'mood': '3', 'cravings': '1',
+        })
+        self.assertEqual(DailyEntry.objects.filter(user=self.user).count(), 1)
+
+        for offset in range(1, 40):
+            self.check_in(today - timedelta(days=offset))
+        response = self.client.get(reverse('recovery_history'))
+        self.assertEqual(len(response.context['entries']), 30)
+        response = self.client.get(reverse('recovery_history'), {'before': response.context['next_before'].isoformat()})
+        self.assertEqual(len(response.context['entries']), 10)
+        self.assertIsNone(response.context['next_before'])
+
+        self.client.post(reverse('set_goals'), {'goal_days': '30'})
+        self.assertEqual(RecoveryProgress.objects.get(user=self.user).goal_days, 30)
+        self.assertEqual(self.client.get(reverse('recovery_tracking')).context['recovery_progress'], 100)
+
+
+@override_settings(RECOVERY_EXPORT_CHUNK_SIZE=4)
+class RecoveryExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('member@example.com')
+        self.other = User.objects.create_user('other@example.com')
+        start = date(2024, 1, 1)
+        for offset in range(10):
+            tracking.save_entry(self.user, start + timedelta(days=offset), mood=3, cravings=offset % 10 + 1, notes=f'Day {offset}, "good"')
+        tracking.save_entry(self.other, start, mood=1, cravings=9)
+
+    def download(self, fmt):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_data'), {'format': fmt})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        return response, chunks
+
+    def test_csv_streams_in_chunks(self):
+        response, chunks = self.download('csv')
+        self.assertIn('attachment; filename="recovery-', response['Content-Disposition'])
+        # The header, then one chunk per 4 entries
+        self.assertEqual(len(chunks), 4)
+        rows = list(csv.DictReader(''.join(chunks).splitlines()))
+        self.assertEqual([row['date'] for row in rows], [f'2024-01-{day:02d}' for day in range(1, 11)])
+        self.assertEqual(rows[2]['notes'], 'Day 2, "good"')
+
+    def test_jsonl_and_columnar(self):
+        _, chunks = self.download('jsonl')
+        entries = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual(len(entries), 10)
+        self.assertEqual((entries[0]['date'], entries[0]['sober'], entries[0]['cravings']), ('2024-01-01', True, 1))
+
+        _, chunks = self.download('columnar')
+        groups = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual([group['rows'] for group in groups], [4, 4, 2])
+        self.assertEqual(groups[2]['columns']['date'], ['2024-01-09', '2024-01-10'])
+
+        self.assertEqual(self.client.get(reverse('export_data'), {'format': 'xml'}).status_code, 400)
+
+    def test_command_exports_every_user(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        call_command('export_recovery_data', '--all', '--format', 'jsonl', '--output', directory, '--workers', '0', stdout=StringIO())
+        self.assertEqual(sorted(os.listdir(directory)), sorted(
+            exports.filename(user.pk, 'jsonl') for user in (self.user, self.other)
+        ))
+        with open(os.path.join(directory, exports.filename(self.other.pk, 'jsonl'))) as file:
+            self.assertEqual(json.loads(file.read())['cravings'], 9)
+
+        out = StringIO()
+        call_command('export_recovery_data', '--user', str(self.user.pk), stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 11)
@@ -0,0 +1,249 @@
+"""
+Recovery tracking.
+
+Each check-in is one ``DailyEntry`` row per user and day. Saving one also
+adjusts, by the difference it makes, the user's ``EntryRollup`` totals for
+its week and month and their ``RecoveryProgress``. The tracking page then
+reads a few rollups and one progress row, whether the user has a week of
+history or ten years:
+
+* days sober run from the day after the last relapse (an entry with
+  ``sober`` unchecked), or from the first check-in;
+* the longest streak is the best finished run or the current one;
+* milestones are the ``MILESTONES`` the longest streak has reached.
+
+Only a back-dated entry that adds, removes or moves a relapse before the
+latest one makes progress re-read the user's relapse days.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import DailyEntry, EntryRollup, RecoveryProgress
+
+MILESTONES = (
+    (1, 'First Day'),
+    (7, 'One Week'),
+    (30, 'One Month'),
+    (60, 'Two Months'),
+    (90, 'Three Months'),
+    (180, 'Six Months'),
+    (365, 'One Year'),
+    (730, 'Two Years'),
+    (1825, 'Five Years'),
+)
+GREAT, STRUGGLING = 3, 1
+ENTRY_FIELDS = ('mood', 'cravings', 'sober', 'trigger_avoided', 'support_used', 'notes')
+CHART_WEEKS = 8
+CHART_MONTHS = 12
+RECENT_ENTRIES = 5
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def previous_month(day):
+    return month_start(month_start(day) - timedelta(days=1))
+
+
+def totals(entry):
+    """What one entry adds to its rollups"""
+    if entry is None:
+        return {}
+    return {
+        'entries': 1,
+        'sober_days': int(entry.sober),
+        'good_days': int(entry.mood == GREAT),
+        'challenging_days': int(entry.mood == STRUGGLING),
+        'triggers_avoided': int(entry.trigger_avoided),
+        'support_used': int(entry.support_used),
+        'mood_total': entry.mood,
+        'cravings_total': entry.cravings,
+    }
+
+
+def update_rollups(user, day, changes):
+    changes = {field: value for field, value in changes.items() if value}
+    if not changes:
+        return
+    for period, start in (('week', week_start(day)), ('month', month_start(day))):
+        rollup, _ = EntryRollup.objects.get_or_create(user=user, period=period, start=start)
+        EntryRollup.objects.filter(pk=rollup.pk).update(
+            **{field: F(field) + value for field, value in changes.items()}
+        )
+
+
+def recount_progress(progress):
+    """Work out the finished runs again from the user's relapse days"""
+    relapses = DailyEntry.objects.filter(user_id=progress.user_id, sober=False).order_by('date')
+    longest = 0
+    start = progress.first_entry_date
+    last = None
+    for day in relapses.values_list('date', flat=True):
+        longest = max(longest, (day - start).days)
+        start = day + timedelta(days=1)
+        last = day
+    progress.longest_streak = longest
+    progress.last_relapse_date = last
+
+
+def update_progress(user, entry, was_sober=None):
+    """Fold a saved entry into the user's progress; ``was_sober`` is ``None`` for a new entry"""
+    progress, _ = RecoveryProgress.objects.select_for_update().get_or_create(user=user)
+    recount = False
+    if was_sober is None:
+        progress.checkins += 1
+        if progress.first_entry_date is None or entry.date < progress.first_entry_date:
+            # An earlier first day lengthens the first run
+            recount = progress.last_relapse_date is not None
+            progress.first_entry_date = entry.date
+
+    if not entry.sober and was_sober is not False:
+        last = progress.last_relapse_date
+        if last is None or entry.date > last:
+            # A new relapse ends the current run
+            progress.longest_streak = max(progress.longest_streak, (entry.date - progress.sober_since).days)
+            progress.last_relapse_date = entry.date
+        else:
+            recount = True
+    elif entry.sober and was_sober is False:
+        recount = True
+
+    if recount:
+        recount_progress(progress)
+    progress.save()
+    return progress
+
+
+def save_entry(user, day, **values):
+    """Record the user's check-in for ``day``, replacing any earlier one.
+
+    Returns the entry and the user's updated ``RecoveryProgress``.
+    """
+    with transaction.atomic():
+        entry = DailyEntry.objects.select_for_update().filter(user=user, date=day).first()
+        if entry is None:
+            try:
+                with transaction.atomic():
+                    entry = DailyEntry.objects.create(user=user, date=day, **values)
+            except IntegrityError:
+                # Another request checked in for the same day first
+                entry = DailyEntry.objects.select_for_update().get(user=user, date=day)
+            else:
+                update_rollups(user, day, totals(entry))
+                return entry, update_progress(user, entry)
+
+        before, was_sober = totals(entry), entry.sober
+        for field, value in values.items():
+            setattr(entry, field, value)
+        entry.save()
+        after = totals(entry)
+        update_rollups(user, day, {field: after[field] - before[field] for field in after})
+        return entry, update_progress(user, entry, was_sober)
+
+
+
+def rebuild(user_id):
+    """Recompute a user's rollups and progress from their entries"""
+    entries = DailyEntry.objects.filter(user_id=user_id).order_by()
+    sums = {
+        'entries': Count('pk'),
+        'sober_days': Count('pk', filter=Q(sober=True)),
+        'good_days': Count('pk', filter=Q(mood=GREAT)),
+        'challenging_days': Count('pk', filter=Q(mood=STRUGGLING)),
+        'triggers_avoided': Count('pk', filter=Q(trigger_avoided=True)),
+        'support_used': Count('pk', filter=Q(support_used=True)),
+        'mood_total': Sum('mood'),
+        'cravings_total': Sum('cravings'),
+    }
+    rollups = []
+    for period, trunc in (('week', TruncWeek), ('month', TruncMonth)):
+        for row in entries.values(start=trunc('date')).annotate(**sums):
+            rollups.append(EntryRollup(user_id=user_id, period=period, **row))
+
+    with transaction.atomic():
+        EntryRollup.objects.filter(user_id=user_id).delete()
+        EntryRollup.objects.bulk_create(rollups)
+        progress, _ = RecoveryProgress.objects.select_for_update().get_or_create(user_id=user_id)
+        stats = entries.aggregate(checkins=Count('pk'), first=Min('date'))
+        progress.checkins, progress.first_entry_date = stats['checkins'], stats['first']
+        recount_progress(progress)
+        progress.save()
+    return progress
+
+def reached_milestones(days):
+    return [(target, title) for target, title in MILESTONES if target <= days]
+
+
+def next_milestone(days):
+    for target, title in MILESTONES:
+        if target > days:
+            return {
+                'days': target,
+                'title': title,
+                'progress': days * 100 // target,
+                'days_remaining': target - days,
+            }
+    return None
+
+
+def streak_summary(progress, today):
+    """Days sober, streaks and milestones from a ``RecoveryProgress`` row"""
+    days_sober = progress.days_sober(today)
+    best_streak = progress.best_streak(today)
+    return {
+        'days_sober': days_sober,
+        'longest_streak': best_streak,
+        'recovery_progress': min(100, days_sober * 100 // progress.goal_days),
+        'milestones': len(reached_milestones(best_streak)),
+        'next_milestone': next_milestone(days_sober),
+        'checkins': progress.checkins,
+    }
+
+
+def overview(user, today=None):
+    """What the tracking page shows, in the same few queries for any history"""
+    today = today or timezone.localdate()
+    progress = RecoveryProgress.objects.filter(user=user).first() or RecoveryProgress(user=user)
+
+    weeks = [week_start(today) - timedelta(weeks=n) for n in reversed(range(CHART_WEEKS))]
+    months = [month_start(today)]
+    while len(months) < CHART_MONTHS:
+        months.insert(0, previous_month(months[0]))
+    rollups = {
+        (rollup.period, rollup.start): rollup
+        for rollup in EntryRollup.objects.filter(user=user).filter(
+            Q(period='week', start__gte=weeks[0]) | Q(period='month', start__gte=months[0])
+        )
+    }
+    weekly = [rollups.get(('week', start)) or EntryRollup(period='week', start=start) for start in weeks]
+    monthly = [rollups.get(('month', start)) or EntryRollup(period='month', start=start) for start in months]
+
+    recent_entries = list(DailyEntry.objects.filter(user=user).order_by('-date')[:RECENT_ENTRIES])
+    return {
+        **streak_summary(progress, today),
+        'progress': progress,
+        'recent_entries': recent_entries,
+        'today_entry': next((entry for entry in recent_entries if entry.date == today), None),
+        'this_week': weekly[-1],
+        'weekly': weekly,
+        'monthly': monthly,
+    }
+
+
+def history(user, before=None, per_page=30):
+    """A page of entries, newest first, and the date to pass as ``before`` for the next"""
+    entries = DailyEntry.objects.filter(user=user)
+    if before:
+        entries = entries.filter(date__lt=before)
+    rows = list(entries.order_by('-date')[:per_page + 1])
+    next_before = rows[per_page - 1].date if len(rows) > per_page else None
+    return rows[:per_page], next_before
@@ -1,14 +1,26 @@
-from django.shortcuts import render
+from django.shortcuts import render, redirect
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_POST
+from blog.cache import cache_public_page
 from blog.models import BlogPost
 
+from . import exports, tracking
+from .forms import DailyEntryForm, RecoveryGoalForm
+from .models import RecoveryProgress
+
 # Create your views here.
 
+@cache_public_page('posts')
 def home(request):
     # Get featured posts for the homepage
     featured_posts = BlogPost.objects.filter(
         status='published',
         is_featured=True
-    ).select_related('author', 'category').order_by('-created_at')[:3]
+    ).select_related('author', 'category').defer('content').order_by('-created_at')[:3]
     
     context = {
         'featured_posts': featured_posts,
@@ -27,46 +39,51 @@ def resources(request):
 def dashboard(request):
     return render(request, 'pages/dashboard.html')
 
+@login_required
 def recovery_tracking(request):
-    # Sample data for the recovery tracking page
-    context = {
-        'mood_choices': [
-            ('1', 'Very Bad'),
-            ('2', 'Bad'),
-            ('3', 'Okay'),
-            ('4', 'Good'),
-            ('5', 'Very Good'),
-        ],
-        'streak_data': {
-            'days_sober': 15,
-            'recovery_progress': 68,
-            'milestones_achieved': 3,
-        },
-        'recent_entries': [],  # Empty for now
-        'next_milestone': {
-            'days': 30,
-            'title': '30 Days Milestone',
-            'progress': 50,
-            'days_remaining': 15,
-        },
-        'mood_labels': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
-        'mood_data': [7, 8, 6, 9, 7, 8, 9],
-        'cravings_labels': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
-        'cravings_data': [3, 2, 4, 1, 2, 1, 1],
-    }
+    context = tracking.overview(request.user)
+    context['goal_form'] = RecoveryGoalForm(instance=context['progress'])
     return render(request, 'pages/recovery_tracking.html', context)
 
-# Placeholder views for URLs referenced in recovery_tracking.html
+@login_required
 def recovery_history(request):
-    return render(request, 'pages/recovery_tracking.html')  # Redirect to main tracking for now
+    try:
+        before = parse_date(request.GET.get('before') or '')
+    except ValueError:
+        before = None
+    entries, next_before = tracking.history(request.user, before)
+    context = {
+        'entries': entries,
+        'next_before': next_before,
+        'is_first_page': before is None,
+    }
+    return render(request, 'pages/recovery_history.html', context)
 
+@login_required
 def export_data(request):
-    # Placeholder - would handle data export
-    return render(request, 'pages/recovery_tracking.html')
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest('Unknown export format')
+    response = StreamingHttpResponse(
+        exports.export_entries(request.user.pk, fmt),
+        content_type=exports.FORMATS[fmt][1],
+    )
+    response['Cache-Control'] = 'private, no-store'
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(timezone.localdate(), fmt)}"'
+    return response
 
+@login_required
+@require_POST
 def set_goals(request):
-    # Placeholder - would handle goal setting
-    return render(request, 'pages/recovery_tracking.html')
+    progress, _ = RecoveryProgress.objects.get_or_create(user=request.user)
+    form = RecoveryGoalForm(request.POST, instance=progress)
+    if form.is_valid():
+        # Only the goal: check-ins update the other fields concurrently
+        form.instance.save(update_fields=['goal_days'])
+        messages.success(request, f"Your goal is now {form.cleaned_data['goal_days']} days.")
+    else:
+        messages.error(request, 'Please enter a goal of at least one day.')
+    return redirect('recovery_tracking')
 
 def groups_view(request):
     # Placeholder view for support groups
@@ -84,6 +101,18 @@ def appointments_view(request):
     # Placeholder view for appointments
     return render(request, 'pages/appointments.html')
 
+@login_required
+@require_POST
 def save_daily_entry(request):
-    # Placeholder view for saving daily entry
-    return render(request, 'pages/recovery_tracking.html')
+    form = DailyEntryForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect('recovery_tracking')
+    
+    values = dict(form.cleaned_data)
+    day = values.pop('date')
+    tracking.save_entry(request.user, day, **values)
+    messages.success(request, 'Your check-in has been saved. Keep going!')
+    return redirect('recovery_tracking')
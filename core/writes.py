@@ -0,0 +1,120 @@
+"""
+Single-writer queue for counter increments.
+
+SQLite lets one connection write at a time, so a burst of requests that each
+run ``UPDATE ... SET likes_count = likes_count + 1`` queue on the write lock
+one by one. ``increment`` puts the change on a queue instead; one writer
+thread per process applies whatever has built up every
+``COUNTER_WRITE_DELAY`` seconds in a single transaction, adding up changes to
+the same row first. The requests never take the write lock for the counter
+and a hundred likes on one post become one UPDATE.
+
+``pending`` reports queued changes that haven't reached the database, so
+callers can show an up-to-date count. A delay of ``0`` applies every
+increment in the calling request. Changes are queued once the caller's
+transaction commits. Whatever is still queued when a worker exits is written
+by an ``atexit`` hook; a crash loses at most one delay's worth.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+def write_delay():
+    return getattr(settings, 'COUNTER_WRITE_DELAY', 0)
+
+
+def apply_increments(changes):
+    """Apply ``{(model label, pk, field): delta}`` in one transaction, one UPDATE per row"""
+    rows = defaultdict(dict)
+    for (label, pk, field), delta in changes.items():
+        if delta:
+            rows[label, pk][field] = delta
+    with transaction.atomic():
+        # A stable order, so two writers can't deadlock on each other's rows
+        for (label, pk), deltas in sorted(rows.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            apps.get_model(label).objects.filter(pk=pk).update(
+                **{field: F(field) + delta for field, delta in deltas.items()}
+            )
+
+
+class CounterWriteQueue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def increment(self, model, pk, **deltas):
+        changes = {(model._meta.label, pk, field): delta for field, delta in deltas.items()}
+        if not write_delay():
+            apply_increments(changes)
+        else:
+            # Only queue what the caller's transaction actually commits
+            transaction.on_commit(lambda: self._enqueue(changes))
+
+    def _enqueue(self, changes):
+        with self._lock:
+            self._pending.update(changes)
+            if self._thread is None:
+                self._wake.clear()
+                self._thread = threading.Thread(target=self._run, name='counter-writer', daemon=True)
+                self._thread.start()
+
+    def pending(self, model, pk, field):
+        with self._lock:
+            return self._pending.get((model._meta.label, pk, field), 0)
+
+    def flush(self):
+        """Write everything queued so far and return the number of changes"""
+        with self._lock:
+            changes, self._pending = self._pending, Counter()
+        if not changes:
+            return 0
+        try:
+            apply_increments(changes)
+        except Exception:
+            # Keep the changes for the next run rather than dropping them
+            with self._lock:
+                self._pending.update(changes)
+            raise
+        return len(changes)
+
+    def _run(self):
+        while not self._wake.wait(write_delay()):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Counter write queue flush failed')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        """Stop the writer thread and write what is left"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._wake.set()
+            thread.join()
+        return self.flush()
+
+
+queue = CounterWriteQueue()
+atexit.register(queue.stop)
+
+
+def increment(model, pk, **deltas):
+    """Queue ``field=delta`` changes to one row of ``model``"""
+    queue.increment(model, pk, **deltas)
+
+
+def pending(model, pk, field):
+    return queue.pending(model, pk, field)
@@ -1,13 +1,16 @@
 from django.contrib import admin
+from django.db.models import Q
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
+from django.utils.timesince import timesince
+from . import search
 from .models import SupportTicket, TicketResponse, TicketAttachment
 
 class TicketAttachmentInline(admin.TabularInline):
     model = TicketAttachment
     extra = 0
-    readonly_fields = ('original_filename', 'file_size_mb', 'uploaded_by', 'uploaded_at')
+    readonly_fields = ('original_filename', 'file_size_mb', 'scan_status', 'uploaded_by', 'uploaded_at')
     
     def file_size_mb(self, obj):
         return f"{obj.file_size_mb} MB"
@@ -36,7 +39,9 @@ class SupportTicketAdmin(admin.ModelAdmin):
         'created_at'
     )
     list_filter = ('status', 'priority', 'category', 'created_at', 'assigned_to')
-    search_fields = ('ticket_id', 'subject', 'user__email', 'user__full_name', 'description')
+    # Shows the search box; get_search_results does the searching
+    search_fields = ('ticket_id', 'subject', 'description')
+    search_help_text = 'Ticket ID, requester name or email, or words from the subject, description and responses'
     readonly_fields = ('ticket_id', 'created_at', 'updated_at', 'response_count', 'last_response_info')
     
     fieldsets = (
@@ -58,6 +63,17 @@ class SupportTicketAdmin(admin.ModelAdmin):
     
     inlines = [TicketResponseInline, TicketAttachmentInline]
     
+    def get_search_results(self, request, queryset, search_term):
+        # Words are looked up in the ticket search index (subject, description,
+        # responses) and whole ticket IDs on their unique index; the requester
+        # is still matched by name or the start of their email
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        hits = search.filter_tickets(queryset, search_term)
+        requester = Q(user__full_name__icontains=search_term) | Q(user__email__istartswith=search_term)
+        return queryset.filter(Q(pk__in=hits.values('pk')) | requester), False
+    
     def subject_short(self, obj):
         return obj.subject[:50] + '...' if len(obj.subject) > 50 else obj.subject
     subject_short.short_description = 'Subject'
@@ -101,18 +117,18 @@ class SupportTicketAdmin(admin.ModelAdmin):
     status_badge.short_description = 'Status'
     
     def last_response_info(self, obj):
-        last_response = obj.last_response
-        if last_response:
+        if obj.last_response_at:
             return format_html(
                 '{} - {} ago',
-                last_response.user.get_full_name(),
-                last_response.created_at
+                obj.last_response_by.get_full_name() if obj.last_response_by else 'Deleted user',
+                timesince(obj.last_response_at)
             )
         return "No responses yet"
     last_response_info.short_description = 'Last Response'
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user', 'assigned_to').prefetch_related('responses')
+        # Response stats are columns on the ticket, so rows need no per-ticket queries
+        return super().get_queryset(request).select_related('user', 'assigned_to', 'last_response_by')
 
 @admin.register(TicketResponse)
 class TicketResponseAdmin(admin.ModelAdmin):
@@ -136,10 +152,10 @@ class TicketResponseAdmin(admin.ModelAdmin):
 
 @admin.register(TicketAttachment)
 class TicketAttachmentAdmin(admin.ModelAdmin):
-    list_display = ('ticket_link', 'original_filename', 'file_size_display', 'uploaded_by', 'uploaded_at')
-    list_filter = ('uploaded_at',)
+    list_display = ('ticket_link', 'original_filename', 'file_size_display', 'scan_status', 'uploaded_by', 'uploaded_at')
+    list_filter = ('scan_status', 'uploaded_at')
     search_fields = ('ticket__ticket_id', 'original_filename', 'uploaded_by__email')
-    readonly_fields = ('original_filename', 'file_size', 'uploaded_at')
+    readonly_fields = ('original_filename', 'file_size', 'content_type', 'sha256', 'uploaded_at')
     
     def ticket_link(self, obj):
         url = reverse('admin:support_supportticket_change', args=[obj.ticket.id])
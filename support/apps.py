@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class SupportConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'support'
+
+    def ready(self):
+        from core import blobs
+
+        from . import signals  # noqa: F401
+        from .models import AttachmentUpload, TicketAttachment
+
+        blobs.track(TicketAttachment, files=['file'])
+        # Finished uploads hold their blob until attached or expired
+        blobs.track(AttachmentUpload, files=['stored_name'])
@@ -0,0 +1,102 @@
+"""
+Live ticket streams served without a request thread.
+
+Django's ASGI handler runs each request's middleware and sync code on a
+thread it keeps until the response has been sent, so every open
+``support:ticket_events`` stream would hold one. ``live_events`` wraps the
+Django application and answers those requests itself: one read on the
+shared ``sync_to_async`` pool checks the session and the ticket, then the
+stream from ``support.live`` is sent as it comes.
+
+Anything it can't serve (another URL, a visitor who isn't signed in, a
+ticket they can't see) goes to Django, whose ``ticket_events`` view gives
+the usual redirect or 404.
+"""
+import asyncio
+from importlib import import_module
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.urls import Resolver404, resolve
+
+from user.sessions import get_cached_user
+
+from . import live
+from .models import SupportTicket
+
+EVENTS_VIEW = 'support:ticket_events'
+
+
+def events_ticket_id(scope):
+    """The ticket id if ``scope`` asks for a ticket's event stream"""
+    if scope['type'] != 'http' or scope['method'] != 'GET':
+        return None
+    path = scope['path']
+    root_path = scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    return match.kwargs['ticket_id'] if match.view_name == EVENTS_VIEW else None
+
+
+def open_stream(request, ticket_id):
+    """The ticket and user to stream for, or ``None`` to leave the request to Django"""
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    user = get_cached_user(request)
+    if not user.is_authenticated:
+        return None
+    ticket = SupportTicket.objects.filter(ticket_id=ticket_id).first()
+    if ticket is None or not (ticket.user_id == user.id or user.is_staff):
+        return None
+    return ticket, user
+
+
+async def send_stream(send, events):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(name.lower().encode(), value.encode()) for name, value in live.HEADERS.items()],
+    })
+    async for chunk in events:
+        await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def live_events(application):
+    """Wrap the Django ASGI ``application`` to serve ticket event streams directly"""
+
+    async def app(scope, receive, send):
+        ticket_id = events_ticket_id(scope)
+        if ticket_id is None:
+            return await application(scope, receive, send)
+        request = ASGIRequest(scope, BytesIO())
+        opened = await sync_to_async(open_stream, thread_sensitive=False)(request, ticket_id)
+        if opened is None:
+            return await application(scope, receive, send)
+
+        ticket, user = opened
+        events = live.stream(ticket, user, *live.stream_position(request, ticket))
+        sending = asyncio.ensure_future(send_stream(send, events))
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            done, _ = await asyncio.wait([sending, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if sending in done:
+                sending.result()
+        finally:
+            for task in (sending, disconnected):
+                task.cancel()
+            await asyncio.gather(sending, disconnected, return_exceptions=True)
+            await events.aclose()
+
+    return app
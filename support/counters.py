@@ -0,0 +1,25 @@
+"""
+Denormalised response statistics for support tickets.
+
+``SupportTicket.response_count``, ``last_response_at`` and
+``last_response_by`` are recomputed from the responses table in one UPDATE
+whenever a response is saved or deleted (see ``support.signals``), inside the
+same transaction as the change. ``manage.py refresh_ticket_stats`` rebuilds
+them for every ticket.
+"""
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def refresh_response_stats(ticket_ids, using='default'):
+    """Recount responses and find the latest one for the given tickets"""
+    from .models import SupportTicket, TicketResponse
+
+    responses = TicketResponse.objects.filter(ticket=OuterRef('pk')).order_by()
+    total = responses.values('ticket').annotate(total=Count('pk')).values('total')
+    latest = responses.order_by('-created_at', '-pk')
+    return SupportTicket.objects.using(using).filter(pk__in=ticket_ids).update(
+        response_count=Coalesce(Subquery(total), Value(0)),
+        last_response_at=Subquery(latest.values('created_at')[:1]),
+        last_response_by=Subquery(latest.values('user')[:1]),
+    )
@@ -0,0 +1,133 @@
+"""
+Attachment downloads.
+
+Files are streamed from storage in chunks instead of being read into memory.
+Single byte ranges (``Range: bytes=...``) are answered with ``206 Partial
+Content`` so large PDFs can be resumed, and every response carries an
+``ETag`` so a repeat download with ``If-None-Match`` costs a ``304``.
+
+With ``SUPPORT_ATTACHMENT_SENDFILE`` set, the view only checks permissions and
+hands the transfer to the front proxy:
+
+* ``'x-sendfile'`` (Apache mod_xsendfile, lighttpd) sends the file's path.
+* ``'x-accel-redirect'`` (nginx) sends ``SUPPORT_ATTACHMENT_ACCEL_PREFIX``
+  plus the file's storage name, which must map to an ``internal`` location.
+
+The proxy then handles ranges and conditional requests itself.
+"""
+import hashlib
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def sendfile_mode():
+    return getattr(settings, 'SUPPORT_ATTACHMENT_SENDFILE', None)
+
+
+def accel_prefix():
+    return getattr(settings, 'SUPPORT_ATTACHMENT_ACCEL_PREFIX', '/protected/')
+
+
+def attachment_etag(attachment):
+    """Attachments never change after upload, so the stored row identifies the bytes"""
+    value = f'{attachment.pk}:{attachment.file.name}:{attachment.file_size}'
+    return '"%s"' % hashlib.md5(value.encode()).hexdigest()
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` for a single satisfiable byte range.
+
+    Returns ``None`` when the whole file should be sent (no header, several
+    ranges, or a header we don't understand) and raises ``ValueError`` when
+    the range lies outside the file.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # "bytes=-500" is the last 500 bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def iter_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def set_common_headers(response, attachment, etag):
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    # Only the signed-in owner and staff may see it, so shared caches must not
+    response['Cache-Control'] = 'private, no-cache'
+    response['Content-Disposition'] = content_disposition_header(True, attachment.original_filename)
+    return response
+
+
+def sendfile_response(attachment, etag):
+    content_type = mimetypes.guess_type(attachment.original_filename)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+    if sendfile_mode() == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(accel_prefix() + attachment.file.name)
+    else:
+        response['X-Sendfile'] = attachment.file.path
+    return set_common_headers(response, attachment, etag)
+
+
+def serve_attachment(request, attachment):
+    """Stream ``attachment`` to the client, honouring Range and If-None-Match"""
+    etag = attachment_etag(attachment)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return set_common_headers(HttpResponseNotModified(), attachment, etag)
+
+    if sendfile_mode():
+        return sendfile_response(attachment, etag)
+
+    file = attachment.file.open('rb')
+    size = attachment.file.size
+
+    byte_range = None
+    # A stale If-Range means the client's partial copy is outdated: send it all
+    if request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return set_common_headers(response, attachment, etag)
+
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=True, filename=attachment.original_filename)
+        return set_common_headers(response, attachment, etag)
+
+    start, end = byte_range
+    content_type = mimetypes.guess_type(attachment.original_filename)[0] or 'application/octet-stream'
+    response = StreamingHttpResponse(iter_range(file, start, end - start + 1), status=206, content_type=content_type)
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return set_common_headers(response, attachment, etag)
@@ -0,0 +1,56 @@
+"""
+Support ticket IDs.
+
+An ID is ``TK`` followed by 14 Crockford base32 characters: 9 for the
+milliseconds since 2024 and 5 for a number that starts at random each
+millisecond and counts up for further tickets from the same process in that
+millisecond. IDs therefore sort by creation time and need no lookup query.
+Two processes only clash when they pick the same number in the same
+millisecond; ``SupportTicket.save`` catches that through the unique
+constraint and retries with a fresh ID.
+"""
+import random
+import threading
+import time
+
+PREFIX = 'TK'
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+EPOCH_MS = 1704067200000  # 2024-01-01 00:00:00 UTC
+TIME_CHARS = 9
+SEQUENCE_CHARS = 5
+SEQUENCE_BITS = SEQUENCE_CHARS * 5
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_sequence = 0
+_random = random.SystemRandom()
+
+
+def encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def _next_position():
+    global _last_ms, _last_sequence
+    now = int(time.time() * 1000) - EPOCH_MS
+    with _lock:
+        if now <= _last_ms:
+            # Same millisecond (or the clock stepped back): count on from the last ID
+            now, sequence = _last_ms, _last_sequence + 1
+            if sequence >= 1 << SEQUENCE_BITS:
+                now, sequence = now + 1, _random.getrandbits(SEQUENCE_BITS - 1)
+        else:
+            # Start in the lower half so counting on rarely spills into the next millisecond
+            sequence = _random.getrandbits(SEQUENCE_BITS - 1)
+        _last_ms, _last_sequence = now, sequence
+    return now, sequence
+
+
+def new_ticket_id():
+    """Return a new, time-ordered ticket ID such as ``TK0D2C6Q4AB7F3KZ``"""
+    now, sequence = _next_position()
+    return PREFIX + encode(now, TIME_CHARS) + encode(sequence, SEQUENCE_CHARS)
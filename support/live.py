@@ -0,0 +1,135 @@
+"""
+Live ticket updates over server-sent events.
+
+The ticket page keeps an EventSource open on ``support:ticket_events``. The
+stream waits on the ticket's ``core.pubsub`` channel rather than polling,
+and its reads run on the shared ``sync_to_async`` pool. Committing a new
+response or a ticket change publishes on the channel (see
+``support.signals``); a woken stream reads only the responses after the last
+one it sent and the ticket's status, and sends them as ``response`` and
+``status`` events.
+
+Django's ASGI handler keeps a thread for every request until its response
+ends, so ``support.asgi`` serves the streams in front of it: an open stream
+then costs a suspended coroutine rather than a thread.
+
+Response events carry the response's id, so a browser that reconnects
+resumes from ``Last-Event-ID``. A stream ends after
+``SUPPORT_LIVE_STREAM_SECONDS`` and the browser reconnects, which checks
+access again; a comment every ``SUPPORT_LIVE_KEEPALIVE_SECONDS`` keeps
+proxies from dropping idle ones. Under WSGI the stream still works but holds
+a worker thread for as long as it is open.
+"""
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from core import pubsub
+from user import dashboard
+
+# Milliseconds the browser waits before reconnecting
+RETRY_MS = 3000
+
+HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-store',
+    # Stop nginx from buffering the stream
+    'X-Accel-Buffering': 'no',
+}
+
+
+def stream_seconds():
+    return getattr(settings, 'SUPPORT_LIVE_STREAM_SECONDS', 300)
+
+
+def keepalive_seconds():
+    return getattr(settings, 'SUPPORT_LIVE_KEEPALIVE_SECONDS', 20)
+
+
+def channel(ticket_pk):
+    return f'ticket:{ticket_pk}'
+
+
+def notify(ticket_pk, using='default'):
+    """Wake the ticket's streams once the current transaction commits"""
+    transaction.on_commit(lambda: pubsub.publish(channel(ticket_pk)), using=using)
+
+
+def event(name, data, event_id=None):
+    lines = [f'event: {name}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_position(request, ticket):
+    """The last response id and the status the browser already has"""
+    # A reconnecting browser says what it already has
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.GET.get('after') or 0)
+    except ValueError:
+        after = 0
+    return after, request.GET.get('status', ticket.status)
+
+
+def read_changes(ticket, user, after, status):
+    """Events for the responses after ``after`` and for a status other than ``status``.
+
+    Returns the events, the last response id sent and the current status
+    (``None`` once the ticket is gone).
+    """
+    from .models import SupportTicket
+
+    current = SupportTicket.objects.filter(pk=ticket.pk).values_list('status', flat=True).first()
+    if current is None:
+        return [], after, None
+    responses = list(
+        ticket.responses.filter(pk__gt=after).select_related('user').prefetch_related('attachments')
+    )
+    events = [
+        event('response', {
+            'id': response.pk,
+            'html': render_to_string('support/_response.html', {'response': response}),
+        }, event_id=response.pk)
+        for response in responses
+    ]
+    if current != status:
+        events.append(event('status', {
+            'status': current,
+            'label': dict(SupportTicket.STATUS_CHOICES)[current],
+        }))
+    if responses and ticket.user_id == user.id:
+        # The owner has the new responses in front of them
+        SupportTicket.objects.filter(pk=ticket.pk).update(owner_seen_at=timezone.now())
+        dashboard.invalidate(user.id)
+    return events, responses[-1].pk if responses else after, current
+
+
+async def stream(ticket, user, after, status):
+    """Stream the ticket's new responses and status changes as server-sent events"""
+    # Reads share the pool of sync_to_async threads rather than the request's
+    read = sync_to_async(read_changes, thread_sensitive=False)
+    deadline = time.monotonic() + stream_seconds()
+    # Subscribed before the first read, so nothing committed in between is missed
+    async with pubsub.subscribe(channel(ticket.pk)) as subscription:
+        yield f'retry: {RETRY_MS}\n\n'
+        woken = True
+        while True:
+            if woken:
+                events, after, status = await read(ticket, user, after, status)
+                if status is None:
+                    return
+                for chunk in events:
+                    yield chunk
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            woken = await subscription.wait(min(keepalive_seconds(), remaining))
+            if not woken:
+                yield ': keepalive\n\n'
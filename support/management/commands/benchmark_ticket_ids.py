@@ -0,0 +1,96 @@
+import random
+import string
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+
+from core.benchmark import benchmark_database
+from support.models import SupportTicket
+
+
+def legacy_ticket_id():
+    """The previous scheme: random digits, checked with a query until free"""
+    while True:
+        ticket_id = 'TK' + ''.join(random.choices(string.digits, k=8))
+        if not SupportTicket.objects.filter(ticket_id=ticket_id).exists():
+            return ticket_id
+
+
+class Command(BaseCommand):
+    help = 'Create tickets from several threads with the old and new ID schemes on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=100000, help='Tickets to create per scheme')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent creating threads')
+        parser.add_argument('--schemes', nargs='+', choices=['legacy', 'time-ordered'],
+                            default=['legacy', 'time-ordered'], help='ID schemes to run')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = get_user_model().objects.create_user('bench@example.com')
+            for scheme in options['schemes']:
+                SupportTicket.objects.all().delete()
+                self.run_scheme(scheme, user, options['tickets'], options['threads'])
+
+    def run_scheme(self, scheme, user, total, threads):
+        # ID lookups made by attempts that succeeded, and attempts retried after a lock error
+        stats = {'queries': 0, 'locked': 0}
+        errors = []
+        stats_lock = threading.Lock()
+
+        def work(count):
+            queries = locked = 0
+
+            def count_queries(execute, sql, params, many, context):
+                nonlocal queries
+                if sql.lstrip().upper().startswith('SELECT'):
+                    queries += 1
+                return execute(sql, params, many, context)
+
+            try:
+                with connection.execute_wrapper(count_queries):
+                    for _ in range(count):
+                        ticket = SupportTicket(user=user, subject='Benchmark', description='Benchmark ticket')
+                        while True:
+                            before = queries
+                            try:
+                                if scheme == 'legacy':
+                                    ticket.ticket_id = legacy_ticket_id()
+                                ticket.save()
+                                break
+                            except OperationalError:
+                                # SQLite reports writer contention instead of waiting;
+                                # queries from the failed attempt don't count
+                                queries = before
+                                locked += 1
+                                time.sleep(0.0005)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                with stats_lock:
+                    stats['queries'] += queries
+                    stats['locked'] += locked
+                close_old_connections()
+
+        shares = [total // threads + (i < total % threads) for i in range(threads)]
+        workers = [threading.Thread(target=work, args=(share,)) for share in shares]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        created = SupportTicket.objects.count()
+        distinct = SupportTicket.objects.values('ticket_id').distinct().count()
+
+        self.stdout.write(f'{scheme}: {created} tickets from {threads} threads in {elapsed:.1f}s '
+                          f'({created / elapsed:.0f}/s)')
+        self.stdout.write(f'  lookup queries per ticket: {stats["queries"] / max(created, 1):.2f} '
+                          f'(lock retries: {stats["locked"]})')
+        self.stdout.write(f'  distinct IDs: {distinct}')
+        for error in errors:
+            self.stderr.write(f'  error: {error!r}')
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from support.uploads import clear_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads that were abandoned or never attached, with their files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=float,
+            default=None,
+            help='Age in hours after which an untouched upload is stale (default SUPPORT_UPLOAD_EXPIRY_HOURS)',
+        )
+
+    def handle(self, *args, **options):
+        older_than = timedelta(hours=options['hours']) if options['hours'] is not None else None
+        cleared = clear_stale_uploads(older_than)
+        self.stdout.write(self.style.SUCCESS(f'Cleared {cleared} stale uploads'))
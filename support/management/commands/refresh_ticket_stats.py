@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from support.counters import refresh_response_stats
+from support.models import SupportTicket
+
+
+class Command(BaseCommand):
+    help = 'Recompute response counts and last-response details for support tickets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tickets updated per UPDATE')
+
+    def handle(self, *args, **options):
+        ids = list(SupportTicket.objects.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            refresh_response_stats(ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed response stats for {len(ids)} tickets'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from support.models import TicketAttachment
+from support.scanning import scan_attachments
+
+
+class Command(BaseCommand):
+    help = 'Scan pending support attachments on this thread, e.g. after a restart dropped queued scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rescan attachments already marked clean or rejected')
+        parser.add_argument('--batch-size', type=int, default=500, help='Attachments scanned per batch')
+
+    def handle(self, *args, **options):
+        attachments = TicketAttachment.objects.all() if options['all'] else TicketAttachment.objects.filter(scan_status='pending')
+        ids = list(attachments.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        counts = {}
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            if options['all']:
+                TicketAttachment.objects.filter(pk__in=batch).update(scan_status='pending')
+            for (status, _), pks in scan_attachments(batch).items():
+                counts[status] = counts.get(status, 0) + len(pks)
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items())) or 'nothing to do'
+        self.stdout.write(self.style.SUCCESS(f'Scanned {len(ids)} attachments: {summary}'))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('support', '0003_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='supportticket',
+            index=models.Index(fields=['user', 'status', '-created_at', '-id'], name='ticket_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supportticket',
+            index=models.Index(fields=['user', 'category', '-created_at', '-id'], name='ticket_user_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supportticket',
+            index=models.Index(fields=['user', 'priority', '-created_at', '-id'], name='ticket_user_priority_idx'),
+        ),
+    ]
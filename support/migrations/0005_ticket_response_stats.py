@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_response_stats(apps, schema_editor):
+    SupportTicket = apps.get_model('support', 'SupportTicket')
+    TicketResponse = apps.get_model('support', 'TicketResponse')
+    responses = TicketResponse.objects.filter(ticket=OuterRef('pk')).order_by()
+    total = responses.values('ticket').annotate(total=Count('pk')).values('total')
+    latest = responses.order_by('-created_at', '-pk')
+    SupportTicket.objects.using(schema_editor.connection.alias).update(
+        response_count=Coalesce(Subquery(total), Value(0)),
+        last_response_at=Subquery(latest.values('created_at')[:1]),
+        last_response_by=Subquery(latest.values('user')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('support', '0004_query_shape_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supportticket',
+            name='last_response_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='supportticket',
+            name='last_response_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='supportticket',
+            name='response_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_response_stats, migrations.RunPython.noop),
+    ]
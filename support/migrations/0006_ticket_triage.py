@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:28
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+# As of this migration; later changes to the settings apply from the next save
+RANKS = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+SLA_HOURS = {'critical': 1, 'high': 4, 'medium': 24, 'low': 72}
+
+
+def backfill_triage_fields(apps, schema_editor):
+    SupportTicket = apps.get_model('support', 'SupportTicket')
+    alias = schema_editor.connection.alias
+    tickets = SupportTicket.objects.using(alias).only('priority', 'category', 'created_at')
+    batch = []
+    for ticket in tickets.iterator(chunk_size=1000):
+        priority = 'critical' if ticket.category == 'emergency_crisis' else ticket.priority
+        ticket.priority_rank = RANKS.get(priority, 2)
+        ticket.sla_due_at = ticket.created_at + timedelta(hours=SLA_HOURS.get(priority, 24))
+        batch.append(ticket)
+        if len(batch) >= 1000:
+            SupportTicket.objects.using(alias).bulk_update(batch, ['priority_rank', 'sla_due_at'])
+            batch = []
+    SupportTicket.objects.using(alias).bulk_update(batch, ['priority_rank', 'sla_due_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('support', '0005_ticket_response_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supportticket',
+            name='priority_rank',
+            field=models.PositiveSmallIntegerField(default=2, editable=False),
+        ),
+        migrations.AddField(
+            model_name='supportticket',
+            name='sla_due_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='supportticket',
+            index=models.Index(fields=['assigned_to', 'status', 'priority_rank', 'sla_due_at', 'created_at', 'id'], name='ticket_triage_idx'),
+        ),
+        migrations.RunPython(backfill_triage_fields, migrations.RunPython.noop),
+    ]
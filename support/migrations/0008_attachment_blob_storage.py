@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:39
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('support', '0007_chunked_attachment_uploads'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticketattachment',
+            name='file',
+            field=models.FileField(storage=core.storage.BlobStorage(source='attachment'), upload_to='support/attachments/%Y/%m/'),
+        ),
+    ]
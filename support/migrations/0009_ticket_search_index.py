@@ -0,0 +1,55 @@
+from django.db import DatabaseError, migrations
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE support_ticket_search USING fts5("
+                "subject, description, responses, tokenize='porter unicode61 remove_diacritics 2')"
+            )
+        except DatabaseError:
+            # SQLite was built without FTS5; search falls back to icontains
+            return
+        schema_editor.execute(
+            'INSERT INTO support_ticket_search (rowid, subject, description, responses) '
+            'SELECT t.id, t.subject, t.description, '
+            "COALESCE((SELECT group_concat(r.message, ' ') FROM support_ticketresponse r WHERE r.ticket_id = t.id), '') "
+            'FROM support_supportticket t'
+        )
+
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE support_ticket_search ('
+            'ticket_id bigint PRIMARY KEY REFERENCES support_supportticket (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX support_ticket_search_document_gin ON support_ticket_search USING GIN (document)'
+        )
+        schema_editor.execute(
+            'INSERT INTO support_ticket_search (ticket_id, document) '
+            "SELECT t.id, setweight(to_tsvector('english', t.subject), 'A') || "
+            "setweight(to_tsvector('english', t.description), 'B') || "
+            "setweight(to_tsvector('english', COALESCE(string_agg(r.message, ' '), '')), 'C') "
+            'FROM support_supportticket t LEFT JOIN support_ticketresponse r ON r.ticket_id = t.id '
+            'GROUP BY t.id'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS support_ticket_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('support', '0008_attachment_blob_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('support', '0009_ticket_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supportticket',
+            name='owner_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
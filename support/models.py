@@ -1,10 +1,22 @@
-from django.db import models
+import uuid
+
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth import get_user_model
+from core.storage import BlobStorage
 from django.urls import reverse
 from django.utils import timezone
+from . import triage
+from .ids import new_ticket_id
+from .triage import ACTIVE_STATUSES
 
 User = get_user_model()
 
+TICKET_ID_ATTEMPTS = 5
+
+# Kept up to date by support.signals with UPDATEs of their own; a ticket saved
+# from a copy loaded earlier must not write its stale values back
+RESPONSE_STATS_FIELDS = ('response_count', 'last_response_at', 'last_response_by')
+
 class SupportTicket(models.Model):
     PRIORITY_CHOICES = [
         ('low', 'Low'),
@@ -49,6 +61,25 @@ class SupportTicket(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     closed_at = models.DateTimeField(null=True, blank=True)
     
+    # Triage ordering, derived from priority and category on save
+    priority_rank = models.PositiveSmallIntegerField(default=2, editable=False)
+    sla_due_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Kept up to date from TicketResponse by support.signals
+    response_count = models.PositiveIntegerField(default=0, editable=False)
+    last_response_at = models.DateTimeField(null=True, blank=True, editable=False)
+    last_response_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
+    
+    # When the owner last opened the ticket; staff responses after it are unread
+    owner_seen_at = models.DateTimeField(default=timezone.now, editable=False)
+    
     # Admin assignment
     assigned_to = models.ForeignKey(
         User, 
@@ -63,39 +94,69 @@ class SupportTicket(models.Model):
         ordering = ['-created_at']
         verbose_name = "Support Ticket"
         verbose_name_plural = "Support Tickets"
+        indexes = [
+            # Keyset pagination of a user's tickets on (created_at, id), unfiltered
+            # and narrowed by each of the ticket list filters
+            models.Index(fields=['user', '-created_at', '-id'], name='ticket_user_created_idx'),
+            models.Index(fields=['user', 'status', '-created_at', '-id'], name='ticket_user_status_idx'),
+            models.Index(fields=['user', 'category', '-created_at', '-id'], name='ticket_user_category_idx'),
+            models.Index(fields=['user', 'priority', '-created_at', '-id'], name='ticket_user_priority_idx'),
+            # Staff triage: serves both the unclaimed queue (assigned_to IS NULL)
+            # and each agent's tickets already in queue order
+            models.Index(
+                fields=['assigned_to', 'status', 'priority_rank', 'sla_due_at', 'created_at', 'id'],
+                name='ticket_triage_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"#{self.ticket_id} - {self.subject}"
     
     def save(self, *args, **kwargs):
-        if not self.ticket_id:
-            # Generate unique ticket ID
-            import random
-            import string
-            while True:
-                ticket_id = 'TK' + ''.join(random.choices(string.digits, k=8))
-                if not SupportTicket.objects.filter(ticket_id=ticket_id).exists():
-                    self.ticket_id = ticket_id
-                    break
-        
         # Set closed_at when status changes to closed
         if self.status == 'closed' and not self.closed_at:
             self.closed_at = timezone.now()
         elif self.status != 'closed':
             self.closed_at = None
-            
-        super().save(*args, **kwargs)
+        
+        self.priority_rank = triage.priority_rank(self.priority, self.category)
+        self.sla_due_at = triage.sla_deadline(self.priority, self.category, self.created_at or timezone.now())
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in RESPONSE_STATS_FIELDS
+            ]
+        elif update_fields is not None and {'priority', 'category'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'priority_rank', 'sla_due_at'}
+        
+        if self.ticket_id:
+            super().save(*args, **kwargs)
+            return
+        
+        # New IDs need no lookup query; a clash with another process is caught
+        # by the unique constraint and retried with a fresh ID
+        for attempt in range(TICKET_ID_ATTEMPTS):
+            self.ticket_id = new_ticket_id()
+            try:
+                with transaction.atomic(using=kwargs.get('using')):
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError as exc:
+                if 'ticket_id' not in str(exc) or attempt == TICKET_ID_ATTEMPTS - 1:
+                    self.ticket_id = ''
+                    raise
     
     def get_absolute_url(self):
         return reverse('support:ticket_detail', kwargs={'ticket_id': self.ticket_id})
     
     @property
     def is_open(self):
-        return self.status in ['open', 'in_progress', 'waiting_for_customer']
+        return self.status in ACTIVE_STATUSES
     
     @property
-    def response_count(self):
-        return self.responses.count()
+    def is_overdue(self):
+        return self.is_open and self.sla_due_at is not None and self.sla_due_at < timezone.now()
     
     @property
     def last_response(self):
@@ -117,17 +178,31 @@ class TicketResponse(models.Model):
     def save(self, *args, **kwargs):
         # Automatically set is_staff_response based on user
         self.is_staff_response = self.user.is_staff
-        super().save(*args, **kwargs)
+        # The ticket's response stats are refreshed by a post_save signal;
+        # commit them together with the response
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
 class TicketAttachment(models.Model):
+    SCAN_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('clean', 'Clean'),
+        ('rejected', 'Rejected'),
+    ]
+    
     ticket = models.ForeignKey(SupportTicket, on_delete=models.CASCADE, related_name='attachments')
     response = models.ForeignKey(TicketResponse, on_delete=models.CASCADE, null=True, blank=True, related_name='attachments')
-    file = models.FileField(upload_to='support/attachments/%Y/%m/')
+    file = models.FileField(upload_to='support/attachments/%Y/%m/', storage=BlobStorage(source='attachment'))
     original_filename = models.CharField(max_length=255)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     file_size = models.PositiveIntegerField(help_text="File size in bytes")
     
+    # Set by support.scanning after upload; only clean files can be downloaded
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    content_type = models.CharField(max_length=100, blank=True, editable=False)
+    scan_status = models.CharField(max_length=10, choices=SCAN_STATUS_CHOICES, default='pending')
+    
     class Meta:
         ordering = ['-uploaded_at']
     
@@ -143,3 +218,28 @@ class TicketAttachment(models.Model):
     @property
     def file_size_mb(self):
         return round(self.file_size / (1024 * 1024), 2)
+    
+    @property
+    def is_available(self):
+        return self.scan_status == 'clean'
+
+
+class AttachmentUpload(models.Model):
+    """A chunked upload in progress, or finished and waiting to be attached"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField(help_text="Declared file size in bytes")
+    received = models.PositiveIntegerField(default=0)
+    # Set once every byte has arrived
+    sha256 = models.CharField(max_length=64, blank=True)
+    stored_name = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.received}/{self.size} bytes)"
+    
+    @property
+    def is_complete(self):
+        return bool(self.stored_name)
@@ -0,0 +1,135 @@
+"""
+Attachment scanning.
+
+New attachments start out ``pending`` and can't be downloaded until a worker
+has checked them: the first bytes must carry the signature of the type the
+file's extension claims (JPEG, PNG, GIF or PDF), and, if
+``SUPPORT_ATTACHMENT_SCANNER`` names a callable (for example a wrapper around
+a ClamAV daemon), it must return ``True`` for the open file. Attachments that
+pass are marked ``clean`` with the sniffed content type, the rest
+``rejected``. Files that can't be read, or a scanner that raises, leave the
+attachment pending for ``manage.py scan_attachments`` to retry.
+
+Scans run on a small thread pool (``SUPPORT_SCAN_WORKERS``) after the upload
+commits; ``0`` scans on the calling thread.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+)
+EXTENSION_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.pdf': 'application/pdf',
+}
+SNIFF_BYTES = 16
+
+
+def worker_count():
+    return getattr(settings, 'SUPPORT_SCAN_WORKERS', 2)
+
+
+def get_scanner():
+    path = getattr(settings, 'SUPPORT_ATTACHMENT_SCANNER', None)
+    return import_string(path) if path else None
+
+
+def sniff(head):
+    """Return the content type ``head`` starts with, or ``None``"""
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def check_file(field, scanner=None):
+    """Return the sniffed content type, or ``None`` if the file must be rejected"""
+    with field.open('rb') as file:
+        content_type = sniff(file.read(SNIFF_BYTES))
+        if content_type is None:
+            return None
+        if scanner is not None:
+            file.seek(0)
+            if not scanner(file):
+                return None
+    return content_type
+
+
+def scan_attachments(ids):
+    """Scan the pending attachments among ``ids`` and record the verdicts"""
+    from .models import TicketAttachment
+
+    scanner = get_scanner()
+    sniffed = {}
+    verdicts = {}
+    for attachment in TicketAttachment.objects.filter(pk__in=ids, scan_status='pending'):
+        # Deduplicated uploads share a file: read it once
+        name = attachment.file.name
+        try:
+            if name not in sniffed:
+                sniffed[name] = check_file(attachment.file, scanner)
+        except Exception:
+            logger.exception('Could not scan attachment %s (%s)', attachment.pk, name)
+            continue
+        expected = EXTENSION_TYPES.get(os.path.splitext(attachment.original_filename)[1].lower())
+        content_type = sniffed[name]
+        verdict = ('clean', content_type) if content_type and content_type == expected else ('rejected', content_type or '')
+        verdicts.setdefault(verdict, []).append(attachment.pk)
+
+    for (status, content_type), pks in verdicts.items():
+        TicketAttachment.objects.filter(pk__in=pks, scan_status='pending').update(
+            scan_status=status,
+            content_type=content_type,
+        )
+        if status == 'rejected':
+            logger.warning('Rejected attachments %s', pks)
+    return verdicts
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=worker_count(), thread_name_prefix='support-scans')
+    return _executor
+
+
+def _scan_in_worker(ids):
+    try:
+        scan_attachments(ids)
+    except Exception:
+        logger.exception('Could not scan attachments %s', ids)
+    finally:
+        close_old_connections()
+
+
+def schedule_scan(ids):
+    """Queue the attachments for scanning once the current transaction commits"""
+    ids = list(ids)
+    if not ids:
+        return
+    if not worker_count():
+        scan_attachments(ids)
+        return
+    transaction.on_commit(lambda: get_executor().submit(_scan_in_worker, ids))
@@ -0,0 +1,254 @@
+"""
+Full-text search for support tickets.
+
+Each ticket is indexed with its subject, description and the text of all its
+responses, in a side table that the ``0009_ticket_search_index`` migration
+creates:
+
+* SQLite: an FTS5 virtual table keyed by the ticket's rowid, ranked with
+  ``bm25``.
+* PostgreSQL: a ``tsvector`` table with a GIN index ranked with ``ts_rank``.
+
+A ticket's row is rebuilt in one statement from the ticket and its responses,
+so the ``SupportTicket`` and ``TicketResponse`` signals in ``support.signals``
+only pass ticket ids. ``manage.py rebuild_ticket_search_index`` rebuilds the
+whole table. Searches return the best ``SUPPORT_SEARCH_MAX_RESULTS`` matches;
+other databases, or a SQLite build without FTS5, fall back to ``icontains``.
+
+A query that is a whole ticket ID (``TK`` plus 8 digits for older tickets, or
+14 base32 characters) skips the index and looks the ticket up by its unique
+``ticket_id``.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+
+from core.search import SearchResults, search_terms
+
+from .models import SupportTicket, TicketResponse
+
+SEARCH_TABLE = 'support_ticket_search'
+INDEXED_FIELDS = ('subject', 'description')
+TICKET_ID_RE = re.compile(r'#?(TK(?:\d{8}|[0-9A-HJKMNP-TV-Z]{14}))', re.IGNORECASE)
+
+
+def max_results():
+    return getattr(settings, 'SUPPORT_SEARCH_MAX_RESULTS', 1000)
+
+
+def parse_ticket_id(query):
+    """The ticket ID ``query`` consists of, or ``None``"""
+    match = TICKET_ID_RE.fullmatch(query.strip())
+    return match[1].upper() if match else None
+
+
+def _placeholders(ids):
+    return ', '.join(['%s'] * len(ids))
+
+
+class IndexedSearchBackend:
+    """Base for backends that look up ranked ticket ids in the search table"""
+
+    def __init__(self, connection):
+        self.using = connection.alias
+
+    @property
+    def connection(self):
+        # Backends are shared between threads, connections are per thread
+        return connections[self.using]
+
+    def ranked_ids(self, terms, limit):
+        raise NotImplementedError
+
+    def search(self, queryset, terms):
+        return SearchResults(queryset, self.ranked_ids(terms, max_results()))
+
+
+class SQLiteSearchBackend(IndexedSearchBackend):
+    """FTS5 index with bm25 ranking (the subject weighs most, responses least)"""
+
+    def index(self, ticket_ids):
+        ticket_ids = list(ticket_ids)
+        if not ticket_ids:
+            return
+        tickets, responses = SupportTicket._meta.db_table, TicketResponse._meta.db_table
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({_placeholders(ticket_ids)})',
+                ticket_ids,
+            )
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, subject, description, responses) '
+                f'SELECT t.id, t.subject, t.description, '
+                f"COALESCE((SELECT group_concat(r.message, ' ') FROM {responses} r WHERE r.ticket_id = t.id), '') "
+                f'FROM {tickets} t WHERE t.id IN ({_placeholders(ticket_ids)})',
+                ticket_ids,
+            )
+
+    def remove(self, ticket_ids):
+        ticket_ids = list(ticket_ids)
+        if not ticket_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({_placeholders(ticket_ids)})',
+                ticket_ids,
+            )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def ranked_ids(self, terms, limit):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY bm25({SEARCH_TABLE}, 10.0, 5.0, 1.0), rowid DESC LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(IndexedSearchBackend):
+    """tsvector index with a GIN index and ts_rank ordering"""
+
+    config = 'english'
+
+    def index(self, ticket_ids):
+        ticket_ids = list(ticket_ids)
+        if not ticket_ids:
+            return
+        tickets, responses = SupportTicket._meta.db_table, TicketResponse._meta.db_table
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (ticket_id, document) '
+                f"SELECT t.id, setweight(to_tsvector('{self.config}', t.subject), 'A') || "
+                f"setweight(to_tsvector('{self.config}', t.description), 'B') || "
+                f"setweight(to_tsvector('{self.config}', COALESCE(string_agg(r.message, ' '), '')), 'C') "
+                f'FROM {tickets} t LEFT JOIN {responses} r ON r.ticket_id = t.id '
+                'WHERE t.id = ANY(%s) GROUP BY t.id '
+                'ON CONFLICT (ticket_id) DO UPDATE SET document = EXCLUDED.document',
+                [ticket_ids],
+            )
+
+    def remove(self, ticket_ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE ticket_id = ANY(%s)', [list(ticket_ids)])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+
+    def ranked_ids(self, terms, limit):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT ticket_id FROM {SEARCH_TABLE}, to_tsquery('{self.config}', %s) query "
+                'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, ticket_id DESC LIMIT %s',
+                [tsquery, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class FallbackSearchBackend:
+    """Unindexed ``icontains`` matching, used when no search table exists"""
+
+    def __init__(self, connection):
+        self.using = connection.alias
+
+    @property
+    def connection(self):
+        # Backends are shared between threads, connections are per thread
+        return connections[self.using]
+
+    def index(self, ticket_ids):
+        pass
+
+    def remove(self, ticket_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, queryset, terms):
+        for term in terms:
+            responses = TicketResponse.objects.filter(message__icontains=term).values('ticket_id')
+            queryset = queryset.filter(
+                Q(subject__icontains=term) |
+                Q(description__icontains=term) |
+                Q(pk__in=responses)
+            )
+        return queryset
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backends = {}
+
+
+def get_backend(using='default'):
+    """Return the search backend for a database alias"""
+    connection = connections[using]
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _backends:
+        backend_class = BACKENDS.get(connection.vendor, FallbackSearchBackend)
+        if SEARCH_TABLE not in connection.introspection.table_names(include_views=True):
+            backend_class = FallbackSearchBackend
+        _backends[key] = backend_class(connection)
+    return _backends[key]
+
+
+def index_tickets(ticket_ids, using='default'):
+    get_backend(using).index(ticket_ids)
+
+
+def remove_tickets(ticket_ids, using='default'):
+    get_backend(using).remove(ticket_ids)
+
+
+def rebuild_index(using='default', batch_size=500):
+    """Re-index every ticket in batches and return the number indexed"""
+    backend = get_backend(using)
+    backend.clear()
+    ids = SupportTicket.objects.using(using).order_by('pk').values_list('pk', flat=True)
+    batch = []
+    total = 0
+    for pk in ids.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            backend.index(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        backend.index(batch)
+        total += len(batch)
+    return total
+
+
+def search_tickets(queryset, query):
+    """Return the tickets in ``queryset`` matching ``query``, best matches first.
+
+    Apply any other filters before searching: indexed backends return a
+    ``SearchResults`` sequence rather than a queryset.
+    """
+    ticket_id = parse_ticket_id(query)
+    if ticket_id:
+        return queryset.filter(ticket_id=ticket_id)
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    return get_backend(queryset.db).search(queryset, terms)
+
+
+def filter_tickets(queryset, query):
+    """Like ``search_tickets``, but always a queryset, in its own order"""
+    results = search_tickets(queryset, query)
+    if isinstance(results, SearchResults):
+        return queryset.filter(pk__in=results.ranked_ids)
+    return results
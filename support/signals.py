@@ -0,0 +1,44 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import live, search
+from .counters import refresh_response_stats
+from .models import SupportTicket, TicketResponse
+
+
+@receiver(post_save, sender=TicketResponse)
+@receiver(post_delete, sender=TicketResponse)
+def update_response_stats(sender, instance, using='default', **kwargs):
+    refresh_response_stats([instance.ticket_id], using=using)
+
+
+@receiver(post_save, sender=SupportTicket)
+def index_ticket(sender, instance, update_fields=None, using='default', **kwargs):
+    """Keep the search index in step with the ticket's text"""
+    if update_fields is not None and not set(update_fields) & set(search.INDEXED_FIELDS):
+        return
+    search.index_tickets([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=SupportTicket)
+def unindex_ticket(sender, instance, using='default', **kwargs):
+    search.remove_tickets([instance.pk], using=using)
+
+
+@receiver(post_save, sender=TicketResponse)
+@receiver(post_delete, sender=TicketResponse)
+def index_ticket_responses(sender, instance, using='default', **kwargs):
+    # Responses are indexed as part of their ticket's row
+    search.index_tickets([instance.ticket_id], using=using)
+
+
+@receiver(post_save, sender=TicketResponse)
+def publish_response(sender, instance, created, using='default', **kwargs):
+    if created:
+        live.notify(instance.ticket_id, using=using)
+
+
+@receiver(post_save, sender=SupportTicket)
+def publish_ticket_change(sender, instance, using='default', **kwargs):
+    # Open streams compare the status with what they last sent
+    live.notify(instance.pk, using=using)
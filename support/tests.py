@@ -1,3 +1,688 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, close_old_connections, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core import pubsub
+from core.models import Blob
+
+from . import live, scanning, search, triage, uploads
+from .asgi import live_events
+from .ids import new_ticket_id
+from .models import AttachmentUpload, SupportTicket, TicketAttachment, TicketResponse
+
+User = get_user_model()
+
+
+def create_ticket(user, **kwargs):
+    kwargs.setdefault('subject', 'Cannot reset my password')
+    kwargs.setdefault('description', 'The reset email never arrives.')
+    return SupportTicket.objects.create(user=user, **kwargs)
+
+
+class TicketIdTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner@example.com')
+
+    def test_ids_are_unique_and_sort_in_creation_order(self):
+        ids = [new_ticket_id() for _ in range(10000)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+        self.assertTrue(all(ticket_id.startswith('TK') and len(ticket_id) == 16 for ticket_id in ids))
+
+    def test_creating_a_ticket_does_not_look_up_its_id(self):
+        # savepoint, insert, release, then the search index row
+        with self.assertNumQueries(5):
+            create_ticket(self.user)
+
+    def test_clashing_id_is_retried(self):
+        existing = create_ticket(self.user)
+        with mock.patch('support.models.new_ticket_id', side_effect=[existing.ticket_id, 'TK0000000000FRSH']):
+            ticket = create_ticket(self.user)
+        self.assertEqual(ticket.ticket_id, 'TK0000000000FRSH')
+
+
+class ResponseStatsTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner@example.com')
+        self.staff = User.objects.create_user('staff@example.com', is_staff=True, is_superuser=True)
+        self.ticket = create_ticket(self.owner)
+
+    def respond(self, user, ticket=None):
+        return TicketResponse.objects.create(ticket=ticket or self.ticket, user=user, message='Thanks')
+
+    def test_stats_follow_new_and_deleted_responses(self):
+        self.respond(self.owner)
+        latest = self.respond(self.staff)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.response_count, 2)
+        self.assertEqual((self.ticket.last_response_at, self.ticket.last_response_by), (latest.created_at, self.staff))
+
+        latest.delete()
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.response_count, self.ticket.last_response_by), (1, self.owner))
+
+    def test_owner_reply_on_waiting_ticket_keeps_stats(self):
+        self.respond(self.staff)
+        SupportTicket.objects.filter(pk=self.ticket.pk).update(status='waiting_for_customer')
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            reverse('support:ticket_detail', args=[self.ticket.ticket_id]),
+            {'submit_response': '1', 'message': 'Still broken'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, 'open')
+        self.assertEqual((self.ticket.response_count, self.ticket.last_response_by), (2, self.owner))
+
+    def test_saving_a_stale_copy_keeps_stats(self):
+        stale = SupportTicket.objects.get(pk=self.ticket.pk)
+        self.respond(self.owner)
+        stale.priority = 'high'
+        stale.save()
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.priority, 'high')
+        self.assertEqual((self.ticket.response_count, self.ticket.last_response_by), (1, self.owner))
+
+    def test_admin_changelist_queries_do_not_grow_with_tickets(self):
+        self.client.force_login(self.staff)
+        url = reverse('admin:support_supportticket_changelist')
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return len(queries)
+
+        self.respond(self.owner)
+        count_queries()  # caches the signed-in user
+        few = count_queries()
+        for _ in range(10):
+            self.respond(self.staff, create_ticket(self.owner))
+        self.assertEqual(count_queries(), few)
+
+
+class TicketSearchTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner@example.com')
+        self.staff = User.objects.create_user('staff@example.com', is_staff=True, is_superuser=True)
+
+    def search(self, query, user=None):
+        return list(search.search_tickets(SupportTicket.objects.filter(user=user or self.owner), query))
+
+    def test_index_follows_tickets_and_responses(self):
+        ticket = create_ticket(self.owner, subject='Journal will not sync')
+        self.assertEqual(self.search('journal'), [ticket])
+
+        response = TicketResponse.objects.create(ticket=ticket, user=self.staff, message='Try signing out of the tablet')
+        self.assertEqual(self.search('tablet'), [ticket])
+        response.delete()
+        self.assertEqual(self.search('tablet'), [])
+
+        ticket.subject = 'Mood tracker will not sync'
+        ticket.save()
+        self.assertEqual(self.search('journal'), [])
+        self.assertEqual(self.search('mood sync'), [ticket])
+
+        ticket.delete()
+        self.assertEqual(self.search('mood'), [])
+
+    def test_subject_matches_rank_first_and_other_users_are_hidden(self):
+        description_match = create_ticket(self.owner, subject='Question', description='Where is my invoice?')
+        subject_match = create_ticket(self.owner, subject='Invoice is wrong')
+        create_ticket(self.staff, subject='Invoice missing')
+        self.assertEqual(self.search('invoice'), [subject_match, description_match])
+
+    def test_ticket_ids_are_looked_up_directly(self):
+        ticket = create_ticket(self.owner)
+        create_ticket(self.owner)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.search(f'#{ticket.ticket_id.lower()}'), [ticket])
+        self.assertEqual(search.parse_ticket_id('TK12345678'), 'TK12345678')
+        self.assertIsNone(search.parse_ticket_id('tkinter'))
+
+    def test_rebuild_command(self):
+        ticket = create_ticket(self.owner, subject='Reminder emails')
+        search.get_backend().clear()
+        self.assertEqual(self.search('reminder'), [])
+        call_command('rebuild_ticket_search_index', stdout=StringIO())
+        self.assertEqual(self.search('reminder'), [ticket])
+
+    async def test_list_under_asgi(self):
+        url = reverse('support:ticket_list')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        tickets = [await sync_to_async(create_ticket)(self.owner, subject=f'Ticket {i}') for i in range(12)]
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get(url, {'status': 'open'})
+        self.assertEqual(response.context['total_tickets'], 12)
+        self.assertEqual(list(response.context['page_obj']), tickets[:-11:-1])
+        response = await self.async_client.get(url, {'search': tickets[0].ticket_id})
+        self.assertEqual(list(response.context['page_obj']), [tickets[0]])
+
+    def test_list_and_admin_search(self):
+        User.objects.filter(pk=self.owner.pk).update(full_name='Robin Ashdown')
+        ticket = create_ticket(self.owner, subject='Breathing exercise audio skips')
+        TicketResponse.objects.create(ticket=ticket, user=self.staff, message='Fixed in the next release')
+        create_ticket(self.owner, subject='Something else')
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('support:ticket_list'), {'search': 'breathing'})
+        self.assertEqual(list(response.context['page_obj']), [ticket])
+
+        self.client.force_login(self.staff)
+        url = reverse('admin:support_supportticket_changelist')
+        for query in ('release', ticket.ticket_id, 'owner@example.com', 'owner@', 'ashdown'):
+            response = self.client.get(url, {'q': query})
+            self.assertIn(ticket, response.context['cl'].result_list, query)
+        self.assertEqual(list(self.client.get(url, {'q': 'release'}).context['cl'].result_list), [ticket])
+
+
+class TriageQueueTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner@example.com')
+        self.agent = User.objects.create_user('agent@example.com', is_staff=True)
+        self.other_agent = User.objects.create_user('other@example.com', is_staff=True)
+
+    def test_queue_orders_by_priority_then_deadline(self):
+        low = create_ticket(self.owner, priority='low')
+        high = create_ticket(self.owner, priority='high')
+        crisis = create_ticket(self.owner, priority='low', category='emergency_crisis')
+        critical = create_ticket(self.owner, priority='critical')
+        create_ticket(self.owner, priority='critical', status='resolved')
+        self.assertEqual(list(triage.unclaimed_queue()), [crisis, critical, high, low])
+
+    def test_claims_are_exclusive(self):
+        tickets = [create_ticket(self.owner) for _ in range(3)]
+        mine = triage.claim_next(self.agent, 2)
+        theirs = triage.claim_next(self.other_agent, 5)
+        self.assertEqual(mine + theirs, tickets)
+        self.assertEqual(triage.claim_next(self.agent), [])
+        self.assertFalse(triage.claim_ticket(tickets[0], self.other_agent))
+        tickets[0].refresh_from_db()
+        self.assertEqual((tickets[0].assigned_to, tickets[0].status), (self.agent, 'in_progress'))
+
+    def test_api_lists_and_claims(self):
+        ticket = create_ticket(self.owner, priority='high')
+        self.client.force_login(self.agent)
+        self.assertEqual(self.client.get(reverse('support:triage_api')).json()['unclaimed'][0]['ticket_id'], ticket.ticket_id)
+
+        response = self.client.post(reverse('support:triage_claim'), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {'claimed': [ticket.ticket_id]})
+        response = self.client.post(reverse('support:triage_claim'), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(self.client.get(reverse('support:triage')), ticket.ticket_id)
+
+    def test_customers_cannot_see_the_queue(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(reverse('support:triage_api')).status_code, 302)
+
+
+class TriageConcurrencyTests(TransactionTestCase):
+    agents = 6
+    tickets = 60
+
+    def test_concurrent_claims_never_share_a_ticket(self):
+        owner = User.objects.create_user('owner@example.com')
+        for _ in range(self.tickets):
+            create_ticket(owner)
+        agents = [User.objects.create_user(f'agent{i}@example.com', is_staff=True) for i in range(self.agents)]
+        claimed, errors = [], []
+
+        def work(agent):
+            try:
+                while True:
+                    try:
+                        tickets = triage.claim_next(agent, 3)
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting
+                        time.sleep(0.001)
+                        continue
+                    if not tickets:
+                        break
+                    claimed.extend((ticket.pk, agent.pk) for ticket in tickets)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                close_old_connections()
+
+        workers = [threading.Thread(target=work, args=(agent,)) for agent in agents]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(claimed), self.tickets)
+        self.assertEqual(len({pk for pk, _ in claimed}), self.tickets)
+        stored = dict(SupportTicket.objects.values_list('pk', 'assigned_to'))
+        self.assertEqual(stored, dict(claimed))
+
+
+class AttachmentDownloadTests(TestCase):
+    data = bytes(range(256)) * 1024
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.owner = User.objects.create_user('owner@example.com')
+        ticket = create_ticket(self.owner)
+        self.attachment = TicketAttachment.objects.create(
+            ticket=ticket,
+            file=SimpleUploadedFile('report.pdf', self.data),
+            uploaded_by=self.owner,
+            scan_status='clean',
+        )
+        self.url = reverse('support:download_attachment', args=[self.attachment.pk])
+        self.client.force_login(self.owner)
+
+    def test_full_download_is_streamed(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertIn('attachment; filename="report.pdf"', response['Content-Disposition'])
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.data[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.data[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_other_users_cannot_download(self):
+        self.client.force_login(User.objects.create_user('other@example.com'))
+        # user, attachment with its ticket; the session is cached
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(SUPPORT_ATTACHMENT_SENDFILE='x-accel-redirect', SUPPORT_ATTACHMENT_ACCEL_PREFIX='/protected/')
+    def test_accel_redirect_hands_off_to_the_proxy(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.attachment.file.name)
+        self.assertEqual(response.content, b'')
+
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 40
+
+
+@override_settings(SUPPORT_SCAN_WORKERS=0, SUPPORT_UPLOAD_CHUNK_SIZE=4096)
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, SUPPORT_UPLOAD_TEMP_DIR=f'{media_root}/tmp'))
+        self.user = User.objects.create_user('uploader@example.com')
+        self.ticket = create_ticket(self.user)
+        self.client.force_login(self.user)
+
+    def start(self, name='report.pdf', size=len(PDF)):
+        return self.client.post(reverse('support:start_upload'), {'filename': name, 'size': size})
+
+    def send(self, url, offset, data):
+        return self.client.patch(
+            url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def upload(self, data=PDF, name='report.pdf'):
+        state = self.start(name, len(data)).json()
+        for offset in range(0, len(data), 4096):
+            state = self.send(state['url'], offset, data[offset:offset + 4096]).json()
+        self.assertTrue(state['complete'])
+        return state['id']
+
+    def respond(self, upload_ids):
+        return self.client.post(
+            reverse('support:ticket_detail', args=[self.ticket.ticket_id]),
+            {'submit_response': '1', 'message': 'Here you go', 'upload_ids': upload_ids},
+        )
+
+    def test_chunks_are_assembled_and_attached(self):
+        upload_id = self.upload()
+        upload = AttachmentUpload.objects.get(pk=upload_id)
+        self.assertEqual(upload.sha256, hashlib.sha256(PDF).hexdigest())
+
+        response = self.respond([upload_id])
+        self.assertEqual(response.status_code, 302)
+        attachment = TicketAttachment.objects.get()
+        self.assertEqual(attachment.original_filename, 'report.pdf')
+        self.assertEqual(attachment.response.message, 'Here you go')
+        self.assertEqual(attachment.file.read(), PDF)
+        self.assertEqual((attachment.scan_status, attachment.content_type), ('clean', 'application/pdf'))
+        self.assertFalse(AttachmentUpload.objects.exists())
+
+    def test_upload_resumes_from_the_recorded_offset(self):
+        state = self.start().json()
+        self.send(state['url'], 0, PDF[:5000])
+        # A retried chunk from a stale offset is refused with the real one
+        response = self.send(state['url'], 0, PDF[:5000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '5000')
+
+        # A new process has no running hash and rebuilds it from the partial file
+        uploads._hashes.clear()
+        offset = int(self.client.head(state['url'])['Upload-Offset'])
+        state = self.send(state['url'], offset, PDF[offset:]).json()
+        self.assertTrue(state['complete'])
+        self.assertEqual(AttachmentUpload.objects.get().sha256, hashlib.sha256(PDF).hexdigest())
+
+    def test_concurrent_chunks_at_one_offset_are_refused(self):
+        state = self.start().json()
+        stale = AttachmentUpload.objects.get()
+        refused = []
+
+        class InterleavedStream:
+            """The first request's body; a second request arrives while it is read"""
+            def __init__(self, data):
+                self.data = BytesIO(data)
+
+            def read(self, size):
+                if not refused:
+                    try:
+                        uploads.receive_chunk(stale, 0, BytesIO(PDF[::-1]))
+                    except uploads.UploadError as exc:
+                        refused.append(exc.status)
+                return self.data.read(size)
+
+        self.assertEqual(uploads.receive_chunk(AttachmentUpload.objects.get(), 0, InterleavedStream(PDF)), len(PDF))
+        self.assertEqual(refused, [409])
+        upload = AttachmentUpload.objects.get(pk=state['id'])
+        self.assertEqual(upload.sha256, hashlib.sha256(PDF).hexdigest())
+
+        # The loaded row is stale, but the offset is checked against the database
+        with self.assertRaises(uploads.UploadError) as caught:
+            uploads.receive_chunk(stale, 0, BytesIO(PDF))
+        self.assertEqual(caught.exception.status, 409)
+
+    def test_upload_restarts_when_the_bytes_do_not_match_the_hash(self):
+        state = self.start().json()
+        self.send(state['url'], 0, PDF[:5000])
+        # A running hash that no longer matches what is on disk
+        uploads._hashes[next(iter(uploads._hashes))] = (5000, hashlib.sha256(b'other bytes'))
+        response = self.send(state['url'], 5000, PDF[5000:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '0')
+        # Nothing was stored under the wrong digest
+        storage = TicketAttachment._meta.get_field('file').storage
+        self.assertFalse([blob for blob in Blob.objects.all() if storage.exists(blob.name)])
+
+        state = self.send(state['url'], 0, PDF).json()
+        self.assertTrue(state['complete'])
+        self.assertEqual(AttachmentUpload.objects.get().sha256, hashlib.sha256(PDF).hexdigest())
+
+    def test_bytes_beyond_the_declared_size_are_refused(self):
+        state = self.start(size=10).json()
+        response = self.send(state['url'], 0, PDF[:11])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_uploads_are_checked_and_private(self):
+        self.assertEqual(self.start(name='script.exe').status_code, 400)
+        self.assertEqual(self.start(size=11 * 1024 * 1024).status_code, 400)
+
+        url = self.start().json()['url']
+        self.client.force_login(User.objects.create_user('other@example.com'))
+        self.assertEqual(self.send(url, 0, PDF).status_code, 404)
+        self.assertEqual(self.client.head(url).status_code, 404)
+
+    def test_identical_files_share_one_blob_until_collected(self):
+        self.respond([self.upload()])
+        self.respond([self.upload()])
+        first, second = TicketAttachment.objects.order_by('pk')
+        self.assertEqual(first.file.name, second.file.name)
+        storage = first.file.storage
+
+        blob = Blob.objects.get(name=first.file.name)
+        self.assertEqual(blob.ref_count, 2)
+
+        first.delete()
+        call_command('collect_blobs', grace_hours=0, stdout=StringIO())
+        self.assertTrue(storage.exists(second.file.name))
+        second.delete()
+        call_command('collect_blobs', grace_hours=0, stdout=StringIO())
+        self.assertFalse(storage.exists(second.file.name))
+
+    def test_mislabelled_files_are_rejected_and_blocked(self):
+        with self.assertLogs('support.scanning', 'WARNING'):
+            self.respond([self.upload(data=b'MZ' + PDF, name='invoice.pdf')])
+        attachment = TicketAttachment.objects.get()
+        self.assertEqual(attachment.scan_status, 'rejected')
+        response = self.client.get(reverse('support:download_attachment', args=[attachment.pk]))
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(SUPPORT_SCAN_WORKERS=2)
+    def test_scans_are_queued_after_commit(self):
+        with mock.patch('support.scanning.get_executor') as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.respond([self.upload()])
+        attachment = TicketAttachment.objects.get()
+        self.assertEqual(attachment.scan_status, 'pending')
+        get_executor.return_value.submit.assert_called_once_with(scanning._scan_in_worker, [attachment.pk])
+
+    def test_posted_files_still_work(self):
+        response = self.client.post(
+            reverse('support:ticket_detail', args=[self.ticket.ticket_id]),
+            {
+                'submit_response': '1',
+                'message': 'Attached',
+                'attachments': [SimpleUploadedFile('scan.pdf', PDF), SimpleUploadedFile('notes.txt', b'hi')],
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        attachment = TicketAttachment.objects.get()
+        self.assertEqual((attachment.original_filename, attachment.scan_status), ('scan.pdf', 'clean'))
+        self.assertEqual(attachment.sha256, hashlib.sha256(PDF).hexdigest())
+
+    def test_stale_uploads_are_cleared(self):
+        finished = AttachmentUpload.objects.get(pk=self.upload())
+        unfinished = self.start().json()
+        AttachmentUpload.objects.update(updated_at=timezone.now() - timedelta(days=2))
+
+        call_command('clear_stale_uploads', stdout=StringIO())
+        self.assertFalse(AttachmentUpload.objects.exists())
+        # The finished upload's file goes once nothing refers to it
+        call_command('collect_blobs', grace_hours=0, stdout=StringIO())
+        self.assertFalse(TicketAttachment._meta.get_field('file').storage.exists(finished.stored_name))
+        self.assertFalse(os.path.exists(os.path.join(uploads.temp_dir(), f"{unfinished['id']}.part")))
+
+
+class LiveTicketTests(TransactionTestCase):
+    # The stream reads on pool threads and is woken when changes commit
+    def setUp(self):
+        self.owner = User.objects.create_user('owner@example.com')
+        self.agent = User.objects.create_user('agent@example.com', is_staff=True)
+        self.ticket = create_ticket(self.owner)
+        self.first = TicketResponse.objects.create(ticket=self.ticket, user=self.agent, message='Looking into it')
+        self.url = reverse('support:ticket_events', args=[self.ticket.ticket_id])
+
+    async def open_stream(self, user, **kwargs):
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(self.url, **kwargs)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response
+
+    async def test_new_responses_and_status_changes_are_pushed(self):
+        response = await self.open_stream(self.owner, data={'after': self.first.pk, 'status': 'open'})
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+        channel = live.channel(self.ticket.pk)
+
+        # Nothing new yet: the stream waits on its channel
+        waiting = asyncio.ensure_future(anext(chunks))
+        while not pubsub.get_broker().subscribers(channel):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        self.assertFalse(waiting.done())
+
+        reply = await sync_to_async(TicketResponse.objects.create)(
+            ticket=self.ticket, user=self.agent, message='Please try again now',
+        )
+        chunk = (await asyncio.wait_for(waiting, 5)).decode()
+        self.assertIn('event: response\n', chunk)
+        self.assertIn(f'id: {reply.pk}\n', chunk)
+        self.assertIn('Please try again now', chunk)
+        self.assertNotIn('Looking into it', chunk)
+
+        self.ticket.status = 'resolved'
+        await sync_to_async(self.ticket.save)()
+        chunk = (await asyncio.wait_for(anext(chunks), 5)).decode()
+        self.assertIn('event: status\n', chunk)
+        self.assertIn('"label": "Resolved"', chunk)
+
+        # A client disconnecting cancels the response task mid-wait
+        waiting = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0.1)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(pubsub.get_broker().subscribers(channel), 0)
+
+    async def test_claiming_a_ticket_wakes_its_streams(self):
+        response = await self.open_stream(self.owner, data={'after': self.first.pk, 'status': 'open'})
+        chunks = aiter(response.streaming_content)
+        await anext(chunks)
+        waiting = asyncio.ensure_future(anext(chunks))
+        while not pubsub.get_broker().subscribers(live.channel(self.ticket.pk)):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+
+        self.assertTrue(await sync_to_async(triage.claim_ticket)(self.ticket, self.agent))
+        chunk = (await asyncio.wait_for(waiting, 5)).decode()
+        self.assertIn('event: status\n', chunk)
+        self.assertIn('"status": "in_progress"', chunk)
+
+    @override_settings(SUPPORT_LIVE_STREAM_SECONDS=0)
+    async def test_reconnect_resumes_after_last_event_id(self):
+        second = await sync_to_async(TicketResponse.objects.create)(
+            ticket=self.ticket, user=self.agent, message='Reset link sent',
+        )
+        response = await self.open_stream(
+            self.owner, data={'after': 0, 'status': 'open'}, headers={'Last-Event-ID': str(self.first.pk)},
+        )
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(body.count('event: response'), 1)
+        self.assertIn(f'id: {second.pk}\n', body)
+        self.assertNotIn('event: status', body)
+
+        # The owner has now seen the agent's responses
+        ticket = await SupportTicket.objects.aget(pk=self.ticket.pk)
+        self.assertGreaterEqual(ticket.owner_seen_at, second.created_at)
+
+    async def test_other_users_cannot_follow_a_ticket(self):
+        stranger = await sync_to_async(User.objects.create_user)('stranger@example.com')
+        await self.async_client.aforce_login(stranger)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+
+class LiveStreamServerTests(TransactionTestCase):
+    streams = 200
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner@example.com')
+        self.agent = User.objects.create_user('agent@example.com', is_staff=True)
+        self.ticket = create_ticket(self.owner)
+        TicketResponse.objects.create(ticket=self.ticket, user=self.agent, message='Looking into it')
+        self.url = reverse('support:ticket_events', args=[self.ticket.ticket_id])
+        self.passed_on = []
+
+        async def django(scope, receive, send):
+            self.passed_on.append(scope['path'])
+
+        self.app = live_events(django)
+
+    def scope(self, user=None, path=None):
+        headers = []
+        if user is not None:
+            self.client.force_login(user)
+            headers.append((b'cookie', f'sessionid={self.client.cookies["sessionid"].value}'.encode()))
+        return {
+            'type': 'http', 'method': 'GET', 'path': path or self.url, 'root_path': '',
+            'query_string': b'after=0&status=open', 'headers': headers,
+            'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+        }
+
+    async def open_stream(self, scope):
+        messages = asyncio.Queue()
+        gone = asyncio.Event()
+
+        async def receive():
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        task = asyncio.ensure_future(self.app(scope, receive, messages.put))
+        return task, gone, messages
+
+    async def next_chunk(self, messages):
+        message = await asyncio.wait_for(messages.get(), 10)
+        return message.get('body', b'').decode()
+
+    async def test_open_streams_hold_no_threads(self):
+        # Followed by staff, whose reads write nothing
+        scope = await sync_to_async(self.scope)(self.agent)
+        threads = threading.active_count()
+        streams = [await self.open_stream(scope) for _ in range(self.streams)]
+        for _, _, messages in streams:
+            start = await asyncio.wait_for(messages.get(), 10)
+            self.assertEqual(start['status'], 200)
+            self.assertEqual(await self.next_chunk(messages), 'retry: 3000\n\n')
+            # Every stream has made its first read
+            self.assertIn('Looking into it', await self.next_chunk(messages))
+        channel = live.channel(self.ticket.pk)
+        while pubsub.get_broker().subscribers(channel) < self.streams:
+            await asyncio.sleep(0.01)
+        # Only the shared pool the reads run on, not a thread per stream
+        self.assertLess(threading.active_count() - threads, 40)
+
+        await sync_to_async(TicketResponse.objects.create)(
+            ticket=self.ticket, user=self.agent, message='Please try again now',
+        )
+        for _, _, messages in streams:
+            self.assertIn('Please try again now', await self.next_chunk(messages))
+
+        for task, gone, _ in streams:
+            gone.set()
+        await asyncio.wait_for(asyncio.gather(*(task for task, _, _ in streams)), 10)
+        self.assertEqual(pubsub.get_broker().subscribers(channel), 0)
+        self.assertEqual(self.passed_on, [])
+
+    async def test_other_requests_go_to_django(self):
+        stranger = await sync_to_async(User.objects.create_user)('stranger@example.com')
+        scopes = [
+            self.scope(),
+            await sync_to_async(self.scope)(stranger),
+            self.scope(path=reverse('support:ticket_list')),
+        ]
+        for scope in scopes:
+            task, _, _ = await self.open_stream(scope)
+            await asyncio.wait_for(task, 10)
+        self.assertEqual(self.passed_on, [self.url, self.url, reverse('support:ticket_list')])
@@ -0,0 +1,99 @@
+"""
+Staff triage queue.
+
+Every ticket carries a ``priority_rank`` (0 is most urgent; emergency/crisis
+tickets always rank as critical) and an ``sla_due_at`` deadline taken from
+``SUPPORT_SLA_HOURS``, both kept up to date by ``SupportTicket.save``. The
+unclaimed queue is ordered by rank, deadline and age straight from the
+``ticket_triage_idx`` index, so the top N is one indexed query however long
+the backlog is. The same index serves each agent's own queue.
+
+Claims lock the rows they take with ``select_for_update(skip_locked=True)``,
+so concurrent agents are handed different tickets instead of waiting on each
+other. The UPDATE only matches tickets that are still unassigned, which keeps
+claims exclusive on SQLite too, where row locks don't exist.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+PRIORITY_RANKS = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+QUEUE_ORDER = ('priority_rank', 'sla_due_at', 'created_at', 'id')
+ACTIVE_STATUSES = ('open', 'in_progress', 'waiting_for_customer')
+EMERGENCY_CATEGORY = 'emergency_crisis'
+
+
+def sla_hours():
+    return getattr(settings, 'SUPPORT_SLA_HOURS', {'critical': 1, 'high': 4, 'medium': 24, 'low': 72})
+
+
+def effective_priority(priority, category):
+    return 'critical' if category == EMERGENCY_CATEGORY else priority
+
+
+def priority_rank(priority, category):
+    return PRIORITY_RANKS.get(effective_priority(priority, category), PRIORITY_RANKS['medium'])
+
+
+def sla_deadline(priority, category, opened_at):
+    hours = sla_hours().get(effective_priority(priority, category), sla_hours()['medium'])
+    return opened_at + timedelta(hours=hours)
+
+
+def unclaimed_queue():
+    """Open, unassigned tickets, most urgent first"""
+    from .models import SupportTicket
+
+    return SupportTicket.objects.filter(status='open', assigned_to=None).order_by(*QUEUE_ORDER)
+
+
+def agent_queue(agent):
+    """Active tickets assigned to ``agent``, most urgent first"""
+    from .models import SupportTicket
+
+    return SupportTicket.objects.filter(assigned_to=agent, status__in=ACTIVE_STATUSES).order_by(*QUEUE_ORDER)
+
+
+def _assign(ids, agent, **conditions):
+    """Assign the tickets in ``ids`` that still match ``conditions``; returns how many"""
+    from . import live
+    from .models import SupportTicket
+
+    assigned = SupportTicket.objects.filter(pk__in=ids, **conditions).update(
+        assigned_to=agent,
+        status=Case(When(status='open', then=Value('in_progress')), default=F('status')),
+        updated_at=timezone.now(),
+    )
+    if assigned:
+        # update() sends no post_save, so the tickets' live streams are woken here
+        for pk in ids:
+            live.notify(pk)
+    return assigned
+
+
+def claim_next(agent, count=1):
+    """Assign the ``count`` most urgent unclaimed tickets to ``agent`` and return them"""
+    from .models import SupportTicket
+
+    with transaction.atomic():
+        ids = list(
+            unclaimed_queue().select_for_update(skip_locked=True).values_list('pk', flat=True)[:count]
+        )
+        if not ids:
+            return []
+        _assign(ids, agent, status='open', assigned_to=None)
+        # Anything another agent took first is left out
+        return list(SupportTicket.objects.filter(pk__in=ids, assigned_to=agent).order_by(*QUEUE_ORDER))
+
+
+def claim_ticket(ticket, agent):
+    """Claim one open ticket if nobody has; returns whether ``agent`` got it"""
+    return bool(_assign([ticket.pk], agent, status='open', assigned_to=None))
+
+
+def assign_ticket(ticket, agent):
+    """Hand an active ticket to ``agent``, whoever holds it now"""
+    return bool(_assign([ticket.pk], agent, status__in=ACTIVE_STATUSES))
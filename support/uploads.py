@@ -0,0 +1,328 @@
+"""
+Chunked, resumable attachment uploads.
+
+Instead of posting files with the ticket form, the browser opens an upload
+(``POST /support/uploads/`` with the file's name and size) and sends the
+bytes in chunks (``PATCH`` with an ``Upload-Offset`` header). Each chunk is
+streamed to a partial file under ``SUPPORT_UPLOAD_TEMP_DIR`` while a SHA-256
+runs over it. After a dropped connection, ``HEAD`` reports how many bytes
+arrived and the client carries on from there; a process that didn't see the
+earlier chunks re-hashes the partial file first.
+
+When the last byte lands the partial file is moved into the
+content-addressed attachment storage (``core.storage``), which keeps a
+single copy of identical files. The ticket or response form then only posts the
+upload ids: ``attach`` bulk-creates the attachment rows and queues them for
+scanning (see ``support.scanning``), so the form POST does no file work.
+
+Browsers without JavaScript still post the files with the form; they are
+checked, hashed and deduplicated the same way.
+"""
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File, locks
+from django.utils import timezone
+
+from core import blobs
+from core.storage import DigestMismatch, digest_of
+
+from .scanning import EXTENSION_TYPES, schedule_scan
+
+MAX_ATTACHMENT_SIZE = 10 * 1024 * 1024
+MAX_OPEN_UPLOADS = 20
+READ_SIZE = 64 * 1024
+# Running hashes kept between chunks, per process
+MAX_RUNNING_HASHES = 1000
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def temp_dir():
+    return str(getattr(settings, 'SUPPORT_UPLOAD_TEMP_DIR', settings.BASE_DIR / 'tmp' / 'uploads'))
+
+
+def chunk_size():
+    return getattr(settings, 'SUPPORT_UPLOAD_CHUNK_SIZE', 1024 * 1024)
+
+
+def expiry():
+    return timedelta(hours=getattr(settings, 'SUPPORT_UPLOAD_EXPIRY_HOURS', 24))
+
+
+def attachment_field():
+    from .models import TicketAttachment
+
+    return TicketAttachment._meta.get_field('file')
+
+
+def validate_file(name, size):
+    """Return why a file can't be attached, or ``None``"""
+    if os.path.splitext(name)[1].lower() not in EXTENSION_TYPES:
+        return f'File {name} is not supported. Only JPG, PNG, GIF, and PDF files are allowed.'
+    if size > MAX_ATTACHMENT_SIZE:
+        return f'File {name} is too large (max 10MB)'
+    return None
+
+
+def partial_path(upload):
+    return os.path.join(temp_dir(), f'{upload.pk}.part')
+
+
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+
+
+def _take_hash(upload, offset):
+    with _hashes_lock:
+        entry = _hashes.pop(upload.pk, None)
+    if entry and entry[0] == offset:
+        return entry[1]
+    # The earlier chunks went to another process: hash what's on disk
+    hasher = hashlib.sha256()
+    if offset:
+        with open(partial_path(upload), 'rb') as file:
+            remaining = offset
+            while remaining:
+                block = file.read(min(READ_SIZE, remaining))
+                if not block:
+                    raise UploadError('The partial upload is missing; please start again', status=410)
+                hasher.update(block)
+                remaining -= len(block)
+    return hasher
+
+
+def _keep_hash(upload, offset, hasher):
+    with _hashes_lock:
+        _hashes[upload.pk] = (offset, hasher)
+        while len(_hashes) > MAX_RUNNING_HASHES:
+            _hashes.popitem(last=False)
+
+
+def _forget_hash(upload):
+    with _hashes_lock:
+        _hashes.pop(upload.pk, None)
+
+
+def store(name, content):
+    field = attachment_field()
+    return field.storage.save(field.generate_filename(None, name), content)
+
+
+class PartialFile(File):
+    """A finished partial upload; storage moves it into place instead of copying"""
+    def __init__(self, path, name, sha256):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = path
+        # Already hashed chunk by chunk, so storage needn't read it again
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def start_upload(user, filename, size):
+    from .models import AttachmentUpload
+
+    filename = os.path.basename(filename or '').strip()
+    if not filename or size < 0:
+        raise UploadError('Missing file name or size')
+    problem = validate_file(filename, size)
+    if problem:
+        raise UploadError(problem)
+    open_uploads = AttachmentUpload.objects.filter(user=user, stored_name='', created_at__gte=timezone.now() - expiry())
+    if open_uploads.count() >= MAX_OPEN_UPLOADS:
+        raise UploadError('Too many unfinished uploads; please try again later', status=429)
+
+    upload = AttachmentUpload.objects.create(user=user, filename=filename, size=size)
+    os.makedirs(temp_dir(), exist_ok=True)
+    open(partial_path(upload), 'wb').close()
+    if size == 0:
+        finish_upload(upload, hashlib.sha256())
+    return upload
+
+
+def receive_chunk(upload, offset, stream):
+    """Append the bytes in ``stream`` at ``offset`` and return the new offset.
+
+    A chunk cut short by a dropped connection still counts up to its last
+    byte, so the client resumes from there. One request at a time writes to
+    an upload: the partial file is locked before the offset is checked.
+    """
+    from .models import AttachmentUpload
+
+    if upload.is_complete:
+        raise UploadError('This upload is already complete', status=409)
+    try:
+        file = open(partial_path(upload), 'r+b')
+    except FileNotFoundError:
+        if AttachmentUpload.objects.filter(pk=upload.pk).exclude(stored_name='').exists():
+            raise UploadError('This upload is already complete', status=409)
+        raise UploadError('The partial upload is missing; please start again', status=410)
+    with file:
+        if not locks.lock(file, locks.LOCK_EX | locks.LOCK_NB):
+            raise UploadError('Another request is uploading this file', status=409)
+        try:
+            # The row may have been loaded before another request moved it on
+            try:
+                upload.received, upload.stored_name = AttachmentUpload.objects.filter(pk=upload.pk).values_list(
+                    'received', 'stored_name',
+                ).get()
+            except AttachmentUpload.DoesNotExist:
+                raise UploadError('The upload has expired; please start again', status=410)
+            if upload.is_complete:
+                raise UploadError('This upload is already complete', status=409)
+            if offset != upload.received:
+                raise UploadError(f'Expected offset {upload.received}', status=409)
+            hasher = write_chunk(upload, file, offset, stream)
+            if upload.received == upload.size:
+                finish_upload(upload, hasher)
+            else:
+                _keep_hash(upload, upload.received, hasher)
+        finally:
+            locks.unlock(file)
+    return upload.received
+
+
+def write_chunk(upload, file, offset, stream):
+    """Write the chunk, record how far it got and return the running hash"""
+    from .models import AttachmentUpload
+
+    hasher = _take_hash(upload, offset)
+    limit = upload.size - offset
+    written = 0
+    try:
+        file.seek(offset)
+        # Drops bytes of an earlier chunk that never got recorded
+        file.truncate()
+        while True:
+            block = stream.read(min(READ_SIZE, limit - written + 1))
+            if not block:
+                break
+            if written + len(block) > limit:
+                file.truncate(offset)
+                written = 0
+                raise UploadError(f'The file is larger than the declared {upload.size} bytes')
+            file.write(block)
+            hasher.update(block)
+            written += len(block)
+    finally:
+        file.flush()
+        upload.received = offset + written
+        AttachmentUpload.objects.filter(pk=upload.pk).update(
+            received=upload.received,
+            updated_at=timezone.now(),
+        )
+    return hasher
+
+
+def finish_upload(upload, hasher):
+    from .models import AttachmentUpload
+
+    _forget_hash(upload)
+    path = partial_path(upload)
+    content = PartialFile(path, upload.filename, hasher.hexdigest())
+    try:
+        # Identical content is already stored: the partial file is just dropped
+        name = store(upload.filename, content)
+    except DigestMismatch:
+        # Not what was hashed on the way in: start the upload over
+        open(path, 'wb').close()
+        upload.received = 0
+        AttachmentUpload.objects.filter(pk=upload.pk).update(received=0, updated_at=timezone.now())
+        raise UploadError('The file did not arrive intact; please upload it again', status=409)
+    finally:
+        content.close()
+    if os.path.exists(path):
+        os.remove(path)
+    upload.sha256, upload.stored_name = digest_of(name), name
+    AttachmentUpload.objects.filter(pk=upload.pk).update(sha256=upload.sha256, stored_name=name)
+    blobs.sync_references([upload])
+
+
+def parse_upload_ids(values):
+    ids = []
+    for value in values:
+        try:
+            ids.append(uuid.UUID(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def attach(ticket, user, files=(), upload_ids=(), response=None):
+    """Attach posted ``files`` and finished uploads to the ticket or response.
+
+    Returns a message for each file that couldn't be attached.
+    """
+    from .models import AttachmentUpload, TicketAttachment
+
+    problems = []
+    attachments = []
+    for file in files:
+        problem = validate_file(file.name, file.size)
+        if problem:
+            problems.append(problem)
+            continue
+        name = store(file.name, file)
+        attachments.append(TicketAttachment(
+            file=name,
+            original_filename=file.name,
+            file_size=file.size,
+            sha256=digest_of(name),
+        ))
+
+    upload_ids = parse_upload_ids(upload_ids)
+    uploads = list(AttachmentUpload.objects.filter(pk__in=upload_ids, user=user).exclude(stored_name=''))
+    if len(uploads) < len(upload_ids):
+        problems.append('Some files did not finish uploading; please attach them again.')
+    attachments += [
+        TicketAttachment(
+            file=upload.stored_name,
+            original_filename=upload.filename,
+            file_size=upload.size,
+            sha256=upload.sha256,
+        )
+        for upload in uploads
+    ]
+
+    for attachment in attachments:
+        attachment.ticket = ticket
+        attachment.response = response
+        attachment.uploaded_by = user
+    created = TicketAttachment.objects.bulk_create(attachments)
+    blobs.sync_references(created)
+    # Deleting the uploads releases their hold on the blobs
+    if uploads:
+        AttachmentUpload.objects.filter(pk__in=[upload.pk for upload in uploads]).delete()
+    schedule_scan(attachment.pk for attachment in created)
+    return problems
+
+
+def clear_stale_uploads(older_than=None):
+    """Delete uploads untouched since ``older_than`` and their partial files.
+
+    Files of finished uploads that were never attached are left to blob
+    garbage collection.
+    """
+    from .models import AttachmentUpload
+
+    cutoff = timezone.now() - (older_than if older_than is not None else expiry())
+    stale = list(AttachmentUpload.objects.filter(updated_at__lt=cutoff))
+    for upload in stale:
+        _forget_hash(upload)
+        try:
+            os.remove(partial_path(upload))
+        except FileNotFoundError:
+            pass
+    AttachmentUpload.objects.filter(pk__in=[upload.pk for upload in stale]).delete()
+    return len(stale)
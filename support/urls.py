@@ -9,6 +9,14 @@ urlpatterns = [
     path('tickets/', views.ticket_list, name='ticket_list'),
     path('create/', views.create_ticket, name='create_ticket'),
     path('ticket/<str:ticket_id>/', views.ticket_detail, name='ticket_detail'),
+    path('ticket/<str:ticket_id>/events/', views.ticket_events, name='ticket_events'),
     path('ticket/<str:ticket_id>/close/', views.close_ticket, name='close_ticket'),
     path('attachment/<int:attachment_id>/download/', views.download_attachment, name='download_attachment'),
+    path('uploads/', views.start_upload, name='start_upload'),
+    path('uploads/<uuid:upload_id>/', views.upload_detail, name='upload_detail'),
+    
+    # Staff triage
+    path('triage/', views.triage_queue, name='triage'),
+    path('triage/api/', views.triage_api, name='triage_api'),
+    path('triage/claim/', views.triage_claim, name='triage_claim'),
 ]
\ No newline at end of file
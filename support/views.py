@@ -1,20 +1,28 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import HttpResponse, Http404
-from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods, require_POST
 from django.conf import settings
-import os
+from django.utils import timezone
 
-from .models import SupportTicket, TicketResponse, TicketAttachment
+from core.pagination import apaginate
+from user import dashboard
+
+from . import live, search, triage, uploads
+from .downloads import serve_attachment
+from .models import AttachmentUpload, SupportTicket, TicketResponse, TicketAttachment
 from .forms import SupportTicketForm, TicketResponseForm, TicketSearchForm
 
 @login_required
-def ticket_list(request):
+async def ticket_list(request):
     """List user's support tickets"""
-    tickets = SupportTicket.objects.filter(user=request.user).select_related('assigned_to')
+    user = await request.auser()
+    tickets = SupportTicket.objects.filter(user=user).select_related('assigned_to')
     
     # Search and filter
     search_form = TicketSearchForm(request.GET)
@@ -24,13 +32,6 @@ def ticket_list(request):
         category_filter = search_form.cleaned_data.get('category')
         priority_filter = search_form.cleaned_data.get('priority')
         
-        if search_query:
-            tickets = tickets.filter(
-                Q(ticket_id__icontains=search_query) |
-                Q(subject__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
-        
         if status_filter:
             tickets = tickets.filter(status=status_filter)
         
@@ -39,16 +40,18 @@ def ticket_list(request):
             
         if priority_filter:
             tickets = tickets.filter(priority=priority_filter)
+        
+        # Searched last: the index returns ranked hits rather than a queryset
+        if search_query:
+            tickets = await sync_to_async(search.search_tickets)(tickets, search_query)
     
-    # Pagination
-    paginator = Paginator(tickets, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination; the page and the total are read together
+    page_obj = await apaginate(tickets, 10, cursor=request.GET.get('cursor'))
     
     context = {
         'page_obj': page_obj,
         'search_form': search_form,
-        'total_tickets': tickets.count(),
+        'total_tickets': page_obj.total,
     }
     return render(request, 'support/ticket_list.html', context)
 
@@ -60,28 +63,15 @@ def create_ticket(request):
         if form.is_valid():
             ticket = form.save()
             
-            # Handle file attachments
-            files = request.FILES.getlist('attachments')
-            allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.pdf']
-            
-            for file in files:
-                # Check file extension
-                file_ext = file.name.lower().split('.')[-1]
-                if f'.{file_ext}' not in allowed_extensions:
-                    messages.warning(request, f'File {file.name} is not supported. Only JPG, PNG, GIF, and PDF files are allowed.')
-                    continue
-                    
-                # Check file size
-                if file.size <= 10 * 1024 * 1024:  # 10MB limit
-                    TicketAttachment.objects.create(
-                        ticket=ticket,
-                        file=file,
-                        uploaded_by=request.user,
-                        original_filename=file.name,
-                        file_size=file.size
-                    )
-                else:
-                    messages.warning(request, f'File {file.name} is too large (max 10MB)')
+            # Files posted with the form, or uploaded beforehand in chunks
+            problems = uploads.attach(
+                ticket,
+                request.user,
+                files=request.FILES.getlist('attachments'),
+                upload_ids=request.POST.getlist('upload_ids'),
+            )
+            for problem in problems:
+                messages.warning(request, problem)
             
             messages.success(request, f'Support ticket #{ticket.ticket_id} has been created successfully!')
             return redirect('support:ticket_detail', ticket_id=ticket.ticket_id)
@@ -106,8 +96,14 @@ def ticket_detail(request, ticket_id):
     if not (ticket.user == request.user or request.user.is_staff):
         raise Http404("Ticket not found")
     
+    if ticket.user_id == request.user.id and ticket.last_response_at and ticket.last_response_at > ticket.owner_seen_at:
+        # The owner is reading the new responses
+        ticket.owner_seen_at = timezone.now()
+        SupportTicket.objects.filter(pk=ticket.pk).update(owner_seen_at=ticket.owner_seen_at)
+        dashboard.invalidate(request.user.id)
+    
     # Get responses and attachments
-    responses = ticket.responses.select_related('user').prefetch_related('attachments')
+    responses = list(ticket.responses.select_related('user').prefetch_related('attachments'))
     attachments = ticket.attachments.filter(response__isnull=True)  # Ticket-level attachments
     
     # Forms
@@ -123,36 +119,25 @@ def ticket_detail(request, ticket_id):
                 ticket=ticket
             )
             if response_form.is_valid():
-                response = response_form.save()
-                
-                # Handle response attachments
-                files = request.FILES.getlist('attachments')
-                allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.pdf']
-                
-                for file in files:
-                    # Check file extension
-                    file_ext = file.name.lower().split('.')[-1]
-                    if f'.{file_ext}' not in allowed_extensions:
-                        messages.warning(request, f'File {file.name} is not supported. Only JPG, PNG, GIF, and PDF files are allowed.')
-                        continue
-                        
-                    # Check file size
-                    if file.size <= 10 * 1024 * 1024:  # 10MB limit
-                        TicketAttachment.objects.create(
-                            ticket=ticket,
-                            response=response,
-                            file=file,
-                            uploaded_by=request.user,
-                            original_filename=file.name,
-                            file_size=file.size
-                        )
-                    else:
-                        messages.warning(request, f'File {file.name} is too large (max 10MB)')
-                
-                # Update ticket status if customer responds
-                if not request.user.is_staff and ticket.status == 'waiting_for_customer':
-                    ticket.status = 'open'
-                    ticket.save()
+                # Committed together, so live streams see the response with its attachments
+                with transaction.atomic():
+                    response = response_form.save()
+                    
+                    # Files posted with the form, or uploaded beforehand in chunks
+                    problems = uploads.attach(
+                        ticket,
+                        request.user,
+                        files=request.FILES.getlist('attachments'),
+                        upload_ids=request.POST.getlist('upload_ids'),
+                        response=response,
+                    )
+                    
+                    # Update ticket status if customer responds
+                    if not request.user.is_staff and ticket.status == 'waiting_for_customer':
+                        ticket.status = 'open'
+                        ticket.save(update_fields=['status', 'closed_at', 'updated_at'])
+                for problem in problems:
+                    messages.warning(request, problem)
                 
                 messages.success(request, 'Your response has been added successfully!')
                 return redirect('support:ticket_detail', ticket_id=ticket.ticket_id)
@@ -164,9 +149,23 @@ def ticket_detail(request, ticket_id):
         'responses': responses,
         'attachments': attachments,
         'response_form': response_form,
+        # Where the page's live updates pick up
+        'last_response_id': responses[-1].pk if responses else 0,
     }
     return render(request, 'support/ticket_detail.html', context)
 
+@login_required
+async def ticket_events(request, ticket_id):
+    """Server-sent events with the ticket's new responses and status changes"""
+    user = await request.auser()
+    ticket = await aget_object_or_404(SupportTicket, ticket_id=ticket_id)
+    
+    if not (ticket.user_id == user.id or user.is_staff):
+        raise Http404("Ticket not found")
+    
+    after, status = live.stream_position(request, ticket)
+    return StreamingHttpResponse(live.stream(ticket, user, after, status), headers=live.HEADERS)
+
 @login_required
 def close_ticket(request, ticket_id):
     """Close a support ticket"""
@@ -180,7 +179,7 @@ def close_ticket(request, ticket_id):
         raise Http404("Ticket not found")
     
     ticket.status = 'closed'
-    ticket.save()
+    ticket.save(update_fields=['status', 'closed_at', 'updated_at'])
     
     messages.success(request, f'Ticket #{ticket.ticket_id} has been closed.')
     return redirect('support:ticket_detail', ticket_id=ticket.ticket_id)
@@ -188,17 +187,137 @@ def close_ticket(request, ticket_id):
 @login_required
 def download_attachment(request, attachment_id):
     """Download ticket attachment"""
-    attachment = get_object_or_404(TicketAttachment, id=attachment_id)
+    attachment = get_object_or_404(TicketAttachment.objects.select_related('ticket'), id=attachment_id)
     
     # Check permissions
-    if not (attachment.ticket.user == request.user or request.user.is_staff):
+    if not (attachment.ticket.user_id == request.user.id or request.user.is_staff):
         raise Http404("File not found")
     
+    if not attachment.is_available:
+        if attachment.scan_status == 'pending':
+            messages.info(request, f'{attachment.original_filename} is still being checked. Please try again shortly.')
+        else:
+            messages.error(request, f'{attachment.original_filename} failed the safety check and cannot be downloaded.')
+        return redirect('support:ticket_detail', ticket_id=attachment.ticket.ticket_id)
+    
     try:
-        response = HttpResponse(attachment.file.read(), content_type='application/octet-stream')
-        response['Content-Disposition'] = f'attachment; filename="{attachment.original_filename}"'
-        return response
+        return serve_attachment(request, attachment)
     except FileNotFoundError:
         messages.error(request, 'File not found on server.')
         return redirect('support:ticket_detail', ticket_id=attachment.ticket.ticket_id)
 
+
+def upload_state(upload):
+    response = JsonResponse({
+        'id': str(upload.id),
+        'url': reverse('support:upload_detail', args=[upload.id]),
+        'offset': upload.received,
+        'size': upload.size,
+        'complete': upload.is_complete,
+        'chunk_size': uploads.chunk_size(),
+    })
+    response['Upload-Offset'] = str(upload.received)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+@login_required
+@require_POST
+def start_upload(request):
+    """Open a chunked upload for an attachment"""
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Missing file name or size'}, status=400)
+    try:
+        upload = uploads.start_upload(request.user, request.POST.get('filename'), size)
+    except uploads.UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    response = upload_state(upload)
+    response.status_code = 201
+    return response
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PATCH'])
+def upload_detail(request, upload_id):
+    """Report how far an upload got (GET/HEAD) or append a chunk (PATCH)"""
+    upload = get_object_or_404(AttachmentUpload, pk=upload_id, user=request.user)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Missing Upload-Offset header'}, status=400)
+        try:
+            uploads.receive_chunk(upload, offset, request)
+        except uploads.UploadError as exc:
+            upload.refresh_from_db(fields=['received'])
+            response = JsonResponse({'error': str(exc), 'offset': upload.received}, status=exc.status)
+            response['Upload-Offset'] = str(upload.received)
+            return response
+    return upload_state(upload)
+
+
+def triage_limit(request):
+    default = getattr(settings, 'SUPPORT_TRIAGE_QUEUE_SIZE', 25)
+    try:
+        return max(1, min(int(request.GET.get('limit', default)), 100))
+    except ValueError:
+        return default
+
+def ticket_summary(ticket):
+    return {
+        'ticket_id': ticket.ticket_id,
+        'subject': ticket.subject,
+        'category': ticket.category,
+        'priority': ticket.priority,
+        'status': ticket.status,
+        'requester': ticket.user.get_full_name(),
+        'created_at': ticket.created_at.isoformat(),
+        'sla_due_at': ticket.sla_due_at.isoformat() if ticket.sla_due_at else None,
+        'overdue': ticket.is_overdue,
+        'url': ticket.get_absolute_url(),
+    }
+
+@staff_member_required
+def triage_queue(request):
+    """Staff triage: the most urgent unclaimed tickets and the agent's own"""
+    limit = triage_limit(request)
+    context = {
+        'unclaimed': triage.unclaimed_queue().select_related('user')[:limit],
+        'mine': triage.agent_queue(request.user).select_related('user')[:limit],
+    }
+    return render(request, 'support/triage.html', context)
+
+@staff_member_required
+def triage_api(request):
+    """JSON version of the triage queue"""
+    limit = triage_limit(request)
+    return JsonResponse({
+        'unclaimed': [ticket_summary(ticket) for ticket in triage.unclaimed_queue().select_related('user')[:limit]],
+        'mine': [ticket_summary(ticket) for ticket in triage.agent_queue(request.user).select_related('user')[:limit]],
+    })
+
+@staff_member_required
+@require_POST
+def triage_claim(request):
+    """Claim a specific ticket, or the next ``count`` most urgent ones"""
+    ticket_id = request.POST.get('ticket_id')
+    if ticket_id:
+        ticket = get_object_or_404(SupportTicket, ticket_id=ticket_id)
+        claimed = [ticket] if triage.claim_ticket(ticket, request.user) else []
+    else:
+        try:
+            count = max(1, min(int(request.POST.get('count', 1)), 20))
+        except ValueError:
+            count = 1
+        claimed = triage.claim_next(request.user, count)
+    
+    if not request.accepts('text/html'):
+        return JsonResponse({'claimed': [ticket.ticket_id for ticket in claimed]}, status=200 if claimed else 409)
+    
+    if claimed:
+        messages.success(request, f'Claimed {", ".join("#" + ticket.ticket_id for ticket in claimed)}.')
+    elif ticket_id:
+        messages.warning(request, f'Ticket #{ticket_id} was already claimed.')
+    else:
+        messages.info(request, 'There are no unclaimed tickets.')
+    return redirect('support:triage')
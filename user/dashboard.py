@@ -0,0 +1,92 @@
+"""
+The numbers on a user's dashboard.
+
+Each domain is read with a single aggregate query: the user's posts, their
+support tickets (with unread staff responses counted by a subquery per
+ticket) and their recovery progress row. The result is cached per user and
+day for ``DASHBOARD_CACHE_TIMEOUT`` seconds.
+
+The user's own writes (posts, comments on their posts, tickets, responses,
+check-ins and goals) delete the entry through the receivers in
+``user.signals``; views and likes, which other people generate in bulk,
+catch up when it expires.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from blog.models import BlogPost
+from core import tracking
+from core.models import RecoveryProgress
+from support.models import SupportTicket, TicketResponse
+from support.triage import ACTIVE_STATUSES
+
+CACHE_PREFIX = 'dashboard:'
+
+
+def cache_timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def cache_key(user_id, today=None):
+    # Days sober move on at midnight
+    return f'{CACHE_PREFIX}{user_id}:{(today or timezone.localdate()).isoformat()}'
+
+
+def post_stats(user_id):
+    return BlogPost.objects.filter(author_id=user_id).aggregate(
+        total=Count('pk'),
+        published=Count('pk', filter=Q(status='published')),
+        drafts=Count('pk', filter=Q(status='draft')),
+        views=Coalesce(Sum('views_count'), 0),
+        likes=Coalesce(Sum('likes_count'), 0),
+        comments=Coalesce(Sum('comments_count'), 0),
+    )
+
+
+def ticket_stats(user_id):
+    unread = (
+        TicketResponse.objects.filter(
+            ticket=OuterRef('pk'),
+            is_staff_response=True,
+            created_at__gt=OuterRef('owner_seen_at'),
+        )
+        .order_by()
+        .values('ticket')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return SupportTicket.objects.filter(user_id=user_id).annotate(
+        unread=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)),
+    ).aggregate(
+        total=Count('pk'),
+        open=Count('pk', filter=Q(status__in=ACTIVE_STATUSES)),
+        unread_responses=Coalesce(Sum('unread'), 0),
+        with_unread=Count('pk', filter=Q(unread__gt=0)),
+    )
+
+
+def recovery_stats(user_id, today):
+    progress = RecoveryProgress.objects.filter(user_id=user_id).first() or RecoveryProgress(user_id=user_id)
+    return tracking.streak_summary(progress, today)
+
+
+def get_dashboard(user):
+    """Return the user's dashboard numbers, from the cache when possible"""
+    today = timezone.localdate()
+    key = cache_key(user.pk, today)
+    data = cache.get(key)
+    if data is None:
+        data = {
+            'posts': post_stats(user.pk),
+            'tickets': ticket_stats(user.pk),
+            'recovery': recovery_stats(user.pk, today),
+        }
+        cache.set(key, data, cache_timeout())
+    return data
+
+
+def invalidate(user_id):
+    cache.delete(cache_key(user_id))
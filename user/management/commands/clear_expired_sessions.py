@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.sessions import clear_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions in batches; schedule it (e.g. hourly from cron) or run it with --every'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions deleted per statement')
+        parser.add_argument('--every', type=float, default=0, help='Keep running every this many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = clear_expired_sessions(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions'))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
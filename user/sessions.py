@@ -0,0 +1,75 @@
+"""
+Sessions and the signed-in user.
+
+``SESSION_ENGINE`` is ``cached_db`` (sessions read from the cache, written
+through to ``django_session``) or ``signed_cookies`` (nothing stored on the
+server). Messages travel in their own cookie, so showing one doesn't write
+the session, and pages for visitors without a session cookie never touch it.
+
+``get_cached_user`` is ``auth.get_user`` with the user row cached by id for
+``AUTH_USER_CACHE_TIMEOUT`` seconds. A cached user is only used while its
+session auth hash still matches the session's, and ``user.signals`` drops
+it whenever the user is saved, so password changes, deactivation and
+profile edits take effect on the next request.
+"""
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+USER_CACHE_PREFIX = 'auth-user:'
+
+
+def user_cache_key(user_id):
+    return f'{USER_CACHE_PREFIX}{user_id}'
+
+
+def get_cached_user(request):
+    """The request's user, from the cache when the session still vouches for it"""
+    session = request.session
+    try:
+        user_id = session[SESSION_KEY]
+        backend_path = session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+
+    session_hash = session.get(HASH_SESSION_KEY)
+    if backend_path in settings.AUTHENTICATION_BACKENDS and session_hash:
+        user = cache.get(user_cache_key(user_id))
+        if user is not None and constant_time_compare(session_hash, user.get_session_auth_hash()):
+            user.backend = backend_path
+            return user
+
+    # Loads and verifies the user, flushing the session if it's stale
+    user = get_user(request)
+    if user.is_authenticated:
+        cache.set(user_cache_key(user.pk), user, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300))
+    return user
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def clear_expired_sessions(batch_size=1000):
+    """Delete expired stored sessions a batch at a time and return how many went.
+
+    Small batches keep each delete's write lock short; ``clearsessions``
+    deletes them all in one statement.
+    """
+    engine = import_module(settings.SESSION_ENGINE)
+    if not hasattr(engine.SessionStore, 'get_model_class'):
+        # Cookie sessions expire on their own
+        return 0
+    model = engine.SessionStore.get_model_class()
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(model.objects.filter(expire_date__lt=now).values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += model.objects.filter(pk__in=keys).delete()[0]
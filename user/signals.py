@@ -0,0 +1,46 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from blog.models import BlogPost, Comment
+from core.models import RecoveryProgress
+from support.models import SupportTicket, TicketResponse
+
+from . import dashboard, sessions
+from .models import CustomUser
+
+
+@receiver(post_save, sender=BlogPost)
+@receiver(post_delete, sender=BlogPost)
+@receiver(post_save, sender=SupportTicket)
+@receiver(post_delete, sender=SupportTicket)
+@receiver(post_save, sender=RecoveryProgress)
+def invalidate_own_dashboard(sender, instance, **kwargs):
+    owner_id = instance.author_id if sender is BlogPost else instance.user_id
+    dashboard.invalidate(owner_id)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post_author_dashboard(sender, instance, **kwargs):
+    try:
+        dashboard.invalidate(instance.post.author_id)
+    except ObjectDoesNotExist:
+        # Deleted along with its post
+        pass
+
+
+@receiver(post_save, sender=TicketResponse)
+@receiver(post_delete, sender=TicketResponse)
+def invalidate_ticket_owner_dashboard(sender, instance, **kwargs):
+    try:
+        dashboard.invalidate(instance.ticket.user_id)
+    except ObjectDoesNotExist:
+        # Deleted along with its ticket
+        pass
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_cached_user(sender, instance, **kwargs):
+    sessions.forget_user(instance.pk)
@@ -1,3 +1,148 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import BlogPost, Category, Comment
+from core import tracking
+from support.models import SupportTicket, TicketResponse
+
+User = get_user_model()
+
+# Session, user, then one query each for posts, tickets and recovery progress
+DASHBOARD_QUERY_BUDGET = 5
+# The session and user come from the cache after the first request
+DASHBOARD_QUERIES = 3
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('member@example.com')
+        self.staff = User.objects.create_user('staff@example.com', is_staff=True)
+        self.category = Category.objects.create(name='Recovery')
+        self.client.force_login(self.user)
+
+    def add_activity(self, count):
+        today = timezone.localdate()
+        start = BlogPost.objects.count()
+        for i in range(start, start + count):
+            post = BlogPost.objects.create(
+                author=self.user, category=self.category, title=f'Post {i}', slug=f'post-{i}',
+                excerpt='Excerpt', content='<p>Body</p>', status='published' if i % 2 else 'draft',
+            )
+            Comment.objects.create(post=post, author=self.staff, content='Nice')
+            ticket = SupportTicket.objects.create(user=self.user, subject=f'Ticket {i}', description='Help')
+            TicketResponse.objects.create(ticket=ticket, user=self.staff, message='On it')
+            tracking.save_entry(self.user, today - timedelta(days=i), mood=3, cravings=2)
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_budget(self):
+        self.add_activity(2)
+        _, cold = self.get_dashboard()
+        self.assertLessEqual(cold, DASHBOARD_QUERY_BUDGET)
+        _, warm = self.get_dashboard()
+        self.assertEqual(warm, 0)
+
+        self.add_activity(20)
+        response, queries = self.get_dashboard()
+        self.assertEqual(queries, DASHBOARD_QUERIES)
+        self.assertEqual(response.context['posts']['total'], 22)
+        self.assertEqual(response.context['posts']['comments'], 22)
+        self.assertEqual(response.context['tickets']['open'], 22)
+        self.assertEqual(response.context['recovery']['days_sober'], 22)
+
+    def test_unread_staff_responses_and_invalidation(self):
+        ticket = SupportTicket.objects.create(user=self.user, subject='Login issue', description='Help')
+        response, _ = self.get_dashboard()
+        self.assertEqual(response.context['tickets']['unread_responses'], 0)
+
+        TicketResponse.objects.create(ticket=ticket, user=self.staff, message='Try again now')
+        TicketResponse.objects.create(ticket=ticket, user=self.staff, message='Any luck?')
+        response, _ = self.get_dashboard()
+        self.assertEqual(response.context['tickets']['unread_responses'], 2)
+        self.assertContains(response, '2 new replies')
+
+        self.client.get(reverse('support:ticket_detail', args=[ticket.ticket_id]))
+        response, _ = self.get_dashboard()
+        self.assertEqual((response.context['tickets']['unread_responses'], response.context['tickets']['with_unread']), (0, 0))
+
+        tracking.save_entry(self.user, timezone.localdate(), mood=2, cravings=3)
+        response, _ = self.get_dashboard()
+        self.assertEqual(response.context['recovery']['checkins'], 1)
+
+
+    def test_replying_keeps_responses_read(self):
+        ticket = SupportTicket.objects.create(user=self.user, subject='Login issue', description='Help')
+        TicketResponse.objects.create(ticket=ticket, user=self.staff, message='Can you try again?')
+        SupportTicket.objects.filter(pk=ticket.pk).update(status='waiting_for_customer')
+
+        # Viewing and replying in one request, from the ticket page's form
+        self.client.post(
+            reverse('support:ticket_detail', args=[ticket.ticket_id]),
+            {'submit_response': '1', 'message': 'Still failing'},
+        )
+        response, _ = self.get_dashboard()
+        self.assertEqual((response.context['tickets']['unread_responses'], response.context['tickets']['with_unread']), (0, 0))
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.status, 'open')
+
+class SessionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('member@example.com', password='old-password')
+        self.client.force_login(self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in queries]
+
+    def test_user_is_cached_until_saved(self):
+        self.get(reverse('profile'))
+        response, queries = self.get(reverse('profile'))
+        self.assertEqual(response.context['user'], self.user)
+        self.assertFalse([sql for sql in queries if 'FROM "user_customuser"' in sql or 'django_session' in sql])
+
+        self.user.set_password('new-password')
+        self.user.save()
+        response, _ = self.get(reverse('profile'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('profile')}")
+
+    def test_messages_do_not_write_the_session(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('profile'), {'full_name': 'Member'})
+        self.assertRedirects(response, reverse('profile'))
+        self.assertIn('messages', response.cookies)
+        self.assertFalse([query for query in queries if 'django_session' in query['sql']])
+
+    def test_anonymous_pages_skip_the_session(self):
+        self.client.logout()
+        self.client.cookies.clear()
+        response, queries = self.get(reverse('blog:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([sql for sql in queries if 'FROM "user_customuser"' in sql or 'django_session' in sql])
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_clear_expired_sessions_in_batches(self):
+        expired = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create(
+            Session(session_key=f'expired{i}', session_data='', expire_date=expired) for i in range(5)
+        )
+        out = StringIO()
+        call_command('clear_expired_sessions', '--batch-size', '2', stdout=out)
+        self.assertIn('Deleted 5 expired sessions', out.getvalue())
+        self.assertFalse(Session.objects.filter(expire_date__lt=timezone.now()).exists())
@@ -3,6 +3,7 @@ from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView
+from . import dashboard
 from .forms import CustomUserCreationForm, UserProfileForm, CustomAuthenticationForm
 
 User = get_user_model()
@@ -49,9 +50,7 @@ def profile_view(request):
 
 @login_required
 def dashboard_view(request):
-    context = {
-        'user': request.user
-    }
+    context = dashboard.get_dashboard(request.user)
     return render(request, 'pages/dashboard.html', context)
 
 def logout_view(request):